@@ -109,6 +109,8 @@ def get_optional_dependencies() -> Dict[str, List[str]]:
         framework: registered_cfg[framework].dependencies
         for framework in registered_cfg.keys()
     }
+    with open("requirements/compression.txt", "r") as f:
+        optional_dependencies['compression'] = [line.strip() for line in f.readlines()]
 
     return optional_dependencies
 
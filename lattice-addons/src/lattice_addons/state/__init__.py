@@ -17,9 +17,11 @@ from .ckpt_manager import LocalCheckpoint, RemoteCheckpoint, S3Checkpoint  # noq
 # Checkpoint manager
 from .ckpt_manager import (  # noqa: F401
     BaseCheckpointManager, BaseCheckpointCollectionManager,
-    LocalCheckpointManager, LocalCheckpointCollectionManager,
+    LocalCheckpointManager, LocalCheckpointCollectionManager, ShardedLocalCheckpointCollectionManager,
+    CASLocalCheckpointCollectionManager,
     RemoteCheckpointManager, RemoteCheckpointCollectionManager,
     S3CheckpointManager, S3CheckpointCollectionManager,
+    PeerCheckpointCollectionManager, TieredCheckpointCollectionManager,
     CheckpointSetting, CheckpointCollectionSetting
 )
 
@@ -28,10 +30,13 @@ from .ckpt_manager import (
     local_checkpoint_saver, local_checkpoint_loader, local_checkpoint_deleter, # noqa: F401
     remote_checkpoint_saver, remote_checkpoint_loader,
     s3_checkpoint_saver, s3_checkpoint_loader,
+    committed_path, checkpoint_configs,
 )
+from .compression import compressing_writer, decompressing_reader, open_checkpoint  # noqa: F401
 
 # Constants
-from .constants import CHECKPOINT_CONFIG, CHECKPOINT_TYPE  # noqa: F401
+from .constants import CHECKPOINT_CONFIG, CHECKPOINT_TYPE, CONFIG_INCREMENTAL, CONFIG_MMAP  # noqa: F401
+from .constants import CONFIG_COMPRESSION, CONFIG_COMPRESSION_LEVEL, CONFIG_COMPRESSION_THREADS  # noqa: F401
 
 # Sevices
 from .util import S3CheckpointHelper  # noqa: F401
\ No newline at end of file
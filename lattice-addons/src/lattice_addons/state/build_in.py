@@ -9,13 +9,17 @@ from .ckpt_manager import (
 from .distributed.utils import (
     RequestType,
     CheckpointMessage,
+    CheckpointStream,
+    Connection,
+    request,
 )
 from .util import S3CheckpointHelper
+from .compression import compressing_writer, decompressing_reader, open_checkpoint
 
 import os
+import shutil
 import dill
 import io
-import zmq
 
 
 # Picklable
@@ -71,14 +75,14 @@ class PicklableWrapper(Picklable):
 
 @local_checkpoint_saver(type=io.TextIOWrapper)
 def save_file_to_local(obj: io.TextIOWrapper, path: str) -> None:
-    with open(path, 'wb') as f:
+    with open_checkpoint(path, 'wb') as f:
         st_mode = os.fstat(obj.fileno()).st_mode
         dill.dump((obj, st_mode), f, fmode=dill.FILE_FMODE)
 
 
 @local_checkpoint_loader(type=io.TextIOWrapper)
 def load_file_from_local(path: str) -> io.TextIOWrapper:
-    with open(path, 'rb') as f:
+    with open_checkpoint(path, 'rb') as f:
         (obj, st_mode) = dill.load(f)
         os.chmod(obj.name, st_mode)
 
@@ -89,13 +93,13 @@ def load_file_from_local(path: str) -> io.TextIOWrapper:
 # programatically
 @local_checkpoint_saver(type=bool)
 def save_bool_to_local(obj: bool, path: str) -> None:
-    with open(path, 'wb') as f:
+    with open_checkpoint(path, 'wb') as f:
         dill.dump(obj, f)
 
 
 @local_checkpoint_loader(type=bool)
 def load_bool_from_local(path: str) -> bool:
-    with open(path, 'rb') as f:
+    with open_checkpoint(path, 'rb') as f:
         obj = dill.load(f)
 
     return obj
@@ -103,13 +107,13 @@ def load_bool_from_local(path: str) -> bool:
 
 @local_checkpoint_saver(type=int)
 def save_int_to_local(obj: int, path: str) -> None:
-    with open(path, 'wb') as f:
+    with open_checkpoint(path, 'wb') as f:
         dill.dump(obj, f)
 
 
 @local_checkpoint_loader(type=int)
 def load_int_from_local(path: str) -> int:
-    with open(path, 'rb') as f:
+    with open_checkpoint(path, 'rb') as f:
         obj = dill.load(f)
 
     return obj
@@ -117,13 +121,13 @@ def load_int_from_local(path: str) -> int:
 
 @local_checkpoint_saver(type=float)
 def save_float_to_local(obj: float, path: str) -> None:
-    with open(path, 'wb') as f:
+    with open_checkpoint(path, 'wb') as f:
         dill.dump(obj, f)
 
 
 @local_checkpoint_loader(type=float)
 def load_float_from_local(path: str) -> float:
-    with open(path, 'rb') as f:
+    with open_checkpoint(path, 'rb') as f:
         obj = dill.load(f)
 
     return obj
@@ -131,13 +135,13 @@ def load_float_from_local(path: str) -> float:
 
 @local_checkpoint_saver(type=str)
 def save_str_to_local(obj: str, path: str) -> None:
-    with open(path, 'wb') as f:
+    with open_checkpoint(path, 'wb') as f:
         dill.dump(obj, f)
 
 
 @local_checkpoint_loader(type=str)
 def load_str_from_local(path: str) -> str:
-    with open(path, 'rb') as f:
+    with open_checkpoint(path, 'rb') as f:
         obj = dill.load(f)
 
     return obj
@@ -145,13 +149,13 @@ def load_str_from_local(path: str) -> str:
 
 @local_checkpoint_saver(type=tuple)
 def save_tuple_to_local(obj: tuple, path: str) -> None:
-    with open(path, 'wb') as f:
+    with open_checkpoint(path, 'wb') as f:
         dill.dump(obj, f)
 
 
 @local_checkpoint_loader(type=tuple)
 def load_tuple_from_local(path: str) -> tuple:
-    with open(path, 'rb') as f:
+    with open_checkpoint(path, 'rb') as f:
         obj = dill.load(f)
 
     return obj
@@ -159,13 +163,13 @@ def load_tuple_from_local(path: str) -> tuple:
 
 @local_checkpoint_saver(type=list)
 def save_list_to_local(obj: list, path: str) -> None:
-    with open(path, 'wb') as f:
+    with open_checkpoint(path, 'wb') as f:
         dill.dump(obj, f)
 
 
 @local_checkpoint_loader(type=list)
 def load_list_from_local(path: str) -> list:
-    with open(path, 'rb') as f:
+    with open_checkpoint(path, 'rb') as f:
         obj = dill.load(f)
 
     return obj
@@ -173,62 +177,59 @@ def load_list_from_local(path: str) -> list:
 
 @local_checkpoint_saver(type=Picklable)
 def save_picklable_to_local(obj: Picklable, path: str) -> None:
-    with open(path, 'wb') as f:
+    with open_checkpoint(path, 'wb') as f:
         dill.dump(obj, f)
 
 
 @local_checkpoint_loader(type=Picklable)
 def load_picklable_from_local(path: str) -> Picklable:
-    with open(path, 'rb') as f:
+    with open_checkpoint(path, 'rb') as f:
         obj = dill.load(f)
     return obj
 
 
 @local_checkpoint_deleter
 def delete_local(path: str) -> None:
-    Path(path).unlink()
+    # Some handlers save a checkpoint as a directory
+    if Path(path).is_dir():
+        shutil.rmtree(path)
+    else:
+        Path(path).unlink()
 
 
 @remote_checkpoint_saver(type=Picklable)
-def send_to_checkpoint_service(obj: Picklable, socket: zmq.Socket, job_id: str, uid: str, key: str):
-    with io.BytesIO() as buffer:
-        dill.dump(obj, buffer)
-        msg = CheckpointMessage(RequestType.SAVE, job_id=job_id, uid=uid, ckpt_name=key, body=buffer.getvalue())
-        socket.send(msg.encode_message())
-        socket.recv()
+def send_to_checkpoint_service(obj: Picklable, socket: Connection, job_id: str, uid: str, key: str):
+    with CheckpointStream.open_writer(socket, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with compressing_writer(stream) as f:
+            dill.dump(obj, f)
 
 
 @remote_checkpoint_loader(type=Picklable)
-def recv_checkpoint_from_service(socket: zmq.Socket, job_id: str, uid: str, key: str) -> Picklable:
-    msg = CheckpointMessage(RequestType.LOAD, job_id=job_id, uid=uid, ckpt_name=key, body=b'')
-    socket.send(msg.encode_message())
-    response = socket.recv()
-    ckpt_response = CheckpointMessage.parse_message(response)
-
-    obj = dill.loads(ckpt_response.body)
+def recv_checkpoint_from_service(socket: Connection, job_id: str, uid: str, key: str) -> Picklable:
+    with CheckpointStream.open_reader(socket, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with decompressing_reader(stream) as f:
+            obj = dill.load(f)
     return obj
 
 
 @remote_checkpoint_deleter
-def delete_remote_checkpoint(socket: zmq.Socket, job_id: str, uid: str, key: str) -> None:
+def delete_remote_checkpoint(socket: Connection, job_id: str, uid: str, key: str) -> None:
     msg = CheckpointMessage(RequestType.DEL, job_id=job_id, uid=uid, ckpt_name=key, body=b'')
-    socket.send(msg.encode_message())
-    socket.recv()
+    request(socket, msg)
 
 
 @s3_checkpoint_saver(type=Picklable)
 def send_Picklable_checkpoint_to_s3(obj: Picklable, bucket_name: str, job_id: str, uid: str, key: str):
-    with io.BytesIO() as buffer:
-        dill.dump(obj, buffer)
-        S3CheckpointHelper.save(bucket_name=bucket_name, job_id=job_id, uid=uid,
-                                ckpt_name=key, checkpoint_data=buffer.getvalue())
+    with S3CheckpointHelper.open_writer(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with compressing_writer(stream) as f:
+            dill.dump(obj, f)
 
 
 @s3_checkpoint_loader(type=Picklable)
 def recv_Picklable_checkpoint_from_s3(bucket_name: str, job_id: str, uid: str, key: str) -> Picklable:
-    ckpt_response = S3CheckpointHelper.load(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key)
-
-    obj = dill.loads(ckpt_response)
+    with S3CheckpointHelper.open_reader(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with decompressing_reader(stream) as f:
+            obj = dill.load(f)
     return obj
 
 
@@ -239,15 +240,14 @@ def delete_s3_checkpoint(bucket_name: str, job_id: str, uid: str, key: str) -> N
 
 @s3_checkpoint_saver(type=int)
 def send_int_checkpoint_to_s3(obj: int, bucket_name: str, job_id: str, uid: str, key: str):
-    with io.BytesIO() as buffer:
-        dill.dump(obj, buffer)
-        S3CheckpointHelper.save(bucket_name=bucket_name, job_id=job_id, uid=uid,
-                                ckpt_name=key, checkpoint_data=buffer.getvalue())
+    with S3CheckpointHelper.open_writer(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with compressing_writer(stream) as f:
+            dill.dump(obj, f)
 
 
 @s3_checkpoint_loader(type=int)
 def recv_int_checkpoint_from_s3(bucket_name: str, job_id: str, uid: str, key: str) -> int:
-    ckpt_response = S3CheckpointHelper.load(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key)
-
-    obj = dill.loads(ckpt_response)
+    with S3CheckpointHelper.open_reader(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with decompressing_reader(stream) as f:
+            obj = dill.load(f)
     return obj
@@ -1,24 +1,49 @@
 from .util import _Singleton
 from .distributed.utils import (
     RequestType,
-    CheckpointMessage
+    CheckpointClient,
+    CheckpointMessage,
+    CheckpointStream,
+    Connection,
+    request,
 )
+from .distributed.ring import HashRing
 from .util import S3CheckpointHelper
-from .constants import CHECKPOINT_TYPE, CHECKPOINT_CONFIG
+from .constants import (
+    CHECKPOINT_TYPE, CHECKPOINT_CONFIG, CONFIG_MAX_INFLIGHT_SAVES, CONFIG_KEEP_LAST, CONFIG_KEEP_EVERY,
+    CONFIG_IO_WORKERS, CONFIG_SHARD_COMMIT_TIMEOUT, CONFIG_SWEEP_GRACE_PERIOD, CONFIG_INCREMENTAL, CONFIG_MMAP,
+    CONFIG_COMPRESSION, CONFIG_COMPRESSION_LEVEL, CONFIG_COMPRESSION_THREADS, CONFIG_S3_PART_SIZE,
+    CONFIG_S3_MAX_CONCURRENCY, CONFIG_S3_PART_RETRIES, CONFIG_DURABLE_ROOT, CONFIG_PEERS, CONFIG_PEER_REPLICAS,
+    CONFIG_PEER_TIMEOUT, CONFIG_STREAM_CHUNK_SIZE, CONFIG_STREAM_CREDIT, CONFIG_CKPT_SERVICE_REPLICAS,
+    CONFIG_CKPT_SERVICE_LEASE_TTL, CONFIG_CKPT_SERVICE_TIMEOUT, CONFIG_CKPT_SERVICE_KEEP_LAST,
+    CONFIG_CKPT_SERVICE_JOB_QUOTA_BYTES, CONFIG_CKPT_SERVICE_JOB_TTL
+)
 from ..log import get_logger
 
 import os
 import re
 import abc
+import platform
+import json
+import hashlib
+import queue
+import shutil
 import tempfile
+import threading
+import time
 import collections
 import uuid
+import weakref
+import zlib
 import zmq
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 from filelock import FileLock
 from urllib.parse import urlparse
 
-from typing import Any, Callable, Dict, Tuple, List, Iterator, Union, Type, Optional, TypeVar
+from typing import Any, Callable, Dict, Tuple, List, Iterator, Union, Set, Type, Optional, TypeVar
 
 logger = get_logger(__name__)
 
@@ -115,27 +140,15 @@ class RemoteCheckpoint(Checkpoint):
         self.uid = uid
         self.key_name = f'{key_name}.{ty.__name__}'
 
-    def exists(self, socket: zmq.Socket) -> bool:
+    def exists(self, socket: Connection) -> bool:
         r""" Check whether the checkpoint exists in the remote storage
 
         :return: `True` if key exists, `False` otherwise
         """
-        msg = CheckpointMessage(RequestType.LIST, job_id=self.job_id, uid='', ckpt_name='', body=b'')
-        socket.send(msg.encode_message())
-
-        response = socket.recv()
-        ckpt_response = CheckpointMessage.parse_message(response)
-        ckpt_list_from_server = ckpt_response.body
-
-        # No checkpoints found at all
-        if not ckpt_list_from_server:
-            return False
-
-        try:
-            key_set = ckpt_list_from_server[self.uid]
-            return self.key_name in key_set
-        except KeyError:
-            return False
+        msg = CheckpointMessage(RequestType.EXISTS, job_id=self.job_id, uid=self.uid, ckpt_name=self.key_name,
+                                body=b'')
+        ckpt_response = request(socket, msg)
+        return ckpt_response.req_type == RequestType.EXISTS and ckpt_response.body is True
 
     def __str__(self) -> str:
         return f'{super().__str__()}(key={self.uid}/{self.key_name})'
@@ -296,7 +309,7 @@ class LocalCheckpointDeleter(_CheckpointDeleter):
 class RemoteCheckpointSaver(_CheckpointSaver):
 
     @classmethod
-    def register_handler(cls, t: Type[T], fn: Callable[[T, zmq.Socket, str, str, str], RemoteCheckpoint]) -> None:
+    def register_handler(cls, t: Type[T], fn: Callable[[T, Connection, str, str, str], RemoteCheckpoint]) -> None:
         super()._register(fn, t)
 
     @classmethod
@@ -307,7 +320,7 @@ class RemoteCheckpointSaver(_CheckpointSaver):
 class RemoteCheckpointLoader(_CheckpointLoader):
 
     @classmethod
-    def register_handler(cls, t: Type[T], fn: Callable[[RemoteCheckpoint, zmq.Socket], T]) -> None:
+    def register_handler(cls, t: Type[T], fn: Callable[[RemoteCheckpoint, Connection], T]) -> None:
         super()._register(fn, t)
 
     @classmethod
@@ -318,7 +331,7 @@ class RemoteCheckpointLoader(_CheckpointLoader):
 class RemoteCheckpointDeleter(_CheckpointDeleter):
 
     @classmethod
-    def register_handler(cls, fn: Callable[[RemoteCheckpoint, zmq.Socket], None]) -> None:
+    def register_handler(cls, fn: Callable[[RemoteCheckpoint, Connection], None]) -> None:
         super()._register(fn)
 
     @classmethod
@@ -428,12 +441,12 @@ def remote_checkpoint_saver(type: Type[T]):
     .. code-block:: python
 
         @remote_checkpoint_saver(type=T)
-        def handler(obj: T, socket: zmq.Socket, job_id: str, uid: str, key: str) -> None:
+        def handler(obj: T, socket: Connection, job_id: str, uid: str, key: str) -> None:
             ...
     """
-    def inner(func: Callable[[T, zmq.Socket, str, str, str], None]) -> \
-            Callable[[T, zmq.Socket, str, str, str], RemoteCheckpoint]:
-        def wrapper(obj: T, socket: zmq.Socket, job_id: str, uid: str, key: str):
+    def inner(func: Callable[[T, Connection, str, str, str], None]) -> \
+            Callable[[T, Connection, str, str, str], RemoteCheckpoint]:
+        def wrapper(obj: T, socket: Connection, job_id: str, uid: str, key: str):
             ckpt = RemoteCheckpoint(obj, job_id=job_id, uid=uid, key_name=key)
             func(obj, socket, job_id, uid, ckpt.key_name)
 
@@ -453,11 +466,11 @@ def remote_checkpoint_loader(type: Type[T]):
     .. code-block:: python
 
         @remote_checkpoint_loader(type=T)
-        def handler(socket: zmq.Socket, job_id: str, uid: str, key: str) -> T:
+        def handler(socket: Connection, job_id: str, uid: str, key: str) -> T:
             ...
     """
-    def inner(func: Callable[[zmq.Socket, str, str, str], T]) -> Callable[[RemoteCheckpoint, zmq.Socket], T]:
-        def wrapper(ckpt: RemoteCheckpoint, socket: zmq.Socket) -> T:
+    def inner(func: Callable[[Connection, str, str, str], T]) -> Callable[[RemoteCheckpoint, Connection], T]:
+        def wrapper(ckpt: RemoteCheckpoint, socket: Connection) -> T:
             obj = func(socket, ckpt.job_id, ckpt.uid, ckpt.key_name)
             return obj
 
@@ -467,7 +480,7 @@ def remote_checkpoint_loader(type: Type[T]):
     return inner
 
 
-def remote_checkpoint_deleter(func: Callable[[zmq.Socket, str, str, str], None]):
+def remote_checkpoint_deleter(func: Callable[[Connection, str, str, str], None]):
     r""" A decorator to register a handler for deleting a remote checkpoint
 
     Example usage:
@@ -475,10 +488,10 @@ def remote_checkpoint_deleter(func: Callable[[zmq.Socket, str, str, str], None])
     .. code-block:: python
 
         @remote_checkpoint_deleter
-        def handler(socket: zmq.Socket, job_id: str, uid: str, key: str) -> None:
+        def handler(socket: Connection, job_id: str, uid: str, key: str) -> None:
             ...
     """
-    def wrapper(ckpt: RemoteCheckpoint, socket: zmq.Socket) -> None:
+    def wrapper(ckpt: RemoteCheckpoint, socket: Connection) -> None:
         func(socket, ckpt.job_id, ckpt.uid, ckpt.key_name)
 
     RemoteCheckpointDeleter.register_handler(wrapper)
@@ -553,6 +566,243 @@ def s3_checkpoint_deleter(func: Callable[[str, str, str, str], None]):
 # Checkpoint manager
 # ------------------
 
+# Optional configs shared by all checkpoint managers
+# Dictionary format: <config name, (parser, default value)>
+_optional_configs: Dict[str, Tuple[Callable[[str], Any], Any]] = {
+    CONFIG_MAX_INFLIGHT_SAVES: (int, 1),
+    CONFIG_KEEP_LAST: (int, 0),
+    CONFIG_KEEP_EVERY: (int, 0),
+    CONFIG_IO_WORKERS: (int, 1),
+    CONFIG_SHARD_COMMIT_TIMEOUT: (float, 300.0),
+    CONFIG_SWEEP_GRACE_PERIOD: (float, 3600.0),
+    CONFIG_INCREMENTAL: (lambda x: x.lower() == 'enabled', False),
+    CONFIG_MMAP: (lambda x: x.lower() == 'enabled', False),
+    CONFIG_COMPRESSION: (lambda x: x.lower(), 'none'),
+    CONFIG_COMPRESSION_LEVEL: (int, 0),
+    CONFIG_COMPRESSION_THREADS: (int, 0),
+    CONFIG_S3_PART_SIZE: (int, 64 * 1024 * 1024),
+    CONFIG_S3_MAX_CONCURRENCY: (int, 4),
+    CONFIG_S3_PART_RETRIES: (int, 3),
+    CONFIG_DURABLE_ROOT: (str, None),
+    CONFIG_PEERS: (str, None),
+    CONFIG_PEER_REPLICAS: (int, 1),
+    CONFIG_PEER_TIMEOUT: (float, 10.0),
+    CONFIG_STREAM_CHUNK_SIZE: (int, 4 * 1024 * 1024),
+    CONFIG_STREAM_CREDIT: (int, 4),
+    CONFIG_CKPT_SERVICE_REPLICAS: (int, 1),
+    CONFIG_CKPT_SERVICE_LEASE_TTL: (float, 30.0),
+    CONFIG_CKPT_SERVICE_TIMEOUT: (float, 60.0),
+    CONFIG_CKPT_SERVICE_KEEP_LAST: (int, None),
+    CONFIG_CKPT_SERVICE_JOB_QUOTA_BYTES: (int, None),
+    CONFIG_CKPT_SERVICE_JOB_TTL: (float, None),
+}
+
+# Eviction policies of the checkpoint service a job sets for itself, by the names the service knows them by
+_CKPT_SERVICE_POLICIES = {
+    CONFIG_CKPT_SERVICE_KEEP_LAST: 'keep_last',
+    CONFIG_CKPT_SERVICE_JOB_QUOTA_BYTES: 'job_quota_bytes',
+    CONFIG_CKPT_SERVICE_JOB_TTL: 'job_ttl',
+}
+
+
+def _parse_optional_configs(configs: Dict[str, str]) -> Dict[str, Any]:
+    r""" Parse the optional configs shared by all checkpoint managers and fill in default values.
+
+    :param configs: Optional configs as strings, usually passed from ``LATTICE_CHECKPOINT_CONFIG``
+    :return: The parsed configs
+
+    :raises TypeError: There is an unknown config
+    :raises ValueError: There is a config with an invalid value
+    """
+
+    unknown = [k for k in configs if k not in _optional_configs]
+    if unknown:
+        raise TypeError(f'Unknown checkpoint configs {unknown}')
+
+    retval = {}
+    for k, (parser, default) in _optional_configs.items():
+        retval[k] = parser(configs[k]) if k in configs else default
+
+    for k in [CONFIG_MAX_INFLIGHT_SAVES, CONFIG_IO_WORKERS, CONFIG_S3_MAX_CONCURRENCY, CONFIG_STREAM_CHUNK_SIZE,
+              CONFIG_STREAM_CREDIT, CONFIG_CKPT_SERVICE_REPLICAS]:
+        if retval[k] < 1:
+            raise ValueError(f'{k} must be a positive integer')
+    for k in [CONFIG_KEEP_LAST, CONFIG_KEEP_EVERY, CONFIG_S3_PART_RETRIES, CONFIG_PEER_REPLICAS]:
+        if retval[k] < 0:
+            raise ValueError(f'{k} must be a non-negative integer')
+    for k in [CONFIG_SWEEP_GRACE_PERIOD, CONFIG_CKPT_SERVICE_LEASE_TTL, CONFIG_CKPT_SERVICE_TIMEOUT]:
+        if retval[k] < 0:
+            raise ValueError(f'{k} must be non-negative')
+    for k in _CKPT_SERVICE_POLICIES:
+        if retval[k] is not None and retval[k] < 0:
+            raise ValueError(f'{k} must be non-negative')
+    # Both write PyTorch states as directories of different layouts
+    if retval[CONFIG_INCREMENTAL] and retval[CONFIG_MMAP]:
+        raise ValueError(f'{CONFIG_INCREMENTAL} and {CONFIG_MMAP} can not be enabled together')
+    if retval[CONFIG_COMPRESSION] not in ['none', 'zstd', 'lz4']:
+        raise ValueError(f'{CONFIG_COMPRESSION} must be one of none, zstd and lz4')
+    # S3 rejects multipart uploads with parts smaller than 5 MiB, except for the last part
+    if retval[CONFIG_S3_PART_SIZE] < 5 * 1024 * 1024:
+        raise ValueError(f'{CONFIG_S3_PART_SIZE} must be at least 5 MiB')
+
+    return retval
+
+
+# The optional configs of the checkpoint manager invoking handlers in the current thread
+_handler_local = threading.local()
+
+
+def checkpoint_configs() -> Dict[str, Any]:
+    r""" Get the optional configs of the checkpoint manager saving or loading in the current thread.
+
+    Handlers read options, e.g. the compression, from the manager invoking them rather than from the process-wide
+    setting, so managers with different configs do not affect each other.
+
+    :return: The parsed configs of the manager, or the default configs if no manager is saving or loading
+    """
+
+    configs = getattr(_handler_local, 'configs', None)
+    return configs if configs is not None else _parse_optional_configs({})
+
+
+@contextmanager
+def _handler_configs(configs: Dict[str, Any]) -> Iterator[None]:
+    previous = getattr(_handler_local, 'configs', None)
+    _handler_local.configs = configs
+    try:
+        yield
+    finally:
+        _handler_local.configs = previous
+
+
+# Local checkpoints are written under a temporary name, i.e. the checkpoint UID with this suffix, and renamed when
+# they are completely written
+_TMP_SUFFIX = '.tmp'
+_TMP_PATTERN = re.compile(rf'(_[0-9]{{6}}){re.escape(_TMP_SUFFIX)}(?=[/.]|$)')
+_MANIFEST_NAME = 'manifest.json'
+
+
+def committed_path(path: str) -> str:
+    r""" Get the path of a local checkpoint after it is committed.
+
+    Local checkpoint managers write checkpoints to temporary paths, and rename them after they are completely written.
+    Handlers remembering where they saved objects, e.g. to share unchanged data with the next checkpoint, should
+    remember the committed paths instead.
+
+    :param path: The path passed to a local checkpoint saver
+    :return: The path of the checkpoint after it is committed
+    """
+
+    return _TMP_PATTERN.sub(r'\1', path)
+
+
+def _walk_files(path: Path) -> List[Path]:
+    # Some handlers save a checkpoint as a directory
+    return sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+
+
+# A file is identified by its device, inode, size and modification time, which the hard links to it share
+_FileKey = Tuple[int, int, int, int]
+
+
+def _checksum(path: Path, known: Optional[Dict[_FileKey, int]] = None,
+              computed: Optional[Dict[_FileKey, int]] = None) -> Dict[str, int]:
+    r""" Compute the size and the checksum of a checkpoint, which is a file or a directory of files.
+
+    The checksum of a directory chains the relative paths and the checksums of its files, so that the files whose
+    checksums are known, e.g. the unchanged blobs an incremental checkpoint hard links from the previous checkpoint,
+    are not read again.
+
+    :param known: The checksums of the files computed before
+    :param computed: Where to record the checksums of the files of this checkpoint
+    """
+
+    size, crc = 0, 0
+    for file in _walk_files(path):
+        st = file.stat()
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        file_crc = None if known is None else known.get(key)
+        if file_crc is None:
+            file_crc = 0
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    file_crc = zlib.crc32(chunk, file_crc)
+        if computed is not None:
+            computed[key] = file_crc
+
+        size += st.st_size
+        if file == path:
+            crc = file_crc
+        else:
+            crc = zlib.crc32(str(file.relative_to(path)).encode(), crc)
+            crc = zlib.crc32(file_crc.to_bytes(4, 'little'), crc)
+
+    return {'size': size, 'crc32': crc}
+
+
+def _remove_path(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def _commit_path(tmp_path: Path, path: Path) -> None:
+    # A checkpoint with the same UID may have been committed by another writer, which is overwritten as if the
+    # checkpoint was written in place
+    if path.is_dir():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+class _CheckpointWorker():
+    r""" Process checkpoints in a background thread, e.g. delete expired checkpoints.
+
+    :param fn: The function to process a checkpoint, which takes the checkpoint and its checkpoint UID
+    :param action: What the function does, for logging
+    """
+
+    def __init__(self, fn: Callable[[Any, str], None], action: str) -> None:
+        # Only keep a weak reference to the bound method, so that the checkpoint manager is freed (and releases its
+        # lock and sockets) as soon as it is no longer used
+        self._fn = weakref.WeakMethod(fn)  # type: ignore[arg-type]
+        self._action = action
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread()
+
+    def _ensure_started(self) -> None:
+        # The worker thread does not survive a fork, so (re)start it lazily
+        if not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            ckpt, ckpt_uid = self._queue.get()
+            try:
+                fn = self._fn()
+                if fn is None:
+                    raise RuntimeError('the checkpoint manager has been freed')
+                fn(ckpt, ckpt_uid)
+                logger.debug(f'{self._action.capitalize()} {ckpt_uid}')
+            except Exception as e:
+                logger.info(f'Unable to {self._action} {ckpt_uid} due to exception: {e}')
+            finally:
+                self._queue.task_done()
+
+    def submit(self, ckpt: Any, ckpt_uid: str) -> None:
+        r""" Queue a checkpoint for processing. """
+
+        self._ensure_started()
+        self._queue.put((ckpt, ckpt_uid))
+
+    def wait(self) -> None:
+        r""" Block until all the queued checkpoints are processed. """
+
+        self._queue.join()
+
+
 class BaseCheckpointManager(abc.ABC):
     r""" An abstract base class for checkpoint managers.
 
@@ -562,7 +812,9 @@ class BaseCheckpointManager(abc.ABC):
     def __init__(self, uid: str) -> None:
         self._uid = uid
         self._ckpt_list: List[Any] = []
+        self._ckpt_counters: List[int] = []
         self._counter: int = 0
+        self._gc = _CheckpointWorker(self._delete_impl, 'delete expired checkpoint')
 
         self._validate()
         self._discover()
@@ -587,13 +839,32 @@ class BaseCheckpointManager(abc.ABC):
     def _load_impl(self, ckpt: Any) -> Any:
         pass
 
+    @abc.abstractmethod
+    def _delete_impl(self, ckpt: Any, ckpt_uid: str) -> None:
+        pass
+
     @abc.abstractmethod
     def get_configs(self) -> Dict[str, Any]:
         pass
 
-    def _gen_ckpt_uid(self) -> str:
+    @contextmanager
+    def _configured(self) -> Iterator[None]:
+        r""" Let the handlers invoked by the current thread read the configs of this manager. """
+
+        with _handler_configs(self._configs):
+            yield
+
+    def _call_configured(self, fn: Callable[..., T], *args: Any) -> T:
+        # Threads of pools do not inherit the configs of the thread submitting to them
+        with self._configured():
+            return fn(*args)
+
+    def _format_ckpt_uid(self, counter: int) -> str:
         # Format: <ckpt mgr type>_<ckpt mgr uid>_<counter>
-        retval = f'{self}_{self._counter:06}'
+        return f'{self}_{counter:06}'
+
+    def _gen_ckpt_uid(self) -> str:
+        retval = self._format_ckpt_uid(self._counter)
         self._counter += 1
         return retval
 
@@ -614,6 +885,40 @@ class BaseCheckpointManager(abc.ABC):
         _, counter = name.split('_')
         return int(counter)
 
+    def _append_ckpt(self, counter: int, ckpt: Any) -> None:
+        self._ckpt_list.append(ckpt)
+        self._ckpt_counters.append(counter)
+
+    def _pop_ckpt(self) -> Any:
+        self._ckpt_counters.pop()
+        return self._ckpt_list.pop()
+
+    def _expire_ckpts(self) -> None:
+        # Keep the last `keep_last` checkpoints and every `keep_every`-th checkpoint. Keep all the checkpoints if
+        # `keep_last` is not set.
+        keep_last = self._configs[CONFIG_KEEP_LAST]
+        keep_every = self._configs[CONFIG_KEEP_EVERY]
+        if keep_last <= 0 or len(self._ckpt_list) <= keep_last:
+            return
+
+        ckpt_list: List[Any] = []
+        ckpt_counters: List[int] = []
+        num_candidates = len(self._ckpt_list) - keep_last
+        for i, (counter, ckpt) in enumerate(zip(self._ckpt_counters, self._ckpt_list)):
+            if i < num_candidates and (keep_every <= 0 or counter % keep_every != 0):
+                self._gc.submit(ckpt, self._format_ckpt_uid(counter))
+            else:
+                ckpt_list.append(ckpt)
+                ckpt_counters.append(counter)
+
+        self._ckpt_list = ckpt_list
+        self._ckpt_counters = ckpt_counters
+
+    def wait(self) -> None:
+        r""" Block until all the expired checkpoints are deleted. """
+
+        self._gc.wait()
+
     def list(self) -> Iterator[Checkpoint]:
         r"""
         :return: An iterator of managed checkpoints
@@ -633,8 +938,11 @@ class BaseCheckpointManager(abc.ABC):
         :param obj: The object to save
         """
 
-        ckpt = self._save_impl(obj, self._gen_ckpt_uid())
-        self._ckpt_list.append(ckpt)
+        counter = self._counter
+        with self._configured():
+            ckpt = self._save_impl(obj, self._gen_ckpt_uid())
+        self._append_ckpt(counter, ckpt)
+        self._expire_ckpts()
 
     def load(self) -> Optional[Any]:
         r"""
@@ -649,14 +957,15 @@ class BaseCheckpointManager(abc.ABC):
             try:
                 # Load the most recent checkpoint
                 ckpt = self._ckpt_list[-1]
-                obj = self._load_impl(ckpt)
+                with self._configured():
+                    obj = self._load_impl(ckpt)
 
                 # If succeeds, directly return the object
                 break
 
             except Exception as e:
                 # If load failed, try to load the previous one
-                ckpt = self._ckpt_list.pop()
+                ckpt = self._pop_ckpt()
                 logger.info(f'Unable to load object from checkpoint {ckpt} due to exception: {e}')
 
                 # Until there is no valid checkpoint
@@ -683,9 +992,12 @@ class BaseCheckpointCollectionManager(BaseCheckpointManager):
 
         self.acquired: bool = False
         self._lock: Any = None
+        # The counter of the collection objects are loaded from by key
+        self.pinned: Optional[int] = None
 
     def __del__(self):
-        if self.acquired:
+        # Managers whose configs are invalid raise before this class is initialized
+        if getattr(self, 'acquired', False):
             self._release()
 
     @abc.abstractmethod
@@ -736,6 +1048,76 @@ class BaseCheckpointCollectionManager(BaseCheckpointManager):
 
         return super().load()
 
+    def keys(self) -> Optional[Dict[str, Type]]:
+        r""" List the keys of the most recent checkpoint collection without loading any object.
+
+        :return: The type of the object saved under each key, or `None` if there is no managed checkpoint collections
+        """
+
+        if len(self._ckpt_list) == 0:
+            return None
+
+        return {k: ckpt.kind for k, ckpt in self._ckpt_list[-1].items()}
+
+    def load_keys(self, keys: List[str]) -> Optional[Dict[str, Any]]:
+        r""" Load some objects of the pinned checkpoint collection without loading the other objects.
+
+        The first call pins the most recent collection, whose counter is :attr:`pinned`, and the following calls load
+        from the same collection, so that objects loaded by separate calls come from one collection. If an object can
+        not be loaded, or is missing from the pinned collection but saved in an older one, the pinned collection is
+        dropped, the previous one is pinned, and all the keys are loaded from it. Callers holding objects loaded by
+        earlier calls reload them when :attr:`pinned` changes.
+
+        :param keys: The keys of the objects to load
+        :return: The loaded objects, without the keys saved in no collection, or `None` if there is no managed
+            checkpoint collections
+        """
+
+        while len(self._ckpt_list) > 0:
+            # Collections pinned before may have expired since
+            if self.pinned not in self._ckpt_counters:
+                self.pinned = self._ckpt_counters[-1]
+
+            index = self._ckpt_counters.index(self.pinned)
+            ckpts = self._ckpt_list[index]
+            try:
+                older = [k for k in keys if k not in ckpts and any(k in c for c in self._ckpt_list[:index])]
+                if older:
+                    raise KeyError(f'{older} are only saved in older checkpoints')
+
+                found = {k: ckpts[k] for k in keys if k in ckpts}
+                if not found:
+                    return {}
+                with self._configured():
+                    return self._load_impl(found)
+            except Exception as e:
+                # If load failed, drop the collection for all the keys and pin the previous one
+                del self._ckpt_list[index]
+                del self._ckpt_counters[index]
+                logger.info(f'Unable to load {keys} from checkpoint {ckpts} due to exception: {e}')
+                if index == 0:
+                    break
+                self.pinned = self._ckpt_counters[index - 1]
+
+        self.pinned = None
+        logger.debug(f'Can not find existing checkpoint in {self}')
+        return None
+
+    def _map_keys(self, fn: Callable[[str, Any], T], items: Dict[str, Any]) -> Dict[str, T]:
+        r""" Apply a function to every key of a collection, using a pool of ``io_workers`` threads.
+
+        The function is called with each key and its item. If any call fails, the first exception is raised after all
+        the calls finish, so that the collection is never partially committed.
+        """
+
+        num_workers = min(self._configs[CONFIG_IO_WORKERS], len(items))
+        if num_workers <= 1:
+            return {k: fn(k, item) for k, item in items.items()}
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {k: executor.submit(self._call_configured, fn, k, item) for k, item in items.items()}
+            return {k: future.result() for k, future in futures.items()}
+
     def _parse_discovered_checkpoints(self, discovery_location: str, ckpt_list: Dict[str, List[str]]) -> None:
         valid_ckpt_files: Dict[int, Dict[str, Checkpoint]] = {}
 
@@ -761,8 +1143,8 @@ class BaseCheckpointCollectionManager(BaseCheckpointManager):
                 continue
 
         if valid_ckpt_files:
-            for _, ckpts in sorted(valid_ckpt_files.items()):
-                self._ckpt_list.append(ckpts)
+            for counter, ckpts in sorted(valid_ckpt_files.items()):
+                self._append_ckpt(counter, ckpts)
                 logger.debug(f'Discover existing ckpt {[str(c) for c in ckpts]}')
 
             max_key = max(list(valid_ckpt_files.keys()))
@@ -779,7 +1161,8 @@ class LocalCheckpointManager(BaseCheckpointManager):
                  root: str,
                  atexit_saving: str = 'enabled',
                  periodic_saving: str = 'disabled',
-                 periodic_saving_interval: Optional[str] = None) -> None:
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
         self._root: str = root
         self._atexit_saving: bool = atexit_saving.lower() == 'enabled'
         self._periodic_saving: bool = periodic_saving.lower() == 'enabled'
@@ -788,6 +1171,7 @@ class LocalCheckpointManager(BaseCheckpointManager):
             if not periodic_saving_interval:
                 raise ValueError('periodic_saving_interval must be specified when periodic_saving is enabled')
             self._periodic_saving_interval = float(periodic_saving_interval)
+        self._configs: Dict[str, Any] = _parse_optional_configs(configs)
         self._ckpt_list: List[LocalCheckpoint]
 
         super().__init__(uid)
@@ -797,7 +1181,8 @@ class LocalCheckpointManager(BaseCheckpointManager):
             'root': self._root,
             'atexit_saving': self._atexit_saving,
             'periodic_saving': self._periodic_saving,
-            'periodic_saving_interval': self._periodic_saving_interval
+            'periodic_saving_interval': self._periodic_saving_interval,
+            **self._configs
         }
 
     def _create_checkpoint(self, type_str: str, d: str, file_name: str) -> Checkpoint:
@@ -837,8 +1222,8 @@ class LocalCheckpointManager(BaseCheckpointManager):
                 continue
 
         if valid_ckpt_files:
-            for _, ckpt in sorted(valid_ckpt_files.items()):
-                self._ckpt_list.append(ckpt)
+            for counter, ckpt in sorted(valid_ckpt_files.items()):
+                self._append_ckpt(counter, ckpt)
                 logger.debug(f'Discover existing ckpt {ckpt}')
 
             max_key = max(list(valid_ckpt_files.keys()))
@@ -847,12 +1232,25 @@ class LocalCheckpointManager(BaseCheckpointManager):
             logger.debug(f'Can not discover existing ckpt at {self._root}')
 
     def _save_impl(self, obj: Any, ckpt_uid: str) -> LocalCheckpoint:
-        path = str(Path(self._root) / ckpt_uid)
-        return LocalCheckpointSaver.invoke(obj, path)
+        root = Path(self._root)
+
+        # Remove what a crashed save may have left behind
+        for p in root.glob(f'{ckpt_uid}{_TMP_SUFFIX}.*'):
+            _remove_path(p)
+
+        # Write to a temporary path first, so that a partially written checkpoint is never discovered
+        tmp_ckpt = LocalCheckpointSaver.invoke(obj, str(root / f'{ckpt_uid}{_TMP_SUFFIX}'))
+        for p in root.glob(f'{ckpt_uid}{_TMP_SUFFIX}*'):
+            _commit_path(p, root / f'{ckpt_uid}{p.name[len(ckpt_uid) + len(_TMP_SUFFIX):]}')
+
+        return LocalCheckpoint(tmp_ckpt.kind, str(root / ckpt_uid))
 
     def _load_impl(self, ckpt: LocalCheckpoint) -> Any:
         return LocalCheckpointLoader.invoke(ckpt)
 
+    def _delete_impl(self, ckpt: LocalCheckpoint, ckpt_uid: str) -> None:
+        LocalCheckpointDeleter.invoke(ckpt)
+
 
 class LocalCheckpointCollectionManager(BaseCheckpointCollectionManager):
     r""" Manage local checkpoint collections. """
@@ -862,7 +1260,8 @@ class LocalCheckpointCollectionManager(BaseCheckpointCollectionManager):
                  root: str,
                  atexit_saving: str = 'enabled',
                  periodic_saving: str = 'disabled',
-                 periodic_saving_interval: Optional[str] = None) -> None:
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
         self._root: str = root
         self._atexit_saving: bool = atexit_saving.lower() == 'enabled'
         self._periodic_saving: bool = periodic_saving.lower() == 'enabled'
@@ -871,7 +1270,10 @@ class LocalCheckpointCollectionManager(BaseCheckpointCollectionManager):
             if not periodic_saving_interval:
                 raise ValueError('periodic_saving_interval must be specified when periodic_saving is enabled')
             self._periodic_saving_interval = float(periodic_saving_interval)
+        self._configs: Dict[str, Any] = _parse_optional_configs(configs)
         self._ckpt_list: List[Dict[str, LocalCheckpoint]]
+        # Checksums of the files of the last saved collection, which the next one may hard link
+        self._checksums: Dict[_FileKey, int] = {}
 
         super().__init__(uid)
 
@@ -883,7 +1285,8 @@ class LocalCheckpointCollectionManager(BaseCheckpointCollectionManager):
             'root': self._root,
             'atexit_saving': self._atexit_saving,
             'periodic_saving': self._periodic_saving,
-            'periodic_saving_interval': self._periodic_saving_interval
+            'periodic_saving_interval': self._periodic_saving_interval,
+            **self._configs
         }
 
     def _create_checkpoint(self, type_str: str, d: str, file_name: str) -> LocalCheckpoint:
@@ -911,6 +1314,14 @@ class LocalCheckpointCollectionManager(BaseCheckpointCollectionManager):
                 raise PermissionError(f'Unable to create collection for root path {self._root} due to '
                                       f'insufficient permissions')
 
+    def _read_manifest(self, d: Path) -> Optional[Dict[str, Dict[str, int]]]:
+        try:
+            with open(d / _MANIFEST_NAME, 'r') as f:
+                return json.load(f)['entries']
+        except FileNotFoundError:
+            # Collections written by older versions do not have manifests
+            return None
+
     def _discover(self) -> None:
         root = Path(self._root)
         ckpt_list: Dict[str, List[str]] = collections.defaultdict(lambda: list())
@@ -921,9 +1332,15 @@ class LocalCheckpointCollectionManager(BaseCheckpointCollectionManager):
                 if not d.is_dir():
                     raise Exception("Invalid file type")
 
-                ckpts = []
-                for file in d.iterdir():
-                    ckpts.append(file.name)
+                manifest = self._read_manifest(d)
+                if manifest is not None:
+                    # Only compare sizes, which is cheap. Checksums are verified when loading checkpoints.
+                    for name, desc in manifest.items():
+                        size = sum(f.stat().st_size for f in _walk_files(d / name))
+                        if size != desc['size']:
+                            raise Exception(f'Size of {name} does not match its manifest')
+
+                ckpts = list(manifest) if manifest is not None else [file.name for file in d.iterdir()]
 
                 if not ckpts:
                     raise Exception("Empty directory")
@@ -938,22 +1355,420 @@ class LocalCheckpointCollectionManager(BaseCheckpointCollectionManager):
 
     def _save_impl(self, objs: Dict[str, Any], ckpt_uid: str) -> Dict[str, LocalCheckpoint]:
         root = Path(self._root) / ckpt_uid
-        root.mkdir(parents=True, exist_ok=True)
 
-        retval = {}
-        for k, obj in objs.items():
-            path = str(root / k)
-            retval[k] = LocalCheckpointSaver.invoke(obj, path)
+        # Write to a temporary directory first, so that a partially written collection is never discovered
+        tmp_root = Path(self._root) / f'{ckpt_uid}{_TMP_SUFFIX}'
+        _remove_path(tmp_root)
+        tmp_root.mkdir(parents=True)
 
-        return retval
+        known = self._checksums
+        computed: Dict[_FileKey, int] = {}
+
+        def save(k: str, obj: Any) -> Tuple[LocalCheckpoint, Dict[str, int]]:
+            ckpt = LocalCheckpointSaver.invoke(obj, str(tmp_root / k))
+            return ckpt, _checksum(Path(ckpt.path), known, computed)
+
+        saved = self._map_keys(save, objs)
+
+        # The manifest is written last, and the collection is committed by renaming its directory
+        manifest = {'entries': {Path(ckpt.path).name: desc for ckpt, desc in saved.values()}}
+        with open(tmp_root / _MANIFEST_NAME, 'w') as f:
+            json.dump(manifest, f)
+        _commit_path(tmp_root, root)
+        self._checksums = computed
+
+        return {k: LocalCheckpoint(ckpt.kind, str(root / k)) for k, (ckpt, _) in saved.items()}
 
     def _load_impl(self, ckpts: Dict[str, LocalCheckpoint]) -> Dict[str, Any]:
+        manifests: Dict[Path, Optional[Dict[str, Dict[str, int]]]] = {}
+        for ckpt in ckpts.values():
+            d = Path(ckpt.path).parent
+            if d not in manifests:
+                manifests[d] = self._read_manifest(d)
+
+        def load(_: str, ckpt: LocalCheckpoint) -> Any:
+            path = Path(ckpt.path)
+            manifest = manifests[path.parent]
+            if manifest is None:
+                pass
+            elif self._configs[CONFIG_MMAP]:
+                # Reading whole files for checksums defeats memory-mapping large tensors, so only compare sizes
+                if sum(f.stat().st_size for f in _walk_files(path)) != manifest[path.name]['size']:
+                    raise Exception(f'Size of {ckpt.path} does not match its manifest')
+            # Verify the checksum before spending time on deserialization
+            elif _checksum(path)['crc32'] != manifest[path.name]['crc32']:
+                raise Exception(f'Checksum of {ckpt.path} does not match its manifest')
+            return LocalCheckpointLoader.invoke(ckpt)
+
+        return self._map_keys(load, ckpts)
+
+    def _delete_impl(self, ckpts: Dict[str, LocalCheckpoint], ckpt_uid: str) -> None:
+        for ckpt in ckpts.values():
+            LocalCheckpointDeleter.invoke(ckpt)
+
+        root = Path(self._root) / ckpt_uid
+        (root / _MANIFEST_NAME).unlink(missing_ok=True)
+        root.rmdir()
+
+
+@dataclass
+class _ShardedCheckpoint():
+    r""" Describe where the parts of a state are in a sharded checkpoint collection.
+
+    :param ranks: The ranks holding parts of the state
+    :param parts: The checkpoint of each part, in the same order as ``ranks``
+    :param owners: The owner rank of each entry if the state is split by entries, or `None` if the state is held by a
+        single rank
+    """
+
+    ranks: List[int]
+    parts: List[LocalCheckpoint]
+    owners: Optional[List[int]]
+
+    @property
+    def kind(self) -> Type:
+        return self.parts[0].kind
+
+
+def _estimate_nbytes(obj: Any) -> int:
+    # Tensor-like objects report their sizes, and other objects are counted as one byte
+    if hasattr(obj, 'element_size') and hasattr(obj, 'numel'):
+        return obj.element_size() * obj.numel()
+    return getattr(obj, 'nbytes', 1)
+
+
+class ShardedLocalCheckpointCollectionManager(LocalCheckpointCollectionManager):
+    r""" Manage local checkpoint collections sharded across ranks.
+
+    Instead of a single writer, every rank writes the parts of a collection it owns under
+    ``<ckpt uid>/rank_<rank>/``. Dictionary-based states are split by entries, and other states are owned by a single
+    rank. Entries are assigned to ranks by their sizes, so that every rank writes a similar amount of bytes. Rank 0
+    commits the collection by writing a manifest after all the ranks have written their parts.
+
+    Every rank loads all the parts of a collection, so a collection can be loaded with a different world size. All the
+    ranks are expected to save the same replicated states at the same time, e.g. at exit or after the same step.
+
+    The rank and world size are read from the ``RANK`` and ``WORLD_SIZE`` environment variables.
+    """
+
+    _manifest_name = 'manifest.json'
+    _committed_name = 'committed'
+
+    def __init__(self,
+                 uid: str,
+                 root: str,
+                 atexit_saving: str = 'enabled',
+                 periodic_saving: str = 'disabled',
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
+        self._rank: int = int(os.environ.get('RANK', '0'))
+        self._world_size: int = int(os.environ.get('WORLD_SIZE', '1'))
+
+        super().__init__(uid, root, atexit_saving, periodic_saving, periodic_saving_interval, **configs)
+
+    def _acquire(self) -> None:
+        # Every rank writes its own parts, so there is no need for a write lock
+        pass
+
+    def _release(self) -> None:
+        pass
+
+    def _shard_root(self, root: Path, rank: int) -> Path:
+        return root / f'rank_{rank}'
+
+    def _plan(self, objs: Dict[str, Any]) -> Dict[str, Union[int, List[int]]]:
+        # Greedily assign the largest unassigned item to the least loaded rank. The plan only depends on the states,
+        # so all the ranks agree on it without communication.
+        items = []
+        for k in sorted(objs):
+            obj = objs[k]
+            if isinstance(obj, dict) and len(obj) > 0:
+                items += [(k, i, _estimate_nbytes(v)) for i, v in enumerate(obj.values())]
+            else:
+                items.append((k, -1, _estimate_nbytes(obj)))
+
+        plan: Dict[str, Union[int, List[int]]] = {
+            k: [0] * len(obj) if isinstance(obj, dict) and len(obj) > 0 else 0
+            for k, obj in objs.items()
+        }
+        loads = [0] * self._world_size
+        for k, i, nbytes in sorted(items, key=lambda item: -item[2]):
+            rank = loads.index(min(loads))
+            loads[rank] += nbytes
+
+            owners = plan[k]
+            if isinstance(owners, list):
+                owners[i] = rank
+            else:
+                plan[k] = rank
+
+        return plan
+
+    def _parse_manifest(self, root: Path, manifest: Dict[str, Any]) -> Dict[str, _ShardedCheckpoint]:
         retval = {}
-        for k, ckpt in ckpts.items():
-            retval[k] = LocalCheckpointLoader.invoke(ckpt)
+        for k, desc in manifest['keys'].items():
+            owners = desc['owners']
+            ranks = sorted(set(owners)) if isinstance(owners, list) else [owners]
+            parts = [LocalCheckpoint(desc['type'], str(self._shard_root(root, r) / k)) for r in ranks]
+            retval[k] = _ShardedCheckpoint(ranks, parts, owners if isinstance(owners, list) else None)
+
+        return retval
+
+    def _wait_for_shards(self, root: Path, ranks: List[int]) -> None:
+        deadline = time.time() + self._configs[CONFIG_SHARD_COMMIT_TIMEOUT]
+        for r in ranks:
+            while not (self._shard_root(root, r) / self._committed_name).exists():
+                if time.time() > deadline:
+                    raise TimeoutError(f'Rank {r} did not write its shard of {root.name} in time')
+                time.sleep(0.1)
+
+    def _discover(self) -> None:
+        valid_ckpt_files: Dict[int, Dict[str, _ShardedCheckpoint]] = {}
+
+        root = Path(self._root)
+        for d in root.iterdir():
+            try:
+                ckpt_key = self._match_ckpt_uid(d.name, raise_expt=True)
+
+                # Collections without a manifest are not committed
+                with open(d / self._manifest_name, 'r') as f:
+                    manifest = json.load(f)
+
+                valid_ckpt_files[ckpt_key] = self._parse_manifest(d, manifest)
+            except Exception as e:
+                logger.debug(f'Checkpoint discovery skips {d} due to: {e}')
+                continue
+
+        if valid_ckpt_files:
+            for counter, ckpts in sorted(valid_ckpt_files.items()):
+                self._append_ckpt(counter, ckpts)
+                logger.debug(f'Discover existing ckpt {[str(c) for c in ckpts]}')
+
+            max_key = max(list(valid_ckpt_files.keys()))
+            self._set_ckpt_uid(max_key)
+        else:
+            logger.debug(f'Did not discover any existing ckpt for {self._root}')
+
+    def _save_impl(self,  # type: ignore[override]
+                   objs: Dict[str, Any],
+                   ckpt_uid: str) -> Dict[str, _ShardedCheckpoint]:
+        root = Path(self._root) / ckpt_uid
+        if self._rank == 0:
+            # The collection is not committed again until all the shards are written again
+            (root / self._manifest_name).unlink(missing_ok=True)
+
+        # Parts and the commit marker left by an earlier attempt at the same collection are stale
+        shard_root = self._shard_root(root, self._rank)
+        _remove_path(shard_root)
+        shard_root.mkdir(parents=True)
+
+        plan = self._plan(objs)
+
+        parts = {}
+        for k, owners in plan.items():
+            obj = objs[k]
+            if isinstance(owners, list):
+                part = type(obj)((e, v) for (e, v), r in zip(obj.items(), owners) if r == self._rank)
+                if len(part) > 0:
+                    parts[k] = part
+            elif owners == self._rank:
+                parts[k] = obj
+
+        self._map_keys(lambda k, part: LocalCheckpointSaver.invoke(part, str(shard_root / k)), parts)
+        (shard_root / self._committed_name).touch()
+
+        manifest = {
+            'world_size': self._world_size,
+            'keys': {
+                k: {'type': LocalCheckpointSaver._lookup(objs[k])[1].__name__, 'owners': owners}
+                for k, owners in plan.items()
+            }
+        }
+
+        if self._rank == 0:
+            ranks = set()
+            for owners in plan.values():
+                ranks |= set(owners) if isinstance(owners, list) else {owners}
+            self._wait_for_shards(root, sorted(ranks))
+
+            # Atomically commit the collection
+            tmp_path = root / f'{self._manifest_name}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, root / self._manifest_name)
+
+        return self._parse_manifest(root, manifest)
+
+    def _load_impl(self, ckpts: Dict[str, _ShardedCheckpoint]) -> Dict[str, Any]:  # type: ignore[override]
+        def load(_: str, ckpt: _ShardedCheckpoint) -> Any:
+            parts = {r: LocalCheckpointLoader.invoke(part) for r, part in zip(ckpt.ranks, ckpt.parts)}
+            if ckpt.owners is None:
+                return parts[ckpt.ranks[0]]
+
+            # Reassemble the entries in their original order
+            entries = {r: iter(part.items()) for r, part in parts.items()}
+            return type(parts[ckpt.ranks[0]])(next(entries[r]) for r in ckpt.owners)
+
+        return self._map_keys(load, ckpts)
+
+    def _delete_impl(self, ckpts: Dict[str, _ShardedCheckpoint], ckpt_uid: str) -> None:  # type: ignore[override]
+        # Rank 0 commits collections, so it also deletes them
+        if self._rank != 0:
+            return
+
+        for ckpt in ckpts.values():
+            for part in ckpt.parts:
+                LocalCheckpointDeleter.invoke(part)
+
+        shutil.rmtree(Path(self._root) / ckpt_uid)
+
+
+class CASLocalCheckpointCollectionManager(LocalCheckpointCollectionManager):
+    r""" Manage local checkpoint collections in a content-addressed object store.
+
+    Every saved object is stored once under the hash of its content in ``<root>/objects``, and a collection is a small
+    index mapping keys to object hashes at ``<root>/<ckpt uid>.json``. Identical objects, e.g. unchanged states or
+    counters, are shared by collections without being stored again, and a collection is committed by atomically
+    writing its index.
+
+    Deleting a collection deletes its index, and then the objects that are no longer referenced by any index in the
+    root. Objects modified within the ``sweep_grace_period`` config seconds are kept, since they may belong to
+    collections being saved by other managers sharing the root.
+    """
+
+    _index_suffix = '.json'
+    _objects_name = 'objects'
+    _tmp_name = 'tmp'
+
+    def __init__(self,
+                 uid: str,
+                 root: str,
+                 atexit_saving: str = 'enabled',
+                 periodic_saving: str = 'disabled',
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
+        # Protect objects from being swept between finding them and refreshing their modification times
+        self._cas_lock = threading.Lock()
+
+        super().__init__(uid, root, atexit_saving, periodic_saving, periodic_saving_interval, **configs)
+
+    def _object_base(self, digest: str) -> Path:
+        return Path(self._root) / self._objects_name / digest[:2] / digest
+
+    def _hash(self, path: Path) -> str:
+        h = hashlib.sha256()
+        for file in _walk_files(path):
+            if file != path:
+                h.update(str(file.relative_to(path)).encode())
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+        return h.hexdigest()
+
+    def _parse_index(self, index_path: Path) -> Dict[str, LocalCheckpoint]:
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+
+        return {
+            k: LocalCheckpoint(desc['type'], str(self._object_base(desc['hash'])))
+            for k, desc in index['keys'].items()
+        }
+
+    def _discover(self) -> None:
+        valid_ckpt_files: Dict[int, Dict[str, LocalCheckpoint]] = {}
+
+        root = Path(self._root)
+        for f in root.glob(f'*{self._index_suffix}'):
+            try:
+                ckpt_key = self._match_ckpt_uid(f.name[:-len(self._index_suffix)], raise_expt=True)
+                valid_ckpt_files[ckpt_key] = self._parse_index(f)
+            except Exception as e:
+                logger.debug(f'Checkpoint discovery skips {f} due to: {e}')
+                continue
+
+        if valid_ckpt_files:
+            for counter, ckpts in sorted(valid_ckpt_files.items()):
+                self._append_ckpt(counter, ckpts)
+                logger.debug(f'Discover existing ckpt {[str(c) for c in ckpts]}')
+
+            max_key = max(list(valid_ckpt_files.keys()))
+            self._set_ckpt_uid(max_key)
+        else:
+            logger.debug(f'Did not discover any existing ckpt for {self._root}')
+
+    def _save_impl(self, objs: Dict[str, Any], ckpt_uid: str) -> Dict[str, LocalCheckpoint]:
+        tmp_root = Path(self._root) / self._tmp_name
+        tmp_root.mkdir(parents=True, exist_ok=True)
+
+        def save(_: str, obj: Any) -> LocalCheckpoint:
+            # Serialize to a temporary path first, since the hash is only known afterwards
+            tmp_ckpt = LocalCheckpointSaver.invoke(obj, str(tmp_root / uuid.uuid4().hex))
+            tmp_path = Path(tmp_ckpt.path)
+
+            digest = self._hash(tmp_path)
+            ckpt = LocalCheckpoint(tmp_ckpt.kind, str(self._object_base(digest)))
+            path = Path(ckpt.path)
+            # Objects are serialized and hashed without the lock, which only covers linking them. Until the index is
+            # committed, the grace period keeps them from being swept.
+            with self._cas_lock:
+                exists = path.exists()
+                if exists:
+                    # Refresh the modification time, so that the object is not swept by other managers
+                    os.utime(path)
+                else:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp_path, path)
+            if exists:
+                LocalCheckpointDeleter.invoke(tmp_ckpt)
+            return ckpt
+
+        retval = self._map_keys(save, objs)
+
+        index = {
+            'keys': {
+                k: {'type': ckpt.kind.__name__, 'hash': Path(ckpt.path).name.rsplit('.', 1)[0]}
+                for k, ckpt in retval.items()
+            }
+        }
+
+        # Atomically commit the collection
+        tmp_path = tmp_root / f'{ckpt_uid}{self._index_suffix}'
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, Path(self._root) / f'{ckpt_uid}{self._index_suffix}')
 
         return retval
 
+    def _delete_impl(self, ckpts: Dict[str, LocalCheckpoint], ckpt_uid: str) -> None:
+        (Path(self._root) / f'{ckpt_uid}{self._index_suffix}').unlink()
+        with self._cas_lock:
+            self._sweep()
+
+    def _sweep(self) -> None:
+        root = Path(self._root)
+
+        referenced = set()
+        for f in root.glob(f'*{self._index_suffix}'):
+            try:
+                referenced |= {ckpt.path for ckpt in self._parse_index(f).values()}
+            except Exception as e:
+                # Do not risk deleting objects referenced by an unreadable index
+                logger.info(f'Skip sweeping objects due to unreadable index {f}: {e}')
+                return
+
+        deadline = time.time() - self._configs[CONFIG_SWEEP_GRACE_PERIOD]
+        for d in (root / self._objects_name).glob('*/*'):
+            try:
+                if str(d) in referenced or d.stat().st_mtime > deadline:
+                    continue
+                digest, type_str = Checkpoint.parse(d.name)
+                LocalCheckpointDeleter.invoke(LocalCheckpoint(type_str, str(d.parent / digest)))
+            except FileNotFoundError:
+                # Deleted by another process after it was listed
+                continue
+            except Exception as e:
+                logger.debug(f'Skip sweeping object {d} due to: {e}')
+
 
 class RemoteCheckpointManager(BaseCheckpointManager):
     r""" Manage remote checkpoints. """
@@ -964,7 +1779,8 @@ class RemoteCheckpointManager(BaseCheckpointManager):
                  ckpt_service_port: str = '5555',
                  atexit_saving: str = 'enabled',
                  periodic_saving: str = 'disabled',
-                 periodic_saving_interval: Optional[str] = None) -> None:
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
         self._job_id = job_id
         self._ckpt_service_endpoint = ckpt_service_endpoint
         self._ckpt_list: List[Dict[str, RemoteCheckpoint]]
@@ -977,6 +1793,7 @@ class RemoteCheckpointManager(BaseCheckpointManager):
             if not periodic_saving_interval:
                 raise ValueError('periodic_saving_interval must be specified when periodic_saving is enabled')
             self._periodic_saving_interval = float(periodic_saving_interval)
+        self._configs: Dict[str, Any] = _parse_optional_configs(configs)
 
     def get_configs(self) -> Dict[str, Any]:
         return {
@@ -985,9 +1802,16 @@ class RemoteCheckpointManager(BaseCheckpointManager):
             'ckpt_service_port': self._ckpt_service_port,
             'atexit_saving': self._atexit_saving,
             'periodic_saving': self._periodic_saving,
-            'periodic_saving_interval': self._periodic_saving_interval
+            'periodic_saving_interval': self._periodic_saving_interval,
+            **self._configs
         }
 
+    @contextmanager
+    def _configured(self) -> Iterator[None]:
+        with super()._configured(), CheckpointStream.configured(self._configs[CONFIG_STREAM_CHUNK_SIZE],
+                                                                self._configs[CONFIG_STREAM_CREDIT]):
+            yield
+
     def _create_checkpoint(self, type_str: str, uid: str, key_name: str) -> Checkpoint:
         return RemoteCheckpoint(type_str, self._job_id, uid, key_name)
 
@@ -1003,9 +1827,31 @@ class RemoteCheckpointManager(BaseCheckpointManager):
     def _load_impl(self, ckpt: Any) -> Any:
         pass
 
+    def _delete_impl(self, ckpt: Any, ckpt_uid: str) -> None:
+        pass
+
+
+# Ranks saving the same remote collection lease it under this name, and the ranks waiting for the holder poll the
+# lease at intervals growing up to the maximum
+_LEASE_NAME = 'writer'
+_LEASE_POLL_INTERVAL = 0.05
+_LEASE_MAX_POLL_INTERVAL = 1.0
+
 
 class RemoteCheckpointCollectionManager(BaseCheckpointCollectionManager):
-    r""" Manage remote checkpoint collections. """
+    r""" Manage remote checkpoint collections.
+
+    The checkpoint service may be sharded over several instances, listed in ``ckpt_service_endpoint`` as
+    ``host[:port]`` separated by semicolons, e.g. ``ckpt-0:5555;ckpt-1:5555``. The keys of collections are spread over
+    the instances by consistent hashing, and every key is saved to ``ckpt_service_replicas`` instances. Requests go to
+    the instances owning a key directly, and the keys held by different instances are transferred concurrently.
+
+    Data-parallel ranks save identical collections, so every collection is leased from the service, and only the rank
+    holding the lease uploads it. The other ranks wait until the collection is committed and skip the upload, or take
+    over if the holder is not heard from within ``ckpt_service_lease_ttl`` seconds. Collections are committed with the
+    fencing tokens of the leases, so a rank whose lease expired does not overwrite what the rank taking over saved. A
+    TTL of 0 disables leases, and every rank uploads.
+    """
     def __init__(self,
                  uid: str,
                  job_id: str,
@@ -1013,16 +1859,16 @@ class RemoteCheckpointCollectionManager(BaseCheckpointCollectionManager):
                  ckpt_service_port: str = '5555',
                  atexit_saving: str = 'enabled',
                  periodic_saving: str = 'disabled',
-                 periodic_saving_interval: Optional[str] = None):
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
         # TODO(p1): Add strategy option and frequency options to checkpoint config
         self._job_id = job_id
         self._ckpt_service_endpoint = ckpt_service_endpoint
         self._ckpt_list: List[Dict[str, RemoteCheckpoint]]
 
-        self._context = zmq.Context()
-        self._socket = self._context.socket(zmq.REQ)
         self._ckpt_service_port = ckpt_service_port
-        self._socket.connect(f'tcp://{self._ckpt_service_endpoint}:{self._ckpt_service_port}')
+        endpoints = [e if ':' in e else f'{e}:{ckpt_service_port}' for e in ckpt_service_endpoint.split(';') if e]
+        self._ring = HashRing(endpoints)
 
         self._atexit_saving: bool = atexit_saving.lower() == 'enabled'
         self._periodic_saving: bool = periodic_saving.lower() == 'enabled'
@@ -1031,11 +1877,21 @@ class RemoteCheckpointCollectionManager(BaseCheckpointCollectionManager):
             if not periodic_saving_interval:
                 raise ValueError('periodic_saving_interval must be specified when periodic_saving is enabled')
             self._periodic_saving_interval = float(periodic_saving_interval)
+        self._configs: Dict[str, Any] = _parse_optional_configs(configs)
 
-        super().__init__(uid)
+        # Pipelined clients, which keep requests of saves, loads, deletions and leases in flight at once, so they are
+        # shared by the threads of the manager
+        self._context = zmq.Context()
+        timeout = self._configs[CONFIG_CKPT_SERVICE_TIMEOUT] or None
+        self._clients: Dict[str, CheckpointClient] = {
+            endpoint: CheckpointClient(f'tcp://{endpoint}', self._context, timeout) for endpoint in self._ring.nodes
+        }
 
-        # TODO(p0): Figure out lock implementation when using TCP listener?
-        # self._lock = ??
+        # Identifies this manager as the holder of leases, and the lease of the collection to be saved next
+        self._holder = f'{platform.node()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._lease: Optional[Tuple[str, Dict[str, Any]]] = None
+
+        super().__init__(uid)
 
     def get_configs(self) -> Dict[str, Any]:
         return {
@@ -1044,39 +1900,159 @@ class RemoteCheckpointCollectionManager(BaseCheckpointCollectionManager):
             'ckpt_service_port': self._ckpt_service_port,
             'atexit_saving': self._atexit_saving,
             'periodic_saving': self._periodic_saving,
-            'periodic_saving_interval': self._periodic_saving_interval
+            'periodic_saving_interval': self._periodic_saving_interval,
+            **self._configs
         }
 
+    @contextmanager
+    def _configured(self) -> Iterator[None]:
+        with super()._configured(), CheckpointStream.configured(self._configs[CONFIG_STREAM_CHUNK_SIZE],
+                                                                self._configs[CONFIG_STREAM_CREDIT]):
+            yield
+
     def _create_checkpoint(self, type_str: str, uid: str, key_name: str) -> RemoteCheckpoint:
         return RemoteCheckpoint(type_str, self._job_id, uid, key_name)
 
     def _acquire(self) -> None:
-        # TODO(p0)
-        pass
+        # Lease the collection to be saved next without waiting for other ranks, which is done when it is saved
+        self._release()
+        ckpt_uid = self._format_ckpt_uid(self._counter)
+        lease = self._try_acquire_lease(ckpt_uid)
+        self._lease = None if lease is None else (ckpt_uid, lease)
 
     def _release(self) -> None:
-        # TODO(p0)
-        pass
+        # Release a lease which was not used for a save, so that other ranks do not wait for it to expire
+        ckpt_uid, lease = self._lease or ('', None)
+        self._lease = None
+        if lease is not None and self._holds(lease):
+            try:
+                self._request_lease(RequestType.RELEASE, ckpt_uid, {'token': lease['token']}, self._lease_timeout())
+            except Exception as e:
+                logger.debug(f'Unable to release the lease of {ckpt_uid} due to exception: {e}')
+
+    def _lease_timeout(self) -> float:
+        # Leases are renewed at a third of the TTL, and requests not answered by then are given up on
+        return self._configs[CONFIG_CKPT_SERVICE_LEASE_TTL] / 3
+
+    def _lease_endpoint(self, ckpt_uid: str) -> str:
+        # Collections are leased from the primary owner of the collection, whichever instances hold its keys
+        return self._ring.owners(f'{self._job_id}/{ckpt_uid}')[0]
+
+    def _request_lease(self, req_type: RequestType, ckpt_uid: str, body: Any, timeout: Optional[float] = -1) -> Any:
+        msg = CheckpointMessage(req_type, self._job_id, ckpt_uid, _LEASE_NAME, body)
+        response = request(self._clients[self._lease_endpoint(ckpt_uid)], msg, timeout)
+        if response.req_type == RequestType.ERROR:
+            raise Exception(bytes(response.body).decode(errors='replace'))
+        return response.body
+
+    def _acquire_lease(self, ckpt_uid: str, timeout: Optional[float] = -1) -> Dict[str, Any]:
+        return self._request_lease(RequestType.ACQUIRE, ckpt_uid,
+                                   {'holder': self._holder, 'ttl': self._configs[CONFIG_CKPT_SERVICE_LEASE_TTL]},
+                                   timeout)
+
+    def _try_acquire_lease(self, ckpt_uid: str) -> Optional[Dict[str, Any]]:
+        # Collections are saved without leases if they are disabled or unavailable, as every rank used to
+        if self._configs[CONFIG_CKPT_SERVICE_LEASE_TTL] <= 0:
+            return None
+        try:
+            return self._acquire_lease(ckpt_uid, self._lease_timeout())
+        except Exception as e:
+            logger.info(f'Unable to lease {ckpt_uid} due to exception: {e}, saving it without a lease')
+            return None
+
+    def _holds(self, lease: Dict[str, Any]) -> bool:
+        return lease['holder'] == self._holder and not lease['committed']
+
+    @contextmanager
+    def _renewing(self, ckpt_uid: str, lease: Optional[Dict[str, Any]]) -> Iterator[None]:
+        r""" Renew a lease in the background while the collection is saved, which may take longer than the TTL. """
+
+        if lease is None:
+            yield
+            return
+
+        stopped = threading.Event()
+
+        def renew() -> None:
+            while not stopped.wait(self._lease_timeout()):
+                try:
+                    renewed = self._acquire_lease(ckpt_uid, self._lease_timeout())
+                except Exception as e:
+                    # Responses to renewals which timed out are dropped, so the next renewal may succeed
+                    logger.info(f'Unable to renew the lease of {ckpt_uid} due to exception: {e}')
+                    continue
+                if not self._holds(renewed):
+                    logger.info(f'Lost the lease of {ckpt_uid} to {renewed["holder"]}')
+                    return
+
+        thread = threading.Thread(target=renew)
+        thread.daemon = True
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    def _owners(self, ckpt_uid: str, key: str) -> List[str]:
+        return self._ring.owners(f'{self._job_id}/{ckpt_uid}/{key}', self._configs[CONFIG_CKPT_SERVICE_REPLICAS])
+
+    def _map_shards(self, fn: Callable[[str, List[str]], Dict[str, T]],
+                    keys_by_shard: Dict[str, List[str]]) -> Dict[str, T]:
+        r""" Apply a function to the keys held by every shard, one thread per shard, since sockets are not shared.
+
+        If any call fails, the first exception is raised after all the calls finish.
+        """
+
+        if len(keys_by_shard) <= 1:
+            return {k: v for endpoint, keys in keys_by_shard.items() for k, v in fn(endpoint, keys).items()}
+
+        retval: Dict[str, T] = {}
+        with ThreadPoolExecutor(max_workers=len(keys_by_shard)) as executor:
+            futures = [executor.submit(self._call_configured, fn, endpoint, keys)
+                       for endpoint, keys in keys_by_shard.items()]
+            for future in futures:
+                retval.update(future.result())
+        return retval
 
     def _validate(self) -> None:
+        # Every shard is pinged at once
         msg = CheckpointMessage(RequestType.PING, job_id=self._job_id, uid='', ckpt_name='', body=b'')
-        self._socket.send(msg.encode_message())
+        futures = {endpoint: client.request(msg) for endpoint, client in self._clients.items()}
+        for endpoint, future in futures.items():
+            ckpt_response = future.result()
+            assert ckpt_response.req_type == RequestType.PING \
+                and ckpt_response.job_id == self._job_id \
+                and ckpt_response.body == b'ACK', f'Unexpected response from {endpoint}'
+
+        self._set_policy()
+
+    def _set_policy(self) -> None:
+        # Every shard evicts the keys it holds, so the policies are set on all of them
+        policy = {name: self._configs[k] for k, name in _CKPT_SERVICE_POLICIES.items() if self._configs[k] is not None}
+        if not policy:
+            return
 
-        response = self._socket.recv()
-        ckpt_response = CheckpointMessage.parse_message(response)
-        assert ckpt_response.req_type == RequestType.PING \
-            and ckpt_response.job_id == self._job_id \
-            and ckpt_response.body == b'ACK'
+        msg = CheckpointMessage(RequestType.POLICY, job_id=self._job_id, uid='', ckpt_name='', body=policy)
+        futures = {endpoint: client.request(msg) for endpoint, client in self._clients.items()}
+        for endpoint, future in futures.items():
+            ckpt_response = future.result()
+            if ckpt_response.req_type == RequestType.ERROR:
+                # Services predating POLICY requests keep applying their own policies
+                logger.warning(f'Unable to set the eviction policies {policy} on {endpoint} due to: '
+                               f'{bytes(ckpt_response.body).decode(errors="replace")}')
 
     def _discover(self) -> None:
+        # ckpt_list_from_server: Dict[str, List[str]], merged over the shards, which are listed at once
+        ckpt_list_from_server: Dict[str, List[str]] = {}
         msg = CheckpointMessage(RequestType.LIST, job_id=self._job_id, uid='', ckpt_name='', body=b'')
-        self._socket.send(msg.encode_message())
-
-        response = self._socket.recv()
-        ckpt_response = CheckpointMessage.parse_message(response)
-        ckpt_list_from_server = ckpt_response.body
+        futures = [client.request(msg) for client in self._clients.values()]
+        for future in futures:
+            ckpt_response = future.result()
+            for uid, ckpt_names in (ckpt_response.body or {}).items():
+                merged = ckpt_list_from_server.setdefault(uid, [])
+                merged.extend(name for name in ckpt_names if name not in merged)
 
-        # ckpt_list_from_server: Dict[str, List[str]]
         if not ckpt_list_from_server:
             logger.debug(f'No existing checkpoints found for job ID {self._job_id}')
             return
@@ -1084,18 +2060,89 @@ class RemoteCheckpointCollectionManager(BaseCheckpointCollectionManager):
         self._parse_discovered_checkpoints(self._job_id, ckpt_list_from_server)
 
     def _save_impl(self, objs: Dict[str, Any], ckpt_uid: str) -> Dict[str, RemoteCheckpoint]:
-        retval: Dict[str, RemoteCheckpoint] = {}
-        for k, obj in objs.items():
-            retval[k] = RemoteCheckpointSaver.invoke(obj, self._socket, self._job_id, ckpt_uid, k)
+        # The collection is usually leased before the save, unless the manager does not save it by itself, e.g. as a
+        # tier of a tiered manager
+        if self._lease is not None and self._lease[0] == ckpt_uid:
+            lease: Optional[Dict[str, Any]] = self._lease[1]
+            self._lease = None
+        else:
+            self._release()
+            lease = self._try_acquire_lease(ckpt_uid)
+
+        # Another rank holds the lease, so wait until it commits the collection, or take over if its lease expires
+        interval = _LEASE_POLL_INTERVAL
+        while lease is not None and not self._holds(lease):
+            if lease['committed']:
+                logger.debug(f'Skip uploading {ckpt_uid}, which is uploaded by {lease["holder"]}')
+                return {k: RemoteCheckpoint(obj, self._job_id, ckpt_uid, k) for k, obj in objs.items()}
+            time.sleep(interval)
+            interval = min(2 * interval, _LEASE_MAX_POLL_INTERVAL)
+            lease = self._acquire_lease(ckpt_uid)
+
+        # Every key is saved to each of its owners. The keys of a shard are sent one after another without waiting
+        # for their commits, and small keys are batched, so they take a single round trip altogether.
+        keys_by_shard: Dict[str, List[str]] = {}
+        for k in objs:
+            for endpoint in self._owners(ckpt_uid, k):
+                keys_by_shard.setdefault(endpoint, []).append(k)
+
+        token = None if lease is None else lease['token']
+
+        def save(endpoint: str, keys: List[str]) -> Dict[str, RemoteCheckpoint]:
+            client = self._clients[endpoint]
+            with CheckpointStream.fenced(token), CheckpointStream.pipelined(), CheckpointStream.batched():
+                return {k: RemoteCheckpointSaver.invoke(objs[k], client, self._job_id, ckpt_uid, k) for k in keys}
+
+        committed = False
+        try:
+            with self._renewing(ckpt_uid, lease):
+                ckpts = self._map_shards(save, keys_by_shard)
+            committed = True
+            return ckpts
+        finally:
+            # Waiting ranks skip the upload if it is committed, and take over right away otherwise
+            if lease is not None:
+                try:
+                    self._request_lease(RequestType.RELEASE, ckpt_uid, {'token': token, 'committed': committed})
+                except Exception as e:
+                    logger.info(f'Unable to release the lease of {ckpt_uid} due to exception: {e}')
+
+    def _load_impl(self, ckpts: Dict[str, RemoteCheckpoint]) -> Dict[str, Any]:
+        # Keys are loaded from their primary owners concurrently, and then from the other owners if that failed. The
+        # first chunks of the keys of a shard are requested with a single request, so small keys take a single round
+        # trip altogether.
+        owners = {k: self._owners(ckpt.uid, k) for k, ckpt in ckpts.items()}
+        keys_by_shard: Dict[str, List[str]] = {}
+        for k in ckpts:
+            keys_by_shard.setdefault(owners[k][0], []).append(k)
+
+        def load(endpoint: str, keys: List[str]) -> Dict[str, Any]:
+            retval = {}
+            client = self._clients[endpoint]
+            names = [(ckpts[k].job_id, ckpts[k].uid, ckpts[k].key_name) for k in keys]
+            with CheckpointStream.prefetched(client, names):
+                for k in keys:
+                    try:
+                        retval[k] = RemoteCheckpointLoader.invoke(ckpts[k], client)
+                    except Exception as e:
+                        logger.info(f'Unable to load {ckpts[k]} from {endpoint} due to exception: {e}')
+            return retval
+
+        retval = self._map_shards(load, keys_by_shard)
+        for k in ckpts:
+            for endpoint in owners[k][1:]:
+                if k in retval:
+                    break
+                retval.update(load(endpoint, [k]))
+            if k not in retval:
+                raise Exception(f'Unable to load {ckpts[k]} from any of {owners[k]}')
 
         return retval
 
-    def _load_impl(self, ckpts: Any) -> Any:
-        retval = {}
+    def _delete_impl(self, ckpts: Dict[str, RemoteCheckpoint], ckpt_uid: str) -> None:
         for k, ckpt in ckpts.items():
-            retval[k] = RemoteCheckpointLoader.invoke(ckpt, self._socket)
-
-        return retval
+            for endpoint in self._owners(ckpt_uid, k):
+                RemoteCheckpointDeleter.invoke(ckpt, self._clients[endpoint])
 
 
 class S3CheckpointManager(BaseCheckpointManager):
@@ -1105,7 +2152,8 @@ class S3CheckpointManager(BaseCheckpointManager):
                  root: str,
                  atexit_saving: str = 'enabled',
                  periodic_saving: str = 'disabled',
-                 periodic_saving_interval: Optional[str] = None) -> None:
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
         parsed_url = urlparse(root)
         self._bucket_name = parsed_url.netloc
         self._job_id = parsed_url.path.strip('/')
@@ -1118,6 +2166,7 @@ class S3CheckpointManager(BaseCheckpointManager):
             if not periodic_saving_interval:
                 raise ValueError('periodic_saving_interval must be specified when periodic_saving is enabled')
             self._periodic_saving_interval = float(periodic_saving_interval)
+        self._configs: Dict[str, Any] = _parse_optional_configs(configs)
 
     def get_configs(self) -> Dict[str, Any]:
         return {
@@ -1125,9 +2174,17 @@ class S3CheckpointManager(BaseCheckpointManager):
             'job_id': self._job_id,
             'atexit_saving': self._atexit_saving,
             'periodic_saving': self._periodic_saving,
-            'periodic_saving_interval': self._periodic_saving_interval
+            'periodic_saving_interval': self._periodic_saving_interval,
+            **self._configs
         }
 
+    @contextmanager
+    def _configured(self) -> Iterator[None]:
+        with super()._configured(), S3CheckpointHelper.configured(self._configs[CONFIG_S3_PART_SIZE],
+                                                                  self._configs[CONFIG_S3_MAX_CONCURRENCY],
+                                                                  self._configs[CONFIG_S3_PART_RETRIES]):
+            yield
+
     def _create_checkpoint(self, type_str: str, uid: str, key_name: str) -> Checkpoint:
         return S3Checkpoint(type_str, self._bucket_name, self._job_id, uid, key_name)
 
@@ -1143,6 +2200,9 @@ class S3CheckpointManager(BaseCheckpointManager):
     def _load_impl(self, ckpt: Any) -> Any:
         pass
 
+    def _delete_impl(self, ckpt: Any, ckpt_uid: str) -> None:
+        pass
+
 
 class S3CheckpointCollectionManager(BaseCheckpointCollectionManager):
     r""" Manage s3 checkpoint collections. """
@@ -1151,7 +2211,8 @@ class S3CheckpointCollectionManager(BaseCheckpointCollectionManager):
                  root: str,
                  atexit_saving: str = 'enabled',
                  periodic_saving: str = 'disabled',
-                 periodic_saving_interval: Optional[str] = None):
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
         parsed_url = urlparse(root)
         self._bucket_name = parsed_url.netloc
         self._job_id = parsed_url.path.strip('/')
@@ -1164,6 +2225,7 @@ class S3CheckpointCollectionManager(BaseCheckpointCollectionManager):
             if not periodic_saving_interval:
                 raise ValueError('periodic_saving_interval must be specified when periodic_saving is enabled')
             self._periodic_saving_interval = float(periodic_saving_interval)
+        self._configs: Dict[str, Any] = _parse_optional_configs(configs)
 
         super().__init__(uid)
 
@@ -1173,9 +2235,17 @@ class S3CheckpointCollectionManager(BaseCheckpointCollectionManager):
             'job_id': self._job_id,
             'atexit_saving': self._atexit_saving,
             'periodic_saving': self._periodic_saving,
-            'periodic_saving_interval': self._periodic_saving_interval
+            'periodic_saving_interval': self._periodic_saving_interval,
+            **self._configs
         }
 
+    @contextmanager
+    def _configured(self) -> Iterator[None]:
+        with super()._configured(), S3CheckpointHelper.configured(self._configs[CONFIG_S3_PART_SIZE],
+                                                                  self._configs[CONFIG_S3_MAX_CONCURRENCY],
+                                                                  self._configs[CONFIG_S3_PART_RETRIES]):
+            yield
+
     def _create_checkpoint(self, type_str: str, uid: str, key_name: str) -> S3Checkpoint:
         return S3Checkpoint(type_str, self._bucket_name, self._job_id, uid, key_name)
 
@@ -1191,7 +2261,16 @@ class S3CheckpointCollectionManager(BaseCheckpointCollectionManager):
         assert S3CheckpointHelper.ping(self._bucket_name)
 
     def _discover(self) -> None:
-        ckpt_list_from_server = S3CheckpointHelper.list(self._bucket_name, self._job_id)
+        # Committed checkpoints are indexed, so that discovery does not list every object of the job. Every checkpoint
+        # UID has its own index entry, so writers in different processes do not lose each other's entries.
+        ckpt_list_from_server = S3CheckpointHelper.load_index(self._bucket_name, self._job_id, str(self))
+        if ckpt_list_from_server is None:
+            # Jobs written by older versions do not have indexes
+            ckpt_list_from_server = {
+                ckpt_uid: ckpt_names
+                for ckpt_uid, ckpt_names in S3CheckpointHelper.list(self._bucket_name, self._job_id).items()
+                if self._match_ckpt_uid(ckpt_uid) >= 0
+            }
 
         if not ckpt_list_from_server:
             logger.debug(f'No existing checkpoints found for job ID {self._job_id}')
@@ -1200,19 +2279,409 @@ class S3CheckpointCollectionManager(BaseCheckpointCollectionManager):
         self._parse_discovered_checkpoints(self._job_id, ckpt_list_from_server)
 
     def _save_impl(self, objs: Dict[str, Any], ckpt_uid: str) -> Dict[str, S3Checkpoint]:
-        retval: Dict[str, S3Checkpoint] = {}
-        for k, obj in objs.items():
-            retval[k] = S3CheckpointSaver.invoke(obj, self._bucket_name, self._job_id, ckpt_uid, k)
+        def save(k: str, obj: Any) -> S3Checkpoint:
+            return S3CheckpointSaver.invoke(obj, self._bucket_name, self._job_id, ckpt_uid, k)
 
-        return retval
+        ckpts = self._map_keys(save, objs)
+        # The checkpoint is committed when it is added to the index
+        S3CheckpointHelper.save_index_entry(self._bucket_name, self._job_id, str(self), ckpt_uid,
+                                            [ckpt.key_name for ckpt in ckpts.values()])
+        return ckpts
 
     def _load_impl(self, ckpts: Any) -> Any:
-        retval = {}
-        for k, ckpt in ckpts.items():
-            retval[k] = S3CheckpointLoader.invoke(ckpt)
+        return self._map_keys(lambda _, ckpt: S3CheckpointLoader.invoke(ckpt), ckpts)
+
+    def _delete_impl(self, ckpts: Dict[str, S3Checkpoint], ckpt_uid: str) -> None:
+        # Remove the checkpoint from the index first, so that the index never refers to deleted objects
+        S3CheckpointHelper.delete_index_entry(self._bucket_name, self._job_id, str(self), ckpt_uid,
+                                              [ckpt.key_name for ckpt in ckpts.values()])
+        for ckpt in ckpts.values():
+            S3CheckpointDeleter.invoke(ckpt)
 
+
+# Checkpoints held by peers are only listed after this marker is saved, so that partially saved collections are
+# never discovered
+_PEER_COMMIT_MARKER = '.committed'
+
+
+class PeerCheckpointCollectionManager(BaseCheckpointCollectionManager):
+    r""" Manage checkpoint collections held in the memory of peer nodes.
+
+    Every node runs a :class:`~lattice_addons.state.distributed.replica.ReplicaStore`, and ``peers`` lists the
+    endpoints of the stores by rank, separated by semicolons, e.g. ``node0:5556;node0:5556;node1:5556;node1:5556``.
+    Collections are saved to the store of the node of this rank, and replicated to the stores of the next
+    ``peer_replicas`` nodes. A restarted process restores from the memory of its node, and a process replacing a failed
+    node restores from the memory of its peers. Stores not responding within ``peer_timeout`` seconds are skipped.
+
+    The rank is read from the ``RANK`` environment variable.
+    """
+
+    def __init__(self,
+                 uid: str,
+                 atexit_saving: str = 'enabled',
+                 periodic_saving: str = 'disabled',
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
+        self._atexit_saving: bool = atexit_saving.lower() == 'enabled'
+        self._periodic_saving: bool = periodic_saving.lower() == 'enabled'
+        self._periodic_saving_interval: Optional[float] = None
+        if self._periodic_saving:
+            if not periodic_saving_interval:
+                raise ValueError('periodic_saving_interval must be specified when periodic_saving is enabled')
+            self._periodic_saving_interval = float(periodic_saving_interval)
+        self._configs: Dict[str, Any] = _parse_optional_configs(configs)
+        self._ckpt_list: List[Dict[str, RemoteCheckpoint]]
+
+        if not self._configs[CONFIG_PEERS]:
+            raise ValueError(f'{CONFIG_PEERS} must be specified for peer checkpoints')
+        peers: List[str] = self._configs[CONFIG_PEERS].split(';')
+        self._rank: int = int(os.environ.get('RANK', '0'))
+        if not 0 <= self._rank < len(peers):
+            raise ValueError(f'There is no peer for rank {self._rank} in {CONFIG_PEERS}')
+
+        # The store of this node first, and then the stores of the next nodes
+        self._endpoints: List[str] = [peers[self._rank]]
+        for i in range(1, len(peers)):
+            endpoint = peers[(self._rank + i) % len(peers)]
+            if endpoint not in self._endpoints and len(self._endpoints) <= self._configs[CONFIG_PEER_REPLICAS]:
+                self._endpoints.append(endpoint)
+
+        # Checkpoints of different ranks are kept apart in the stores
+        self._namespace = f'rank_{self._rank}'
+        self._context = zmq.Context()
+        # Checkpoint UID -> endpoints of the stores holding the collection
+        self._holders: Dict[str, List[str]] = {}
+
+        super().__init__(uid)
+
+    def get_configs(self) -> Dict[str, Any]:
+        return {
+            'atexit_saving': self._atexit_saving,
+            'periodic_saving': self._periodic_saving,
+            'periodic_saving_interval': self._periodic_saving_interval,
+            **self._configs
+        }
+
+    @contextmanager
+    def _configured(self) -> Iterator[None]:
+        with super()._configured(), CheckpointStream.configured(self._configs[CONFIG_STREAM_CHUNK_SIZE],
+                                                                self._configs[CONFIG_STREAM_CREDIT]):
+            yield
+
+    def _create_checkpoint(self, type_str: str, uid: str, key_name: str) -> RemoteCheckpoint:
+        return RemoteCheckpoint(type_str, self._namespace, uid, key_name)
+
+    def _connect(self, endpoint: str) -> zmq.Socket:
+        # Sockets are not shared, since checkpoints are saved, loaded and deleted in different threads. A socket is
+        # not reused after a timeout either, since a late response would be taken for the response to the next request.
+        socket = self._context.socket(zmq.DEALER)
+        timeout = int(self._configs[CONFIG_PEER_TIMEOUT] * 1000)
+        socket.setsockopt(zmq.RCVTIMEO, timeout)
+        socket.setsockopt(zmq.SNDTIMEO, timeout)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(f'tcp://{endpoint}')
+        return socket
+
+    def _request(self, socket: zmq.Socket, req_type: RequestType, uid: str = '', ckpt_name: str = '') -> Any:
+        msg = CheckpointMessage(req_type, job_id=self._namespace, uid=uid, ckpt_name=ckpt_name, body=b'')
+        msg.send(socket)
+        response = CheckpointMessage.recv(socket)
+        if response.req_type == RequestType.ERROR:
+            raise Exception(response.body)
+        return response.body
+
+    def _acquire(self) -> None:
+        # Every rank writes its own collections, so there is no need for a write lock
+        pass
+
+    def _release(self) -> None:
+        pass
+
+    def _validate(self) -> None:
+        # Peers may be down, which is what the replicas are for
+        pass
+
+    def _discover(self) -> None:
+        ckpt_list: Dict[str, List[str]] = {}
+        for endpoint in self._endpoints:
+            try:
+                with self._connect(endpoint) as socket:
+                    listed: Dict[str, List[str]] = self._request(socket, RequestType.LIST)
+            except Exception as e:
+                logger.info(f'Unable to list checkpoints held by {endpoint} due to exception: {e}')
+                continue
+
+            for ckpt_uid, ckpt_names in listed.items():
+                if _PEER_COMMIT_MARKER not in ckpt_names:
+                    continue
+                ckpt_list.setdefault(ckpt_uid, [name for name in ckpt_names if name != _PEER_COMMIT_MARKER])
+                self._holders.setdefault(ckpt_uid, []).append(endpoint)
+
+        if not ckpt_list:
+            logger.debug(f'No existing checkpoints found for {self._namespace} in {self._endpoints}')
+            return
+
+        self._parse_discovered_checkpoints(self._namespace, ckpt_list)
+
+    def _save_impl(self, objs: Dict[str, Any], ckpt_uid: str) -> Dict[str, RemoteCheckpoint]:
+        def replicate(endpoint: str) -> Dict[str, RemoteCheckpoint]:
+            with self._connect(endpoint) as socket:
+                # Small objects are saved with a single request, which is sent before the marker
+                with CheckpointStream.batched():
+                    ckpts = {k: RemoteCheckpointSaver.invoke(obj, socket, self._namespace, ckpt_uid, k)
+                             for k, obj in objs.items()}
+                self._request(socket, RequestType.SAVE, ckpt_uid, _PEER_COMMIT_MARKER)
+                return ckpts
+
+        retval: Optional[Dict[str, RemoteCheckpoint]] = None
+        holders: List[str] = []
+        with ThreadPoolExecutor(len(self._endpoints)) as executor:
+            futures = {endpoint: executor.submit(self._call_configured, replicate, endpoint)
+                       for endpoint in self._endpoints}
+            for endpoint, future in futures.items():
+                try:
+                    retval = future.result()
+                    holders.append(endpoint)
+                except Exception as e:
+                    logger.info(f'Unable to replicate {ckpt_uid} to {endpoint} due to exception: {e}')
+
+        if retval is None:
+            raise Exception(f'Unable to replicate {ckpt_uid} to any peer')
+        self._holders[ckpt_uid] = holders
         return retval
 
+    def _load_impl(self, ckpts: Dict[str, RemoteCheckpoint]) -> Dict[str, Any]:
+        ckpt_uid = next(iter(ckpts.values())).uid
+        for endpoint in self._holders.get(ckpt_uid, []):
+            try:
+                with self._connect(endpoint) as socket:
+                    return {k: RemoteCheckpointLoader.invoke(ckpt, socket) for k, ckpt in ckpts.items()}
+            except Exception as e:
+                logger.info(f'Unable to load {ckpt_uid} from {endpoint} due to exception: {e}')
+
+        raise Exception(f'Unable to load {ckpt_uid} from any peer')
+
+    def _delete_impl(self, ckpts: Dict[str, RemoteCheckpoint], ckpt_uid: str) -> None:
+        for endpoint in self._holders.pop(ckpt_uid, []):
+            try:
+                with self._connect(endpoint) as socket:
+                    # Remove the marker first, so that a partially deleted collection is not discovered
+                    self._request(socket, RequestType.DEL, ckpt_uid, _PEER_COMMIT_MARKER)
+                    for ckpt in ckpts.values():
+                        RemoteCheckpointDeleter.invoke(ckpt, socket)
+            except Exception as e:
+                logger.info(f'Unable to delete {ckpt_uid} from {endpoint} due to exception: {e}')
+
+
+@dataclass
+class _TieredCheckpoint():
+    r""" Describe where an object of a tiered checkpoint collection is.
+
+    :param copies: The checkpoint in each tier, fastest first, or `None` if the object is not in a tier
+    """
+
+    copies: List[Optional[Checkpoint]]
+
+    @property
+    def kind(self) -> Type:
+        return next(ckpt for ckpt in self.copies if ckpt is not None).kind
+
+
+class TieredCheckpointCollectionManager(BaseCheckpointCollectionManager):
+    r""" Manage checkpoint collections in a fast local tier, and slower tiers which they are copied to.
+
+    Collections are saved to the local file system under ``root``, which can be a local disk or a ``tmpfs`` mount for
+    host memory, and then copied to the slower tiers in the background:
+
+    - If ``peers`` is set, the memory of peer nodes, see :class:`PeerCheckpointCollectionManager`. Only the most recent
+      collection is kept in memory.
+    - The durable tier selected by ``durable_root``, either ``s3://<bucket>/<job id>`` or
+      ``tcp://<checkpoint service endpoint>:<port>/<job id>``.
+
+    Collections are loaded from the fastest tier holding a valid copy, so a process restarting on the same node does
+    not read the durable tier. Collections which have not been copied to the durable tier yet, e.g. because the
+    previous process was killed, are copied again when they are discovered.
+    """
+
+    def __init__(self,
+                 uid: str,
+                 root: str,
+                 atexit_saving: str = 'enabled',
+                 periodic_saving: str = 'disabled',
+                 periodic_saving_interval: Optional[str] = None,
+                 **configs: str) -> None:
+        self._root: str = root
+        self._atexit_saving: bool = atexit_saving.lower() == 'enabled'
+        self._periodic_saving: bool = periodic_saving.lower() == 'enabled'
+        self._periodic_saving_interval: Optional[float] = None
+        if self._periodic_saving:
+            if not periodic_saving_interval:
+                raise ValueError('periodic_saving_interval must be specified when periodic_saving is enabled')
+            self._periodic_saving_interval = float(periodic_saving_interval)
+        self._configs: Dict[str, Any] = _parse_optional_configs(configs)
+        self._ckpt_list: List[Dict[str, _TieredCheckpoint]]
+
+        # Tiers from the fastest to the slowest, and the number of the most recent collections kept in each tier, or 0
+        # to keep what the retention of this manager keeps
+        self._tiers: List[BaseCheckpointCollectionManager] = [LocalCheckpointCollectionManager(uid, root, **configs)]
+        self._tier_keep_last: List[int] = [0]
+        if self._configs[CONFIG_PEERS]:
+            self._tiers.append(PeerCheckpointCollectionManager(uid, **configs))
+            self._tier_keep_last.append(1)
+        self._tiers.append(self._create_durable_tier(uid, configs))
+        self._tier_keep_last.append(0)
+
+        # Collections are copied to the slower tiers in order, and the copies of expired collections are skipped
+        self._trickler = _CheckpointWorker(self._copy_to_slower_tiers, 'copy to slower tiers checkpoint')
+        self._expired: Set[int] = set()
+
+        super().__init__(uid)
+
+    def _create_durable_tier(self, uid: str, configs: Dict[str, str]) -> BaseCheckpointCollectionManager:
+        durable_root = self._configs[CONFIG_DURABLE_ROOT]
+        if not durable_root:
+            raise ValueError(f'{CONFIG_DURABLE_ROOT} must be specified for tiered checkpoints')
+
+        parsed_url = urlparse(durable_root)
+        if parsed_url.scheme == 's3':
+            return S3CheckpointCollectionManager(uid, durable_root, **configs)
+        if parsed_url.scheme == 'tcp':
+            return RemoteCheckpointCollectionManager(uid, parsed_url.path.strip('/'), str(parsed_url.hostname),
+                                                     str(parsed_url.port or 5555), **configs)
+        raise ValueError(f'{CONFIG_DURABLE_ROOT} must be an s3:// or tcp:// URL')
+
+    def get_configs(self) -> Dict[str, Any]:
+        return {
+            'root': self._root,
+            'atexit_saving': self._atexit_saving,
+            'periodic_saving': self._periodic_saving,
+            'periodic_saving_interval': self._periodic_saving_interval,
+            **self._configs
+        }
+
+    def _create_checkpoint(self, type_str: str, uid: str, key_name: str) -> Checkpoint:
+        # Collections are saved to the fastest tier first, and copied from there
+        return self._tiers[0]._create_checkpoint(type_str, uid, key_name)
+
+    def _acquire(self) -> None:
+        # Only the fastest tier is saved to by this thread. The slower tiers are saved to by the trickler, which takes
+        # what they need when it copies a collection, e.g. the lease of a remote tier, so that their state is only
+        # used by that thread.
+        self._tiers[0]._acquire()
+
+    def _release(self) -> None:
+        self._tiers[0]._release()
+
+    def _validate(self) -> None:
+        # The managers of the tiers validate themselves
+        pass
+
+    def _discover(self) -> None:
+        tier_ckpts = [dict(zip(tier._ckpt_counters, tier._ckpt_list)) for tier in self._tiers]
+
+        for counter in sorted(set().union(*tier_ckpts)):
+            copies = [ckpts.get(counter, {}) for ckpts in tier_ckpts]
+            keys = next(c for c in copies if c)
+            ckpts = {k: _TieredCheckpoint([c.get(k) for c in copies]) for k in keys}
+            self._append_ckpt(counter, ckpts)
+
+        if self._ckpt_counters:
+            self._set_ckpt_uid(self._ckpt_counters[-1])
+
+        # Copy what is missing in the slower tiers, e.g. the tiers of a node replacing a failed one
+        for counter, ckpts in zip(self._ckpt_counters, self._ckpt_list):
+            if any(ckpt.copies[i] is None for ckpt in ckpts.values() for i in self._tiers_to_copy_to(counter)):
+                self._trickler.submit(ckpts, self._format_ckpt_uid(counter))
+
+    def _tiers_to_copy_to(self, counter: int) -> List[int]:
+        # Tiers keeping a limited number of collections only get the most recent ones
+        newer = sum(1 for c in self._ckpt_counters if c > counter)
+        return [i for i, keep_last in enumerate(self._tier_keep_last)
+                if i > 0 and (keep_last <= 0 or newer < keep_last)]
+
+    def _copy_to_slower_tiers(self, ckpts: Dict[str, _TieredCheckpoint], ckpt_uid: str) -> None:
+        counter = self._match_ckpt_uid(ckpt_uid, raise_expt=True)
+        if counter in self._expired:
+            return
+
+        def is_held(i: int) -> bool:
+            return all(ckpt.copies[i] is not None for ckpt in ckpts.values())
+
+        missing = [i for i in self._tiers_to_copy_to(counter) if not is_held(i)]
+        if not missing:
+            return
+
+        # Copy from the fastest tier holding the collection. Copies run in the background, so every tier is configured
+        # here.
+        source = next(i for i in range(len(self._tiers)) if is_held(i))
+        with self._tiers[source]._configured():
+            objs = self._tiers[source]._load_impl({k: ckpt.copies[source] for k, ckpt in ckpts.items()})
+        for i in missing:
+            tier = self._tiers[i]
+            with tier._configured():
+                saved = tier._save_impl(objs, tier._format_ckpt_uid(counter))
+            for k, ckpt in saved.items():
+                ckpts[k].copies[i] = ckpt
+            self._trim_tier(i)
+
+    def _trim_tier(self, i: int) -> None:
+        keep_last = self._tier_keep_last[i]
+        if keep_last <= 0:
+            return
+
+        held = [(counter, ckpts) for counter, ckpts in zip(list(self._ckpt_counters), list(self._ckpt_list))
+                if all(ckpt.copies[i] is not None for ckpt in ckpts.values())]
+        tier = self._tiers[i]
+        for counter, ckpts in held[:-keep_last]:
+            with tier._configured():
+                tier._delete_impl({k: ckpt.copies[i] for k, ckpt in ckpts.items()}, tier._format_ckpt_uid(counter))
+            for ckpt in ckpts.values():
+                ckpt.copies[i] = None
+
+    def _save_impl(self, objs: Dict[str, Any], ckpt_uid: str) -> Dict[str, _TieredCheckpoint]:
+        counter = self._match_ckpt_uid(ckpt_uid, raise_expt=True)
+        # Every tier is saved to, loaded from and deleted from with its own configs, not the ones of this manager
+        with self._tiers[0]._configured():
+            fast = self._tiers[0]._save_impl(objs, self._tiers[0]._format_ckpt_uid(counter))
+
+        ckpts = {k: _TieredCheckpoint([ckpt] + [None] * (len(self._tiers) - 1)) for k, ckpt in fast.items()}
+        self._trickler.submit(ckpts, ckpt_uid)
+        return ckpts
+
+    def _load_impl(self, ckpts: Dict[str, _TieredCheckpoint]) -> Dict[str, Any]:
+        for i, tier in enumerate(self._tiers):
+            copies = {k: ckpt.copies[i] for k, ckpt in ckpts.items() if ckpt.copies[i] is not None}
+            if len(copies) != len(ckpts):
+                continue
+
+            try:
+                with tier._configured():
+                    return tier._load_impl(copies)
+            except Exception as e:
+                logger.info(f'Unable to load {list(ckpts)} from {tier} due to exception: {e}')
+
+        raise Exception(f'Unable to load {list(ckpts)} from any tier')
+
+    def _delete_impl(self, ckpts: Dict[str, _TieredCheckpoint], ckpt_uid: str) -> None:
+        counter = self._match_ckpt_uid(ckpt_uid, raise_expt=True)
+
+        # Wait for the copy of the collection, so that it is not copied after being deleted
+        self._expired.add(counter)
+        self._trickler.wait()
+
+        for i, tier in enumerate(self._tiers):
+            copies = {k: ckpt.copies[i] for k, ckpt in ckpts.items() if ckpt.copies[i] is not None}
+            if copies:
+                with tier._configured():
+                    tier._delete_impl(copies, tier._format_ckpt_uid(counter))
+
+    def wait(self) -> None:
+        r""" Block until all the checkpoints are copied to the slower tiers and all the expired checkpoints are
+        deleted. """
+
+        self._trickler.wait()
+        super().wait()
+
 
 # Checkpoint settings
 # -------------------
@@ -1287,8 +2756,11 @@ class CheckpointSetting(metaclass=_Singleton):
     def _get_ckpt_mgr_type(self, key: str) -> Optional[Type[BaseCheckpointManager]]:
         ckpt_mgr_types: Dict[str, Type[BaseCheckpointManager]] = {
             'local': LocalCheckpointManager,
+            'sharded': LocalCheckpointManager,
+            'cas': LocalCheckpointManager,
             'remote': RemoteCheckpointManager,
             's3': S3CheckpointManager,
+            'tiered': LocalCheckpointManager,
         }
         return ckpt_mgr_types.get(key, None)
 
@@ -1320,8 +2792,11 @@ class CheckpointCollectionSetting(CheckpointSetting):
     def _get_ckpt_mgr_type(self, key: str) -> Optional[Type[BaseCheckpointCollectionManager]]:
         ckpt_mgr_types: Dict[str, Type[BaseCheckpointCollectionManager]] = {
             'local': LocalCheckpointCollectionManager,
+            'sharded': ShardedLocalCheckpointCollectionManager,
+            'cas': CASLocalCheckpointCollectionManager,
             'remote': RemoteCheckpointCollectionManager,
             's3': S3CheckpointCollectionManager,
+            'tiered': TieredCheckpointCollectionManager,
         }
         return ckpt_mgr_types.get(key, None)
 
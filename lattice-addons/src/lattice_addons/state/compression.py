@@ -0,0 +1,124 @@
+from .ckpt_manager import checkpoint_configs
+from .constants import CONFIG_COMPRESSION, CONFIG_COMPRESSION_LEVEL, CONFIG_COMPRESSION_THREADS
+
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Iterator
+
+import io
+import shutil
+import tempfile
+
+# Compressed checkpoints are recognized by the magic numbers of the compression frames, so they can always be loaded,
+# whatever the current compression setting is
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+_LZ4_MAGIC = b'\x04\x22\x4d\x18'
+# Streams which have to be made seekable are buffered in memory up to this size, and spilled to a temporary file
+_SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+
+def _import_codec(codec: str) -> Any:
+    try:
+        if codec == 'zstd':
+            import zstandard
+            return zstandard
+        else:
+            import lz4.frame
+            return lz4.frame
+    except ImportError as e:
+        raise ImportError(f'{codec} compression requires lattice_addons[compression] to be installed') from e
+
+
+@contextmanager
+def _spooled(f: BinaryIO) -> Iterator[BinaryIO]:
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_MAX_SIZE) as spool:
+        shutil.copyfileobj(f, spool, 1 << 20)
+        spool.seek(0)
+        yield spool  # type: ignore[misc]
+
+
+@contextmanager
+def compressing_writer(f: BinaryIO) -> Iterator[BinaryIO]:
+    r""" Compress what is written to a binary stream using the compression of the manager saving the checkpoint.
+
+    Data is compressed as it is written, so neither the serialized nor the compressed checkpoint is held in memory
+    when writing to a file. The stream is not closed on exit.
+
+    :param f: The binary stream to write compressed data to
+    :return: A binary stream to write uncompressed data to
+    """
+
+    configs = checkpoint_configs()
+    codec = configs[CONFIG_COMPRESSION]
+
+    if codec == 'none':
+        yield f
+    elif codec == 'zstd':
+        zstandard = _import_codec(codec)
+        compressor = zstandard.ZstdCompressor(level=configs[CONFIG_COMPRESSION_LEVEL],
+                                              threads=configs[CONFIG_COMPRESSION_THREADS])
+        with compressor.stream_writer(f, closefd=False) as writer:
+            yield writer
+    else:
+        lz4_frame = _import_codec(codec)
+        with lz4_frame.LZ4FrameFile(f, 'wb', compression_level=configs[CONFIG_COMPRESSION_LEVEL]) as writer:
+            yield writer
+
+
+@contextmanager
+def decompressing_reader(f: BinaryIO, seekable: bool = False) -> Iterator[BinaryIO]:
+    r""" Decompress what is read from a binary stream, if it is compressed.
+
+    :param f: A binary stream to read possibly compressed data from
+    :param seekable: Whether the returned stream must be seekable, e.g. for ``torch.load()``. Compressed data, or data
+        read from a stream which is not seekable, is then spooled to a temporary file, so large checkpoints are not
+        held in memory.
+    :return: A binary stream to read uncompressed data from
+    """
+
+    if f.seekable():
+        magic = f.read(4)
+        f.seek(-len(magic), io.SEEK_CUR)
+    else:
+        # Streams which are not seekable, e.g. downloads, are peeked instead
+        if not isinstance(f, io.BufferedReader):
+            f = io.BufferedReader(f)  # type: ignore[arg-type, assignment]
+        magic = f.peek(4)[:4]  # type: ignore[attr-defined]
+
+    if magic == _ZSTD_MAGIC:
+        zstandard = _import_codec('zstd')
+        reader: BinaryIO = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, closefd=False))
+    elif magic == _LZ4_MAGIC:
+        reader = _import_codec('lz4').LZ4FrameFile(f, 'rb')
+    else:
+        if f.seekable() or not seekable:
+            yield f
+        else:
+            with _spooled(f) as spool:
+                yield spool
+        return
+
+    with reader:
+        if seekable:
+            with _spooled(reader) as spool:
+                yield spool
+        else:
+            yield reader
+
+
+@contextmanager
+def open_checkpoint(path: str, mode: str, seekable: bool = False) -> Iterator[BinaryIO]:
+    r""" Open a local checkpoint file, and compress or decompress its content.
+
+    :param path: The path to the checkpoint file
+    :param mode: `'wb'` to write a checkpoint, or `'rb'` to read a checkpoint
+    :param seekable: Whether the returned stream must be seekable when reading a checkpoint
+    :return: A binary stream to write or read uncompressed data
+    """
+
+    with open(path, mode) as f:
+        if mode == 'wb':
+            with compressing_writer(f) as writer:
+                yield writer
+        else:
+            with decompressing_reader(f, seekable) as reader:
+                yield reader
@@ -3,3 +3,29 @@ CHECKPOINT_CONFIG = 'LATTICE_CHECKPOINT_CONFIG'
 CONFIG_ATEXIT_SAVING = 'atexit_saving'
 CONFIG_PERIODIC_SAVING = 'periodic_saving'
 CONFIG_PERIODIC_SAVING_INTERVAL = 'periodic_saving_interval'
+CONFIG_MAX_INFLIGHT_SAVES = 'max_inflight_saves'
+CONFIG_KEEP_LAST = 'keep_last'
+CONFIG_KEEP_EVERY = 'keep_every'
+CONFIG_IO_WORKERS = 'io_workers'
+CONFIG_SHARD_COMMIT_TIMEOUT = 'shard_commit_timeout'
+CONFIG_SWEEP_GRACE_PERIOD = 'sweep_grace_period'
+CONFIG_INCREMENTAL = 'incremental'
+CONFIG_MMAP = 'mmap'
+CONFIG_COMPRESSION = 'compression'
+CONFIG_COMPRESSION_LEVEL = 'compression_level'
+CONFIG_COMPRESSION_THREADS = 'compression_threads'
+CONFIG_S3_PART_SIZE = 's3_part_size'
+CONFIG_S3_MAX_CONCURRENCY = 's3_max_concurrency'
+CONFIG_S3_PART_RETRIES = 's3_part_retries'
+CONFIG_DURABLE_ROOT = 'durable_root'
+CONFIG_PEERS = 'peers'
+CONFIG_PEER_REPLICAS = 'peer_replicas'
+CONFIG_PEER_TIMEOUT = 'peer_timeout'
+CONFIG_STREAM_CHUNK_SIZE = 'stream_chunk_size'
+CONFIG_STREAM_CREDIT = 'stream_credit'
+CONFIG_CKPT_SERVICE_REPLICAS = 'ckpt_service_replicas'
+CONFIG_CKPT_SERVICE_LEASE_TTL = 'ckpt_service_lease_ttl'
+CONFIG_CKPT_SERVICE_TIMEOUT = 'ckpt_service_timeout'
+CONFIG_CKPT_SERVICE_KEEP_LAST = 'ckpt_service_keep_last'
+CONFIG_CKPT_SERVICE_JOB_QUOTA_BYTES = 'ckpt_service_job_quota_bytes'
+CONFIG_CKPT_SERVICE_JOB_TTL = 'ckpt_service_job_ttl'
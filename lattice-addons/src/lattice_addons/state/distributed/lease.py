@@ -0,0 +1 @@
+../../../../../lattice-ckpt/src/ckpt_server/lease.py
\ No newline at end of file
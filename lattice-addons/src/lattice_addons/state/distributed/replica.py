@@ -0,0 +1,177 @@
+from .lease import LeaseTable
+from .utils import RequestType, CheckpointMessage, CheckpointResponse
+from ...log import get_logger
+
+import argparse
+import threading
+import zmq
+
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = get_logger(__name__)
+
+ACK = b'ACK'
+# Chunks a client may send ahead of the acknowledgements
+STREAM_CREDIT = 8
+
+
+def _read_range(chunks: List[memoryview], offset: int, size: int) -> Any:
+    r""" Read a range of a checkpoint held as chunks, without copying it if it is within a chunk. """
+
+    pieces = []
+    for chunk in chunks:
+        if offset >= len(chunk):
+            offset -= len(chunk)
+            continue
+        pieces.append(chunk[offset:offset + size])
+        size -= len(pieces[-1])
+        offset = 0
+        if size <= 0:
+            break
+
+    if len(pieces) == 1:
+        return pieces[0]
+    return b''.join(pieces)
+
+
+class ReplicaStore():
+    r""" An in-memory checkpoint store holding the checkpoints of the ranks of a node and of its peers.
+
+    The store speaks the protocol of the checkpoint service, and keeps what is saved in memory until it is deleted. It
+    is meant to run on every node in a process outliving the training processes, e.g.
+    ``python -m lattice_addons.state.distributed.replica --port 5556``, so that restarted training processes, and
+    processes replacing failed peers, restore checkpoints from memory.
+
+    :param port: The port to listen on
+    :param context: The ZMQ context to use, or `None` to use the global context
+    """
+
+    def __init__(self, port: int, context: Optional[zmq.Context] = None) -> None:
+        self._context = context or zmq.Context.instance()
+        self._socket = self._context.socket(zmq.REP)
+        self._socket.bind(f'tcp://*:{port}')
+        self._thread: Optional[threading.Thread] = None
+
+        # job ID -> checkpoint UID -> checkpoint name -> chunks of the checkpoint, which are views of the received
+        # frames, so checkpoints are neither copied nor joined
+        self._checkpoints: Dict[str, Dict[str, Dict[str, List[memoryview]]]] = defaultdict(lambda: defaultdict(dict))
+        # (job ID, checkpoint UID, checkpoint name) -> chunks received by sequence number, until they are committed
+        self._uploads: Dict[Tuple[str, str, str], Dict[int, memoryview]] = {}
+        self._leases = LeaseTable()
+
+    def _handle(self, req: CheckpointResponse) -> CheckpointMessage:
+        checkpoints = self._checkpoints[req.job_id]
+        key = (req.job_id, req.uid, req.ckpt_name)
+
+        if req.req_type == RequestType.PING:
+            body = ACK
+        elif req.req_type == RequestType.LIST:
+            body = {uid: list(ckpts) for uid, ckpts in checkpoints.items() if not req.uid or uid == req.uid}
+        elif req.req_type == RequestType.EXISTS:
+            body = req.ckpt_name in checkpoints.get(req.uid, {})
+        elif req.req_type == RequestType.SAVE_CHUNK:
+            # Requests are handled in order, so the first chunk starts a new upload
+            if req.seq == 0:
+                self._uploads[key] = {}
+            self._uploads.setdefault(key, {})[req.seq] = req.body
+            body = {'credit': STREAM_CREDIT}
+        elif req.req_type == RequestType.SAVE:
+            if not isinstance(req.body, dict):
+                checkpoints[req.uid][req.ckpt_name] = [req.body]
+            else:
+                chunks = self._uploads.pop(key, {})
+                if not req.body.get('abort'):
+                    if sorted(chunks) != list(range(req.body['chunks'])):
+                        return CheckpointMessage(RequestType.ERROR, req.job_id, req.uid, req.ckpt_name,
+                                                 b'Incomplete checkpoint')
+                    with self._leases.fenced(req.job_id, req.uid, req.body.get('token')):
+                        checkpoints[req.uid][req.ckpt_name] = [chunks[i] for i in range(req.body['chunks'])]
+            body = ACK
+        elif req.req_type == RequestType.SAVE_MANY:
+            with self._leases.fenced(req.job_id, req.uid, req.body.get('token')):
+                for ckpt_name, data in zip(req.body['names'], req.attachments):
+                    checkpoints[req.uid][ckpt_name] = [data]
+            body = ACK
+        elif req.req_type == RequestType.LOAD_MANY:
+            # At least one first chunk is answered, however large it is
+            names, missing, attachments, nbytes = [], [], [], 0
+            for ckpt_name in req.body['names']:
+                if ckpt_name not in checkpoints.get(req.uid, {}):
+                    missing.append(ckpt_name)
+                elif not attachments or nbytes < req.body['max_bytes']:
+                    names.append(ckpt_name)
+                    attachments.append(_read_range(checkpoints[req.uid][ckpt_name], 0, req.body['chunk_size']))
+                    nbytes += len(attachments[-1])
+            return CheckpointMessage(req.req_type, req.job_id, req.uid, req.ckpt_name,
+                                     {'names': names, 'missing': missing}, attachments=attachments)
+        elif req.req_type in (RequestType.LOAD, RequestType.LOAD_CHUNK):
+            if req.ckpt_name not in checkpoints.get(req.uid, {}):
+                return CheckpointMessage(RequestType.ERROR, req.job_id, req.uid, req.ckpt_name,
+                                         b'Checkpoint not found')
+            chunks = checkpoints[req.uid][req.ckpt_name]
+            if req.req_type == RequestType.LOAD_CHUNK:
+                chunk_size = req.body['chunk_size']
+                body = _read_range(chunks, req.seq * chunk_size, chunk_size)
+            else:
+                body = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        elif req.req_type == RequestType.DEL:
+            self._uploads.pop(key, None)
+            checkpoints.get(req.uid, {}).pop(req.ckpt_name, None)
+            if not checkpoints.get(req.uid, True):
+                del checkpoints[req.uid]
+            self._leases.forget(req.job_id, req.uid)
+            body = ACK
+        elif req.req_type == RequestType.ACQUIRE:
+            body = self._leases.acquire(req.job_id, req.uid, req.ckpt_name, req.body)
+        elif req.req_type == RequestType.RELEASE:
+            body = req.body if isinstance(req.body, dict) else {}
+            self._leases.release(req.job_id, req.uid, req.ckpt_name, body.get('token'), body.get('committed', False))
+            body = ACK
+        elif req.req_type == RequestType.POLICY:
+            # Checkpoints are kept until they are deleted, so eviction policies do not apply
+            body = ACK
+        else:
+            return CheckpointMessage(RequestType.ERROR, req.job_id, req.uid, req.ckpt_name,
+                                     f'Unsupported request type {req.req_type}'.encode())
+
+        return CheckpointMessage(req.req_type, req.job_id, req.uid, req.ckpt_name, body, seq=req.seq)
+
+    def serve_forever(self) -> None:
+        r""" Handle requests until the store is closed. """
+
+        while True:
+            try:
+                req = CheckpointMessage.recv(self._socket)
+            except zmq.ContextTerminated:
+                return
+            except Exception as e:
+                logger.info(f'Unable to parse a request due to exception: {e}')
+                CheckpointMessage(RequestType.ERROR, '', '', '', str(e).encode()).send(self._socket)
+                continue
+
+            try:
+                response = self._handle(req)
+            except Exception as e:
+                logger.info(f'Unable to handle a request due to exception: {e}')
+                response = CheckpointMessage(RequestType.ERROR, '', '', '', str(e).encode())
+            response.send(self._socket)
+
+    def start(self) -> None:
+        r""" Handle requests in a background thread. """
+
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Hold checkpoints replicated from peers in memory')
+    parser.add_argument('--port', type=int, default=5556, help='The port to listen on')
+    args = parser.parse_args()
+
+    ReplicaStore(args.port).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
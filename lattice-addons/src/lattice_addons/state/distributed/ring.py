@@ -0,0 +1,52 @@
+import bisect
+import hashlib
+
+from typing import List, Sequence, Tuple
+
+
+def _hash(key: str) -> int:
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing():
+    r""" A consistent hash ring mapping keys to nodes.
+
+    Every node is placed on the ring at ``vnodes`` points, and a key is owned by the nodes of the points following its
+    hash. Adding or removing a node only moves the keys it owns, and every client maps a key to the same nodes.
+
+    :param nodes: The nodes, e.g. the endpoints of the instances of a service
+    :param vnodes: The number of points of every node on the ring, which spread the keys evenly
+    """
+
+    def __init__(self, nodes: Sequence[str], vnodes: int = 64) -> None:
+        if not nodes:
+            raise ValueError('A hash ring needs at least one node')
+
+        self._nodes = list(dict.fromkeys(nodes))
+        points: List[Tuple[int, str]] = sorted((_hash(f'{node}#{i}'), node) for node in self._nodes
+                                               for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._points = [node for _, node in points]
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._nodes)
+
+    def owners(self, key: str, count: int = 1) -> List[str]:
+        r""" Get the distinct nodes owning a key, the primary owner first.
+
+        :param key: The key
+        :param count: The number of owners, which is capped by the number of nodes
+        """
+
+        count = min(count, len(self._nodes))
+        retval: List[str] = []
+        i = bisect.bisect(self._hashes, _hash(key))
+        while len(retval) < count:
+            node = self._points[i % len(self._points)]
+            if node not in retval:
+                retval.append(node)
+            i += 1
+
+        return retval
@@ -1,8 +1,24 @@
-import dill
+import collections
+import functools
+import io
+import itertools
+import json
+import queue
+import struct
+import threading
+import time
+import weakref
+import zmq
 
-from dataclasses import dataclass
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple, Type, Union
+
+from ...log import get_logger
+
+logger = get_logger(__name__)
 
 
 class RequestType(Enum):
@@ -13,12 +29,17 @@ class RequestType(Enum):
     DEL = 4
     ACQUIRE = 5
     RELEASE = 6
+    SAVE_CHUNK = 7
+    LOAD_CHUNK = 8
+    SAVE_MANY = 9
+    LOAD_MANY = 10
+    EXISTS = 11
+    POLICY = 12
     ERROR = 101
 
 
 class RecvTimedOutException(Exception):
-    def __init__(self):
-        pass
+    pass
 
 
 @dataclass
@@ -28,30 +49,828 @@ class CheckpointResponse:
     uid: str
     ckpt_name: str
     body: Any
+    seq: int = 0
+    attachments: List[memoryview] = field(default_factory=list)
+
+
+# Wire format
+# -----------
+#
+# A message is sent as two ZMQ frames, a header frame and a body frame, which may be followed by attachment frames
+# carrying the checkpoints of batched requests. The header starts with a fixed part:
+#
+#   magic (2 bytes) | version (1 byte) | request type (1 byte) | body encoding (1 byte) | sequence number (4 bytes) |
+#   job ID length (2 bytes) | UID length (2 bytes) | checkpoint name length (2 bytes)
+#
+# in network byte order, followed by the UTF-8 encoded job ID, UID and checkpoint name. Binary bodies, e.g.
+# checkpoints, are sent as they are without being copied, and other bodies, e.g. listings, are encoded as JSON.
+# Messages sent over DEALER sockets are preceded by an empty delimiter frame, as REQ sockets do. Frames before the
+# delimiter, e.g. the correlation IDs of pipelined clients, are echoed in the responses.
+#
+# Large checkpoints are streamed in chunks numbered by the sequence number:
+#
+# - Saving: SAVE_CHUNK requests carry the chunks, and each is acknowledged with the number of chunks, i.e. credits,
+#   the sender may have unacknowledged. A SAVE request with a JSON body ``{"chunks": <count>}`` commits the checkpoint,
+#   and ``{"abort": true}`` discards the chunks. A SAVE request with a binary body saves a checkpoint at once.
+# - Loading: LOAD_CHUNK requests with a JSON body ``{"chunk_size": <bytes>}`` are answered with the chunk at the
+#   offset of the sequence number times the chunk size. The last chunk is shorter than the chunk size, possibly
+#   empty, and the receiver requests at most as many chunks ahead as it grants itself credits.
+#
+# Writers coordinate through leases on names within the checkpoints of a UID:
+#
+# - ACQUIRE requests with a JSON body identifying the holder, e.g. ``{"holder": <ID>, "ttl": <seconds>}``, are answered
+#   with the holder of the lease, along with its fencing token, whether it is committed and the seconds left. A lease
+#   is granted if it is free or expired, and renewed if the requester already holds it.
+# - RELEASE requests with a JSON body ``{"token": <token>, "committed": <bool>}`` release a lease. A committed lease is
+#   kept until the checkpoints of the UID are deleted, so that the writers waiting for it skip their writes.
+# - Commits with a JSON body including ``"token"`` are rejected if a larger token was committed with for the UID.
+#
+# Checkpoints of a UID are batched to save round trips:
+#
+# - SAVE_MANY requests with a JSON body ``{"names": [<name>, ...]}``, optionally including ``"token"``, carry the
+#   checkpoints as attachments in the order of their names, and save them at once.
+# - LOAD_MANY requests with a JSON body ``{"names": [<name>, ...], "chunk_size": <bytes>, "max_bytes": <bytes>}`` are
+#   answered with ``{"names": [<name>, ...], "missing": [<name>, ...]}`` and the first chunks of the checkpoints in
+#   ``"names"`` as attachments. Checkpoints which are neither answered nor missing did not fit in ``"max_bytes"``, and
+#   are loaded with LOAD_CHUNK requests, as are the following chunks of the answered ones.
+# - LIST requests with a UID only list the checkpoints of that UID, and EXISTS requests are answered with whether a
+#   checkpoint exists.
+#
+# Jobs set eviction policies of their own with POLICY requests with a JSON body
+# ``{"keep_last": <count>, "job_quota_bytes": <bytes>, "job_ttl": <seconds>}``, which are answered with ``ACK``. The
+# policies a job leaves out are the ones of the service.
+
+PROTOCOL_MAGIC = b'LC'
+PROTOCOL_VERSION = 2
+
+_HEADER = struct.Struct('!2sBBBIHHH')
+_BODY_RAW = 0
+_BODY_JSON = 1
+
+Frame = Union[bytes, memoryview, zmq.Frame]
+
+
+def _buffer(frame: Frame) -> memoryview:
+    return frame.buffer if isinstance(frame, zmq.Frame) else memoryview(frame)
 
 
 class CheckpointMessage():
-    def __init__(self, req_type: RequestType, job_id: str, uid: str, ckpt_name: str, body: bytes):
+    def __init__(self, req_type: RequestType, job_id: str, uid: str, ckpt_name: str, body: Any, seq: int = 0,
+                 attachments: Sequence[Any] = ()):
         self._req_type = req_type
         self._job_id = job_id
         self._uid = uid
         self._ckpt_name = ckpt_name
         self._body = body
+        self._seq = seq
+        self._attachments = list(attachments)
+
+    def encode_message(self) -> List[Frame]:
+        r""" Encode the message into a header frame, a body frame and the attachment frames. """
+
+        job_id, uid, ckpt_name = (s.encode() for s in (self._job_id, self._uid, self._ckpt_name))
+
+        if isinstance(self._body, (bytes, bytearray, memoryview)):
+            encoding, body = _BODY_RAW, self._body
+        else:
+            encoding, body = _BODY_JSON, json.dumps(self._body).encode()
+
+        header = _HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, self._req_type.value, encoding, self._seq,
+                              len(job_id), len(uid), len(ckpt_name)) + job_id + uid + ckpt_name
+        return [header, body, *self._attachments]
+
+    @staticmethod
+    def parse_message(frames: Sequence[Frame]) -> CheckpointResponse:
+        r""" Parse a message from its header frame, body frame and attachment frames.
+
+        The body of a binary message and the attachments are views of the frames, so they are not copied.
+
+        :raises ValueError: The message is malformed or uses another version of the protocol
+        """
+
+        if len(frames) < 2:
+            raise ValueError(f'Expected at least 2 frames, but got {len(frames)}')
+
+        header = _buffer(frames[0])
+        if len(header) < _HEADER.size:
+            raise ValueError('Truncated message header')
+        magic, version, req_type, encoding, seq, *lengths = _HEADER.unpack_from(header)
+        if magic != PROTOCOL_MAGIC:
+            raise ValueError('Invalid message header')
+        if version != PROTOCOL_VERSION:
+            raise ValueError(f'Unsupported protocol version {version}')
+        if _HEADER.size + sum(lengths) != len(header):
+            raise ValueError('Invalid message header length')
+
+        fields = []
+        offset = _HEADER.size
+        for length in lengths:
+            fields.append(bytes(header[offset:offset + length]).decode())
+            offset += length
+
+        body: Any = _buffer(frames[1])
+        if encoding == _BODY_JSON:
+            body = json.loads(bytes(body))
+        elif encoding != _BODY_RAW:
+            raise ValueError(f'Invalid body encoding {encoding}')
 
-    def encode_message(self):
-        bytes_to_send = {
-            'type': self._req_type.value,
-            'job_id': self._job_id,
-            'uid': self._uid,
-            'ckpt_name': self._ckpt_name,
-            'body': self._body
-        }
+        return CheckpointResponse(RequestType(req_type), *fields, body, seq,
+                                  [_buffer(frame) for frame in frames[2:]])
 
-        return dill.dumps(bytes_to_send)
+    def send(self, socket: zmq.Socket) -> None:
+        r""" Send the message without copying its body. """
+
+        frames = self.encode_message()
+        if socket.socket_type == zmq.DEALER:
+            frames.insert(0, b'')
+        socket.send_multipart(frames, copy=False)
 
     @staticmethod
-    def parse_message(message):
-        decoded_message = dill.loads(message)
+    def recv(socket: zmq.Socket) -> CheckpointResponse:
+        r""" Receive a message without copying its body. """
+
+        frames = socket.recv_multipart(copy=False)
+        # Header frames are never empty
+        if len(frames) > 2 and len(frames[0]) == 0:
+            frames = frames[1:]
+        return CheckpointMessage.parse_message(frames)
+
+
+class CheckpointClient():
+    r""" A pipelined client of the checkpoint service, which can be shared by threads.
+
+    Requests are sent without waiting for the responses to the previous ones, and are answered with futures. Every
+    request carries a correlation ID in its envelope, which the service echoes, so responses are matched with their
+    requests in whatever order they arrive, and responses arriving after their requests timed out are dropped. The
+    socket is owned by a background thread, since ZMQ sockets can not be shared by threads.
+
+    :param endpoint: The endpoint of the service, e.g. ``tcp://host:5555``
+    :param context: The ZMQ context to use, or `None` to use the global context
+    :param timeout: The seconds after which requests fail with :class:`RecvTimedOutException`, or `None` to wait
+        forever
+    """
+
+    def __init__(self, endpoint: str, context: Optional[zmq.Context] = None, timeout: Optional[float] = None) -> None:
+        self._endpoint = endpoint
+        self._timeout = timeout
+        self._ids = itertools.count()
+
+        context = context or zmq.Context.instance()
+        # Requests are handed over to the background thread, which is woken up through a pair of sockets
+        self._outbox: queue.Queue = queue.Queue()
+        wake_endpoint = f'inproc://lattice-checkpoint-client-{id(self)}'
+        wake_recv = context.socket(zmq.PAIR)
+        wake_recv.bind(wake_endpoint)
+        self._wake = context.socket(zmq.PAIR)
+        self._wake.connect(wake_endpoint)
+        self._wake_lock = threading.Lock()
+
+        socket = context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(endpoint)
+
+        # The thread does not refer to the client, so that the client is closed when it is no longer used
+        thread = threading.Thread(target=_serve_client, args=(socket, wake_recv, self._outbox))
+        thread.daemon = True
+        thread.start()
+        self._finalizer = weakref.finalize(self, _close_client, self._outbox, self._wake, self._wake_lock, thread)
+
+    def __str__(self) -> str:
+        return f'{self.__class__.__name__}:{self._endpoint}'
+
+    def request(self, msg: CheckpointMessage, timeout: Optional[float] = -1) -> Future:
+        r""" Send a request without waiting for the response.
+
+        :param msg: The request
+        :param timeout: The seconds after which the request fails, `None` to wait forever, or the default of the client
+        :return: A future of the :class:`CheckpointResponse`
+        """
+
+        if not self._finalizer.alive:
+            raise RuntimeError(f'{self} is closed')
+
+        timeout = self._timeout if timeout == -1 else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        future: Future = Future()
+        self._outbox.put((next(self._ids).to_bytes(8, 'big'), msg.encode_message(), deadline, future))
+        with self._wake_lock:
+            self._wake.send(b'', copy=False)
+        return future
+
+    def close(self) -> None:
+        r""" Close the client, failing the requests which are not answered yet. """
+
+        self._finalizer()
+
+    def __enter__(self) -> 'CheckpointClient':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _serve_client(socket: zmq.Socket, wake: zmq.Socket, outbox: queue.Queue) -> None:
+    # Correlation ID -> (deadline, future) of the requests which are not answered yet
+    pending: Dict[bytes, Tuple[Optional[float], Future]] = {}
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    poller.register(wake, zmq.POLLIN)
+
+    closed = False
+    while not closed:
+        deadlines = [deadline for deadline, _ in pending.values() if deadline is not None]
+        timeout = None if not deadlines else max(0, int((min(deadlines) - time.monotonic()) * 1000) + 1)
+        events = dict(poller.poll(timeout))
+
+        if wake in events:
+            while wake.poll(0):
+                wake.recv()
+            while not outbox.empty():
+                item = outbox.get()
+                if item is None:
+                    closed = True
+                    break
+                corr_id, frames, deadline, future = item
+                pending[corr_id] = (deadline, future)
+                socket.send_multipart([corr_id, b''] + frames, copy=False)
+
+        while socket.poll(0):
+            frames = socket.recv_multipart(copy=False)
+            # Responses to requests which timed out are dropped
+            _, future = pending.pop(frames[0].bytes, (None, None))
+            if future is None:
+                continue
+            try:
+                future.set_result(CheckpointMessage.parse_message(frames[2:]))
+            except Exception as e:
+                future.set_exception(e)
+
+        now = time.monotonic()
+        for corr_id, (deadline, future) in list(pending.items()):
+            if deadline is not None and deadline <= now:
+                del pending[corr_id]
+                future.set_exception(RecvTimedOutException(f'Request {corr_id.hex()} timed out'))
+
+    futures = [future for _, future in pending.values()]
+    while not outbox.empty():
+        item = outbox.get()
+        if item is not None:
+            futures.append(item[-1])
+    for future in futures:
+        future.set_exception(RuntimeError('The client is closed'))
+    socket.close()
+    wake.close()
+
+
+def _close_client(outbox: queue.Queue, wake: zmq.Socket, wake_lock: threading.Lock, thread: threading.Thread) -> None:
+    outbox.put(None)
+    with wake_lock:
+        wake.send(b'', copy=False)
+        wake.close()
+    if thread is not threading.current_thread():
+        thread.join()
+
+
+# Where requests are sent, either a socket or a pipelined client
+Connection = Union[zmq.Socket, CheckpointClient]
+
+
+class _Requests():
+    r""" The outstanding requests of a transfer over a connection.
+
+    Over a socket, responses are received as they arrive. Over a client, they are received in the order of their
+    requests, and the futures of the requests may be handed over, e.g. to be waited for after the transfer.
+    """
+
+    def __init__(self, conn: Connection, timeout: Optional[float] = -1) -> None:
+        self._conn = conn
+        self._timeout = timeout
+        self._futures: Deque[Future] = collections.deque()
+
+    @property
+    def pipelined(self) -> bool:
+        return isinstance(self._conn, CheckpointClient)
+
+    def max_credit(self, credit: int) -> int:
+        # REQ sockets only allow one outstanding request
+        if not self.pipelined and self._conn.socket_type == zmq.REQ:
+            return 1
+        return credit
+
+    def send(self, msg: CheckpointMessage) -> None:
+        if isinstance(self._conn, CheckpointClient):
+            self._futures.append(self._conn.request(msg, self._timeout))
+        else:
+            msg.send(self._conn)
+
+    def adopt(self, future: Future) -> None:
+        r""" Add the future of a request sent ahead, e.g. a prefetched chunk. """
+
+        self._futures.append(future)
+
+    def detach(self) -> Future:
+        r""" Hand over the future of the earliest outstanding request. """
+
+        return self._futures.popleft()
+
+    def recv(self) -> CheckpointResponse:
+        if isinstance(self._conn, CheckpointClient):
+            return self._futures.popleft().result()
+        return CheckpointMessage.recv(self._conn)
+
+
+def request(conn: Connection, msg: CheckpointMessage, timeout: Optional[float] = -1) -> CheckpointResponse:
+    r""" Send a request and wait for the response.
+
+    :param conn: A socket, or a client of the checkpoint service
+    :param msg: The request
+    :param timeout: The seconds after which a request sent by a client fails, `None` to wait forever, or the default of
+        the client
+    """
+
+    requests = _Requests(conn, timeout)
+    requests.send(msg)
+    return requests.recv()
+
+
+def _raise_on_error(response: CheckpointResponse) -> CheckpointResponse:
+    if response.req_type == RequestType.ERROR:
+        raise Exception(bytes(response.body).decode(errors='replace'))
+    return response
+
+
+_BatchKey = Tuple[int, str, str, Optional[int]]
+
+
+class _Batch():
+    r""" Checkpoints not larger than a chunk, which are saved with a SAVE_MANY request per connection and UID.
+
+    A request is sent once the checkpoints of a connection and UID add up to ``max_bytes``, and the remaining ones are
+    sent when the batch is flushed. Requests sent over clients are only waited for when the batch is flushed.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        # (connection ID, job ID, UID, fencing token) -> connection, names, checkpoints and their bytes
+        self._pending: Dict[_BatchKey, Tuple[Connection, List[str], List[Any], List[int]]] = {}
+        # Names and requests of the batches sent over clients
+        self._sent: List[Tuple[List[str], _Requests]] = []
+
+    def add(self, conn: Connection, job_id: str, uid: str, ckpt_name: str, data: Any, token: Optional[int]) -> None:
+        key = (id(conn), job_id, uid, token)
+        _, names, ckpts, nbytes = self._pending.setdefault(key, (conn, [], [], [0]))
+        names.append(ckpt_name)
+        ckpts.append(data)
+        nbytes[0] += len(data)
+        if nbytes[0] >= self._max_bytes:
+            self._send(key)
+
+    def _send(self, key: _BatchKey) -> None:
+        _, job_id, uid, token = key
+        conn, names, ckpts, _ = self._pending.pop(key)
+        body: Dict[str, Any] = {'names': names}
+        if token is not None:
+            body['token'] = token
+
+        requests = _Requests(conn)
+        requests.send(CheckpointMessage(RequestType.SAVE_MANY, job_id, uid, '', body, attachments=ckpts))
+        if requests.pipelined:
+            self._sent.append((names, requests))
+        else:
+            try:
+                _raise_on_error(requests.recv())
+            except Exception as e:
+                raise Exception(f'Unable to save {names} due to: {e}')
+
+    def flush(self) -> None:
+        r""" Send the remaining checkpoints, and wait for all of them to be saved.
+
+        :raises Exception: A batch was not saved, which is raised after all the batches finish
+        """
+
+        error: Optional[Exception] = None
+        for key in list(self._pending):
+            try:
+                self._send(key)
+            except Exception as e:
+                error = error or e
+
+        for names, requests in self._sent:
+            try:
+                _raise_on_error(requests.recv())
+            except Exception as e:
+                error = error or Exception(f'Unable to save {names} due to: {e}')
+        self._sent.clear()
+        if error is not None:
+            raise error
+
+
+class _ServiceStreamWriter(io.RawIOBase):
+    r""" A binary stream sending what is written to the checkpoint service in chunks.
+
+    At most as many chunks as the service grants credits for are unacknowledged, so neither side buffers more than a
+    few chunks and the memory usage does not depend on the checkpoint size. Checkpoints not larger than a chunk are
+    added to the batch if there is one, and are otherwise saved with a single request, unless they are committed with
+    a fencing token.
+    """
+
+    def __init__(self, conn: Connection, job_id: str, uid: str, ckpt_name: str, chunk_size: int, credit: int,
+                 token: Optional[int] = None, commits: Optional[List[Tuple[str, Future]]] = None,
+                 batch: Optional[_Batch] = None) -> None:
+        super().__init__()
+        self._conn = conn
+        self._requests = _Requests(conn)
+        self._job_id = job_id
+        self._uid = uid
+        self._ckpt_name = ckpt_name
+        self._chunk_size = chunk_size
+        self._max_credit = self._requests.max_credit(credit)
+        self._token = token
+        # Where the commit is handed over to without waiting for it, if it is pipelined
+        self._commits = commits if self._requests.pipelined else None
+        self._batch = batch
+
+        self._buffer = bytearray()
+        self._seq = 0
+        self._unacked = 0
+        # Until the service grants credits, only the first chunk is sent
+        self._credit = 1
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Any) -> int:
+        with memoryview(b) as view:
+            self._buffer += view
+            nbytes = view.nbytes
+
+        # A full chunk is only sent when more data follows, so that small checkpoints are saved at once on close
+        while len(self._buffer) > self._chunk_size:
+            self._send_chunk(bytes(self._buffer[:self._chunk_size]))
+            del self._buffer[:self._chunk_size]
+
+        return nbytes
+
+    def _request(self, body: Any) -> CheckpointResponse:
+        self._requests.send(CheckpointMessage(RequestType.SAVE, self._job_id, self._uid, self._ckpt_name, body))
+        return _raise_on_error(self._requests.recv())
+
+    def _commit(self, body: Any) -> None:
+        if self._commits is None:
+            self._request(body)
+            return
+
+        self._requests.send(CheckpointMessage(RequestType.SAVE, self._job_id, self._uid, self._ckpt_name, body))
+        self._commits.append((self._ckpt_name, self._requests.detach()))
+
+    def _send_chunk(self, data: bytes) -> None:
+        while self._unacked >= self._credit:
+            self._recv_ack()
+
+        self._requests.send(CheckpointMessage(RequestType.SAVE_CHUNK, self._job_id, self._uid, self._ckpt_name, data,
+                                              seq=self._seq))
+        self._seq += 1
+        self._unacked += 1
+
+    def _recv_ack(self) -> None:
+        response = self._requests.recv()
+        self._unacked -= 1
+        _raise_on_error(response)
+        self._credit = max(1, min(self._max_credit, response.body['credit']))
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        try:
+            if self._seq == 0 and self._batch is not None:
+                # The buffer is replaced below, so it is handed over without being copied
+                self._batch.add(self._conn, self._job_id, self._uid, self._ckpt_name, self._buffer, self._token)
+            elif self._seq == 0 and self._token is None:
+                self._commit(bytes(self._buffer))
+            else:
+                if self._buffer or self._seq == 0:
+                    self._send_chunk(bytes(self._buffer))
+                while self._unacked:
+                    self._recv_ack()
+                commit: Dict[str, Any] = {'chunks': self._seq}
+                if self._token is not None:
+                    commit['token'] = self._token
+                self._commit(commit)
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+    def abort(self) -> None:
+        r""" Abort the transfer, so that the checkpoint is not created. """
+
+        try:
+            while self._unacked:
+                self._unacked -= 1
+                self._requests.recv()
+            if self._seq > 0:
+                self._request({'abort': True})
+        except Exception as e:
+            logger.info(f'Unable to abort the transfer of {self._ckpt_name} due to: {e}')
+        self._seq = 0
+        super().close()
+
+
+class _ServiceStreamReader(io.RawIOBase):
+    r""" A binary stream receiving a checkpoint from the checkpoint service in chunks.
+
+    The first chunk is requested alone, unless it was prefetched, and the following chunks are requested ahead while
+    they are read, at most ``credit`` at a time, so the memory usage does not depend on the checkpoint size.
+    """
+
+    def __init__(self, conn: Connection, job_id: str, uid: str, ckpt_name: str, chunk_size: int, credit: int,
+                 prefetched: Optional[Future] = None) -> None:
+        super().__init__()
+        self._requests = _Requests(conn)
+        self._job_id = job_id
+        self._uid = uid
+        self._ckpt_name = ckpt_name
+        self._chunk_size = chunk_size
+        self._max_credit = self._requests.max_credit(credit)
+
+        # Received chunks by sequence number, since chunks may be answered out of order
+        self._chunks: Dict[int, memoryview] = {}
+        self._chunk = memoryview(b'')
+        self._next_request = 0
+        self._next_read = 0
+        self._outstanding = 0
+        self._last: Optional[int] = None
+
+        # Fail early if the checkpoint does not exist
+        if prefetched is None:
+            self._request()
+        else:
+            self._requests.adopt(prefetched)
+            self._next_request += 1
+            self._outstanding += 1
+        self._recv()
+
+    def readable(self) -> bool:
+        return True
+
+    def _request(self) -> None:
+        self._requests.send(_load_chunk_request(self._job_id, self._uid, self._ckpt_name, self._chunk_size,
+                                                self._next_request))
+        self._next_request += 1
+        self._outstanding += 1
+
+    def _recv(self) -> None:
+        response = self._requests.recv()
+        self._outstanding -= 1
+        _raise_on_error(response)
+
+        if self._last is None or response.seq <= self._last:
+            self._chunks[response.seq] = response.body
+        if len(response.body) < self._chunk_size:
+            self._last = response.seq if self._last is None else min(self._last, response.seq)
+
+    def readinto(self, b: Any) -> int:
+        while not self._chunk:
+            if self._last is not None and self._next_read > self._last:
+                return 0
+            while self._next_read not in self._chunks:
+                self._recv()
+            self._chunk = memoryview(self._chunks.pop(self._next_read))
+            self._next_read += 1
+
+            while self._last is None and self._outstanding < self._max_credit:
+                self._request()
+
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self) -> None:
+        # Drain the chunks requested beyond the end, so that the socket can be reused
+        try:
+            while self._outstanding:
+                self._outstanding -= 1
+                self._requests.recv()
+        except Exception as e:
+            logger.info(f'Unable to drain the transfer of {self._ckpt_name} due to: {e}')
+        self._chunks.clear()
+        super().close()
+
+
+def _load_chunk_request(job_id: str, uid: str, ckpt_name: str, chunk_size: int, seq: int) -> CheckpointMessage:
+    return CheckpointMessage(RequestType.LOAD_CHUNK, job_id, uid, ckpt_name, {'chunk_size': chunk_size}, seq=seq)
+
+
+def _forward(target: Future, source: Future) -> None:
+    try:
+        target.set_result(source.result())
+    except Exception as e:
+        target.set_exception(e)
+
+
+def _request_into(client: CheckpointClient, msg: CheckpointMessage, target: Future) -> None:
+    try:
+        client.request(msg).add_done_callback(functools.partial(_forward, target))
+    except Exception as e:
+        target.set_exception(e)
+
+
+def _split_prefetched(client: CheckpointClient, job_id: str, uid: str, chunk_size: int, futures: Dict[str, Future],
+                      batch: Future) -> None:
+    r""" Hand the first chunks answered by a LOAD_MANY request over to the futures of their checkpoints.
+
+    The first chunks of the checkpoints which did not fit in the response are requested by themselves, as are all of
+    them if the service does not batch loads.
+    """
+
+    try:
+        response = batch.result()
+    except Exception as e:
+        for future in futures.values():
+            future.set_exception(e)
+        return
+
+    chunks: Dict[str, memoryview] = {}
+    missing: Sequence[str] = ()
+    if response.req_type == RequestType.LOAD_MANY:
+        chunks = dict(zip(response.body['names'], response.attachments))
+        missing = response.body['missing']
+    else:
+        logger.debug(f'Unable to batch loads of {uid} due to: {bytes(response.body).decode(errors="replace")}')
+
+    for ckpt_name, future in futures.items():
+        if ckpt_name in chunks:
+            future.set_result(CheckpointResponse(RequestType.LOAD_CHUNK, job_id, uid, ckpt_name, chunks[ckpt_name]))
+        elif ckpt_name in missing:
+            future.set_result(CheckpointResponse(RequestType.ERROR, job_id, uid, ckpt_name, b'Checkpoint not found'))
+        else:
+            _request_into(client, _load_chunk_request(job_id, uid, ckpt_name, chunk_size, 0), future)
+
+
+class CheckpointStream():
+    r""" Stream checkpoints to and from the checkpoint service in chunks. """
+
+    # Default settings of streaming transfers
+    chunk_size: int = 4 * 1024 * 1024
+    credit: int = 4
+    # The settings of the streaming transfers of the current thread, the fencing token of the lease held by it, the
+    # commits pipelined by it, the checkpoints batched by it and the chunks prefetched by it
+    _local = threading.local()
+
+    @classmethod
+    @contextmanager
+    def configured(cls: Type, chunk_size: int, credit: int) -> Iterator[None]:
+        r""" Configure the streaming transfers of the current thread.
+
+        Managers configure the transfers of the handlers they invoke, so managers with different configs in a process
+        do not affect each other.
+
+        :param chunk_size: The size of the chunks in bytes
+        :param credit: The maximum number of chunks requested ahead when loading, and unacknowledged when saving
+        """
+
+        previous = getattr(cls._local, 'settings', None)
+        cls._local.settings = (chunk_size, credit)
+        try:
+            yield
+        finally:
+            cls._local.settings = previous
+
+    @classmethod
+    def _settings(cls: Type) -> Tuple[int, int]:
+        settings = getattr(cls._local, 'settings', None)
+        return settings if settings is not None else (cls.chunk_size, cls.credit)
+
+    @classmethod
+    @contextmanager
+    def open_writer(cls: Type, conn: Connection, job_id: str, uid: str, ckpt_name: str) -> Iterator[io.RawIOBase]:
+        r""" Open a binary stream which sends a checkpoint as it is written.
+
+        The checkpoint is created when the stream is closed on exit, and it is not created if there is an exception.
+        """
+
+        writer = _ServiceStreamWriter(conn, job_id, uid, ckpt_name, *cls._settings(),
+                                      getattr(cls._local, 'token', None), getattr(cls._local, 'commits', None),
+                                      getattr(cls._local, 'batch', None))
+        try:
+            yield writer
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+
+    @classmethod
+    @contextmanager
+    def fenced(cls: Type, token: Optional[int]) -> Iterator[None]:
+        r""" Commit the checkpoints written by the current thread with the fencing token of a lease.
+
+        The service rejects the commits once a writer with a newer lease committed to the same UID, so a writer whose
+        lease expired meanwhile does not overwrite what the writer taking over saved.
+
+        :param token: The fencing token, or `None` to commit without one
+        """
+
+        previous = getattr(cls._local, 'token', None)
+        cls._local.token = token
+        try:
+            yield
+        finally:
+            cls._local.token = previous
+
+    @classmethod
+    @contextmanager
+    def pipelined(cls: Type) -> Iterator[None]:
+        r""" Pipeline the checkpoints written by the current thread over clients.
+
+        Writers do not wait for their commits to be acknowledged, so the following checkpoints are sent meanwhile, and
+        the acknowledgements are waited for on exit.
+
+        :raises Exception: A checkpoint was not committed, which is raised after all the commits finish
+        """
+
+        previous = getattr(cls._local, 'commits', None)
+        commits: List[Tuple[str, Future]] = []
+        cls._local.commits = commits
+        try:
+            yield
+        finally:
+            cls._local.commits = previous
+
+        error: Optional[Exception] = None
+        for ckpt_name, future in commits:
+            try:
+                _raise_on_error(future.result())
+            except Exception as e:
+                error = error or Exception(f'Unable to commit {ckpt_name} due to: {e}')
+        if error is not None:
+            raise error
+
+    @classmethod
+    @contextmanager
+    def batched(cls: Type) -> Iterator[None]:
+        r""" Batch the checkpoints not larger than a chunk written by the current thread.
+
+        The checkpoints of a UID are saved with a request per chunk size worth of them, rather than a request each.
+        They are only created once they are sent, at the latest on exit, and the ones not sent yet are dropped if there
+        is an exception.
+
+        :raises Exception: A batch was not saved, which is raised after all the batches finish
+        """
+
+        previous = getattr(cls._local, 'batch', None)
+        chunk_size, _ = cls._settings()
+        batch = _Batch(chunk_size)
+        cls._local.batch = batch
+        try:
+            yield
+        finally:
+            cls._local.batch = previous
+
+        batch.flush()
+
+    @classmethod
+    @contextmanager
+    def prefetched(cls: Type, client: CheckpointClient, names: Sequence[Tuple[str, str, str]]) -> Iterator[None]:
+        r""" Request the first chunks of checkpoints at once, which readers opened by the current thread pick up.
+
+        The first chunks of the checkpoints of a UID are requested with a single request, whose response holds at most
+        ``credit`` chunks worth of them, and the ones which did not fit are requested by themselves.
+
+        :param client: The client to request the chunks with
+        :param names: The job IDs, UIDs and names of the checkpoints
+        """
+
+        ckpt_names: Dict[Tuple[str, str], List[str]] = {}
+        for job_id, uid, ckpt_name in names:
+            ckpt_names.setdefault((job_id, uid), []).append(ckpt_name)
+
+        chunk_size, credit = cls._settings()
+        prefetched: Dict[Tuple[int, str, str, str], Future] = {}
+        for (job_id, uid), group in ckpt_names.items():
+            futures = {ckpt_name: Future() for ckpt_name in group}
+            body = {'names': list(futures), 'chunk_size': chunk_size, 'max_bytes': chunk_size * credit}
+            batch = client.request(CheckpointMessage(RequestType.LOAD_MANY, job_id, uid, '', body))
+            batch.add_done_callback(functools.partial(_split_prefetched, client, job_id, uid, chunk_size, futures))
+            prefetched.update({(id(client), job_id, uid, ckpt_name): future for ckpt_name, future in futures.items()})
+
+        previous = getattr(cls._local, 'prefetched', None)
+        cls._local.prefetched = prefetched
+        try:
+            yield
+        finally:
+            cls._local.prefetched = previous
+
+    @classmethod
+    @contextmanager
+    def open_reader(cls: Type, conn: Connection, job_id: str, uid: str,
+                    ckpt_name: str) -> Iterator[io.BufferedReader]:
+        r""" Open a binary stream which receives a checkpoint as it is read. """
 
-        return CheckpointResponse(RequestType(decoded_message['type']), decoded_message['job_id'],
-                                  decoded_message['uid'], decoded_message['ckpt_name'], decoded_message['body'])
+        prefetched = (getattr(cls._local, 'prefetched', None) or {}).pop((id(conn), job_id, uid, ckpt_name), None)
+        reader = _ServiceStreamReader(conn, job_id, uid, ckpt_name, *cls._settings(), prefetched)
+        with io.BufferedReader(reader) as f:
+            yield f
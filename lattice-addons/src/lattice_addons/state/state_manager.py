@@ -3,7 +3,7 @@ from .ckpt_manager import (
     CheckpointSetting, CheckpointCollectionSetting
 )
 from .constants import (
-    CONFIG_ATEXIT_SAVING, CONFIG_PERIODIC_SAVING, CONFIG_PERIODIC_SAVING_INTERVAL
+    CONFIG_ATEXIT_SAVING, CONFIG_PERIODIC_SAVING, CONFIG_PERIODIC_SAVING_INTERVAL, CONFIG_MAX_INFLIGHT_SAVES
 )
 from .util import _UIDSingletonABC, _Singleton
 from ..log import get_logger
@@ -16,8 +16,8 @@ import sys
 import atexit
 import signal
 import inspect
+import queue
 import threading
-import time
 from collections import defaultdict
 from typing import Any, Optional, Type, Dict, DefaultDict, Callable, List
 
@@ -299,6 +299,66 @@ class StateClosureManager(BaseStateManager):
 StateManagerGroupCheckpointUID = 'smg'
 
 
+class _AsyncCheckpointWriter():
+    r""" A background writer that saves snapshots of states with a checkpoint collection manager.
+
+    Snapshots are serialized and written by a dedicated thread, so the thread taking a snapshot does not wait for the
+    checkpoint I/O. At most ``max_inflight`` snapshots can be queued or being written at the same time.
+
+    :param ckpt_mgr: The checkpoint collection manager used to write snapshots
+    :param max_inflight: The maximum number of in-flight snapshots
+    """
+
+    def __init__(self, ckpt_mgr: BaseCheckpointCollectionManager, max_inflight: int) -> None:
+        self._ckpt_mgr = ckpt_mgr
+        self._slots = threading.Semaphore(max_inflight)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread()
+
+    def _ensure_started(self) -> None:
+        # The writer thread does not survive a fork, so (re)start it lazily
+        if not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            states = self._queue.get()
+            try:
+                self._ckpt_mgr.save(states)
+                self._ckpt_mgr.release()
+            except Exception as e:
+                logger.info(f'Unable to save states asynchronously due to exception: {e}')
+            finally:
+                self._slots.release()
+                self._queue.task_done()
+
+    def submit(self, snapshot: Callable[[], Dict[str, State]]) -> bool:
+        r""" Take a snapshot and queue it for writing.
+
+        Block until an in-flight slot is available before taking the snapshot, so that no more than ``max_inflight``
+        snapshots are held in memory.
+
+        :param snapshot: A function returning the states to write
+        :return: `True` if a snapshot is queued, `False` if the snapshot is empty
+        """
+
+        self._slots.acquire()
+        states = snapshot()
+        if not states:
+            self._slots.release()
+            return False
+
+        self._ensure_started()
+        self._queue.put(states)
+        return True
+
+    def wait(self) -> None:
+        r""" Block until all queued snapshots are written. """
+        self._queue.join()
+
+
 class StateManagerGroup(metaclass=_Singleton):
     r""" A group of active state managers.
 
@@ -310,15 +370,19 @@ class StateManagerGroup(metaclass=_Singleton):
 
         self._states: Dict[str, BaseStateManager]
         self._key_history: DefaultDict[str, int]
+        # Keys whose states were loaded when they were registered, all from the collection pinned by the manager
+        self._loaded_keys: List[str]
         self._reset()
 
         self._ckpt_mgr: BaseCheckpointCollectionManager
         self._register_ckpt()
         self.ckpt_configs = self._ckpt_mgr.get_configs()
 
+        self._writer = _AsyncCheckpointWriter(self._ckpt_mgr, self.ckpt_configs[CONFIG_MAX_INFLIGHT_SAVES])
         self._register_cleanup()
 
         self._lock = threading.Lock()
+        self._priodic_saving_stopped = threading.Event()
         self._priodic_saving_thread = threading.Thread()
         self._register_periodic_saving()
 
@@ -334,8 +398,7 @@ class StateManagerGroup(metaclass=_Singleton):
         return timer
 
     def _priodic_saving(self, interval: float) -> None:
-        while True:
-            time.sleep(interval)
+        while not self._priodic_saving_stopped.wait(interval):
             logger.debug('Periodic saving started')
             self.async_save()
             logger.debug('Periodic saving finished')
@@ -359,10 +422,16 @@ class StateManagerGroup(metaclass=_Singleton):
 
         def exit_handler():
             if self.ckpt_configs[CONFIG_ATEXIT_SAVING]:
-                self.save()
+                self.flush()
                 self._ckpt_mgr.release()
+            else:
+                # Do not lose in-flight asynchronous saves
+                self.wait()
+            # Some checkpoint managers keep writing checkpoints in the background, e.g. to a durable tier
+            self._ckpt_mgr.wait()
 
         atexit.register(exit_handler)
+        self._exit_handler = exit_handler
 
         current_handler = signal.getsignal(signal.SIGTERM)
 
@@ -373,9 +442,18 @@ class StateManagerGroup(metaclass=_Singleton):
 
         signal.signal(signal.SIGTERM, handler)
 
+    def _close(self) -> None:
+        # Called when the singleton is reset, so that a dropped group neither keeps saving nor runs at exit
+        self._priodic_saving_stopped.set()
+        if self._priodic_saving_thread.is_alive():
+            self._priodic_saving_thread.join()
+        atexit.unregister(self._exit_handler)
+        self.wait()
+
     def _reset(self) -> None:
         self._states = {}
         self._key_history = defaultdict(int)
+        self._loaded_keys = []
 
     def _register_ckpt(self):
         settings = CheckpointCollectionSetting()
@@ -407,14 +485,23 @@ class StateManagerGroup(metaclass=_Singleton):
         if not isinstance(mgr, BaseStateManager):
             raise TypeError(f"The type for state manger is not valid {type(mgr)}")
 
-        if auto_load:
-            states = self._ckpt_mgr.load()
-            if states is not None:
-                state = states.get(key, None)
-                if state is not None:
-                    mgr._load_impl(state)
-
         self._states[key] = mgr
+        if auto_load:
+            self._auto_load(key)
+
+    def _auto_load(self, key: str) -> None:
+        # Only load the object of this key instead of the whole collection, from the collection the states registered
+        # earlier were loaded from
+        pinned = self._ckpt_mgr.pinned
+        states = self._ckpt_mgr.load_keys([key])
+        if self._loaded_keys and self._ckpt_mgr.pinned != pinned:
+            # The collection failed validation, so the group resumes from an older one as a whole
+            logger.info(f'Reload {self._loaded_keys} from checkpoint {self._ckpt_mgr.pinned}')
+            states = self._ckpt_mgr.load_keys(self._loaded_keys + [key])
+
+        for k, state in (states or {}).items():
+            self._states[k]._load_impl(state)
+        self._loaded_keys.append(key)
 
     def list(self) -> List[str]:
         r"""
@@ -449,26 +536,44 @@ class StateManagerGroup(metaclass=_Singleton):
         return self._states[key].get()
 
     def save(self) -> None:
-        r""" Save managed states using the configured checkpoint manager in a lockstep. """
+        r""" Save managed states using the configured checkpoint manager in a lockstep.
 
+        Pending asynchronous saves are written before these states.
+        """
+
+        self.wait()
         states = self._get_states()
         if states:
             self._ckpt_mgr.save(states)
 
     def async_save(self) -> None:
-        r""" Save managed states asynchronously using the configured checkpoint manager in a lockstep. """
-        self._acquire()
-        states = self._get_states(deep_copy=True)
-        self._release()
-        if states:
-            logger.debug('Saving all the states')
-            self._ckpt_mgr_save(states)
+        r""" Save managed states asynchronously using the configured checkpoint manager in a lockstep.
+
+        Only a snapshot of the states is taken in the calling thread, and the snapshot is written by a background
+        writer. Block if there are already ``max_inflight_saves`` snapshots being written.
+        """
+
+        def snapshot() -> Dict[str, State]:
+            self._acquire()
+            try:
+                return self._get_states(deep_copy=True)
+            finally:
+                self._release()
+
+        if self._writer.submit(snapshot):
+            logger.debug('Queued a snapshot of all the states for saving')
         else:
             logger.debug('There are no states to save')
 
-    def _ckpt_mgr_save(self, states: Dict[str, State]) -> None:
-        self._ckpt_mgr.save(states)
-        self._ckpt_mgr.release()
+    def wait(self) -> None:
+        r""" Block until all the asynchronous saves are written. """
+
+        self._writer.wait()
+
+    def flush(self) -> None:
+        r""" Write all the asynchronous saves, and then save the current states in a lockstep. """
+
+        self.save()
 
     def _get_states(self, deep_copy: bool = False) -> Dict[str, State]:
         states = {}
@@ -505,6 +610,8 @@ class StateManagerGroup(metaclass=_Singleton):
         else:
             self._states[key].delete()
             del self._states[key]
+            if key in self._loaded_keys:
+                self._loaded_keys.remove(key)
 
     def keygen(self, obj: Any) -> str:
         r""" Generated an unique key based on an object.
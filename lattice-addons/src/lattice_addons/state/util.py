@@ -1,16 +1,41 @@
 import abc
+import io
+import threading
+import time
+import weakref
 import boto3
 from botocore.exceptions import ClientError
-from typing import Any, Dict, Type, List
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Type, List, Optional, Tuple, TypeVar
 from ..log import get_logger
 
 logger = get_logger(__name__)
 
 
+# Classes whose instances are cached by the singleton metaclasses
+_singleton_classes: 'weakref.WeakSet[Any]' = weakref.WeakSet()
+
+
+def _reset_singletons() -> None:
+    r""" Drop all the cached singleton instances, so that they are created again, e.g. from the updated env vars. """
+
+    for cls in list(_singleton_classes):
+        cls._reset_instances()
+
+
 class _Singleton(type):
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.__instance = None  # Keep a strong reference
+        _singleton_classes.add(self)
+
+    def _reset_instances(self) -> None:
+        # Instances holding resources, e.g. background threads, release them in ``_close``
+        if hasattr(self.__instance, '_close'):
+            self.__instance._close()
+        self.__instance = None
 
     def __call__(self, *args, **kwargs) -> Any:
         if self.__instance is not None:
@@ -26,6 +51,10 @@ class _UIDSingleton(type):
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
         self.__cache: Dict[str, Any] = {}  # Keep a strong reference
+        _singleton_classes.add(self)
+
+    def _reset_instances(self) -> None:
+        self.__cache = {}
 
     def __call__(self, uid: str) -> Any:
         if uid in self.__cache:
@@ -40,9 +69,259 @@ class _UIDSingletonABC(_UIDSingleton, abc.ABCMeta):
     pass
 
 
+T = TypeVar('T')
+
+
+def _with_retries(fn: Callable[[], T], max_retries: int, what: str) -> T:
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            logger.debug(f'Retry {what} due to: {e}')
+            time.sleep(min(0.1 * 2 ** attempt, 5.0))
+
+    raise AssertionError('unreachable')
+
+
+class _S3MultipartWriter(io.RawIOBase):
+    r""" A binary stream uploading what is written as the parts of a multipart upload.
+
+    Parts are uploaded in the background, and at most ``max_concurrency`` parts are buffered besides the part being
+    written, so the memory usage does not depend on the object size. Objects smaller than a part are uploaded with a
+    single request.
+    """
+
+    def __init__(self, client: Any, bucket_name: str, object_key: str, part_size: int, max_concurrency: int,
+                 max_retries: int) -> None:
+        super().__init__()
+        self._client = client
+        self._bucket_name = bucket_name
+        self._object_key = object_key
+        self._part_size = part_size
+        self._max_concurrency = max_concurrency
+        self._max_retries = max_retries
+
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._parts: List[Future] = []
+        self._error: Optional[BaseException] = None
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: Any) -> int:
+        if self._error is not None:
+            raise self._error
+
+        with memoryview(b) as view:
+            self._buffer += view
+            nbytes = view.nbytes
+
+        while len(self._buffer) >= self._part_size:
+            self._submit(bytes(self._buffer[:self._part_size]))
+            del self._buffer[:self._part_size]
+
+        return nbytes
+
+    def _submit(self, data: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = _with_retries(
+                lambda: self._client.create_multipart_upload(Bucket=self._bucket_name, Key=self._object_key),
+                self._max_retries, f'creating multipart upload of {self._object_key}')['UploadId']
+            self._executor = ThreadPoolExecutor(self._max_concurrency)
+
+        # Block until a part finishes, so that the number of buffered parts is bounded
+        self._slots.acquire()
+        part_number = len(self._parts) + 1
+        future = self._executor.submit(self._upload_part, part_number, data)  # type: ignore[union-attr]
+        future.add_done_callback(self._on_part_done)
+        self._parts.append(future)
+
+    def _upload_part(self, part_number: int, data: bytes) -> Dict[str, Any]:
+        response = _with_retries(
+            lambda: self._client.upload_part(Bucket=self._bucket_name, Key=self._object_key,
+                                             UploadId=self._upload_id, PartNumber=part_number, Body=data),
+            self._max_retries, f'uploading part {part_number} of {self._object_key}')
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    def _on_part_done(self, future: Future) -> None:
+        self._slots.release()
+        if future.exception() is not None and self._error is None:
+            self._error = future.exception()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        try:
+            if self._upload_id is None:
+                _with_retries(
+                    lambda: self._client.put_object(Bucket=self._bucket_name, Key=self._object_key,
+                                                    Body=bytes(self._buffer)),
+                    self._max_retries, f'uploading {self._object_key}')
+            else:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                parts = [future.result() for future in self._parts]
+                _with_retries(
+                    lambda: self._client.complete_multipart_upload(Bucket=self._bucket_name, Key=self._object_key,
+                                                                   UploadId=self._upload_id,
+                                                                   MultipartUpload={'Parts': parts}),
+                    self._max_retries, f'completing multipart upload of {self._object_key}')
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._shutdown()
+            super().close()
+
+    def abort(self) -> None:
+        r""" Abort the upload, so that the object is not created. """
+
+        self._shutdown()
+        if self._upload_id is not None:
+            try:
+                self._client.abort_multipart_upload(Bucket=self._bucket_name, Key=self._object_key,
+                                                    UploadId=self._upload_id)
+            except Exception as e:
+                logger.info(f'Unable to abort multipart upload of {self._object_key} due to: {e}')
+            self._upload_id = None
+        super().close()
+
+    def _shutdown(self) -> None:
+        if self._executor is not None:
+            for future in self._parts:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class _S3RangeReader(io.RawIOBase):
+    r""" A binary stream downloading an object by ranges of ``part_size`` bytes.
+
+    The first range is streamed while the following ranges are downloaded in the background, and at most
+    ``max_concurrency`` ranges are buffered, so the memory usage does not depend on the object size.
+    """
+
+    def __init__(self, client: Any, bucket_name: str, object_key: str, part_size: int, max_concurrency: int,
+                 max_retries: int) -> None:
+        super().__init__()
+        self._client = client
+        self._bucket_name = bucket_name
+        self._object_key = object_key
+        self._part_size = part_size
+        self._max_concurrency = max_concurrency
+        self._max_retries = max_retries
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Deque[Future] = deque()
+        self._chunk = memoryview(b'')
+        self._size = 0
+        self._offset = 0
+
+        # The size of the object is known from the first range, so there is no need for another request
+        response = _with_retries(
+            lambda: self._client.get_object(Bucket=bucket_name, Key=object_key, Range=f'bytes=0-{part_size - 1}'),
+            max_retries, f'downloading {object_key}')
+        self._body: Any = response['Body']
+
+        content_range = response.get('ContentRange')
+        if content_range:
+            # Format: bytes <start>-<end>/<size>
+            self._size = int(content_range.rsplit('/', 1)[-1])
+            self._offset = min(part_size, self._size)
+            if self._offset < self._size:
+                self._executor = ThreadPoolExecutor(max_concurrency)
+                self._prefetch()
+
+    def readable(self) -> bool:
+        return True
+
+    def _prefetch(self) -> None:
+        while len(self._pending) < self._max_concurrency and self._offset < self._size:
+            start, end = self._offset, min(self._offset + self._part_size, self._size) - 1
+            self._pending.append(self._executor.submit(self._get_range, start, end))  # type: ignore[union-attr]
+            self._offset = end + 1
+
+    def _get_range(self, start: int, end: int) -> bytes:
+        return _with_retries(
+            lambda: self._client.get_object(Bucket=self._bucket_name, Key=self._object_key,
+                                            Range=f'bytes={start}-{end}')['Body'].read(),
+            self._max_retries, f'downloading bytes {start}-{end} of {self._object_key}')
+
+    def readinto(self, b: Any) -> int:
+        if self._body is not None:
+            data = self._body.read(len(b))
+            if data:
+                b[:len(data)] = data
+                return len(data)
+            self._body = None
+
+        if not self._chunk:
+            if not self._pending:
+                return 0
+            self._chunk = memoryview(self._pending.popleft().result())
+            self._prefetch()
+
+        n = min(len(b), len(self._chunk))
+        b[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+    def close(self) -> None:
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        super().close()
+
+
+# Entries of checkpoint indexes are only loaded after this marker is saved, so that partially saved entries are never
+# loaded
+_INDEX_COMMIT_SUFFIX = '.committed'
+
+
 class S3CheckpointHelper():
     s3_client: Any = None
 
+    # Default settings of streaming transfers
+    part_size: int = 64 * 1024 * 1024
+    max_concurrency: int = 4
+    max_retries: int = 3
+    # The settings of the streaming transfers of the current thread
+    _local = threading.local()
+
+    @classmethod
+    @contextmanager
+    def configured(cls: Type, part_size: int, max_concurrency: int, max_retries: int) -> Iterator[None]:
+        r""" Configure the streaming transfers of the current thread.
+
+        Managers configure the transfers of the handlers they invoke, so managers with different configs in a process
+        do not affect each other.
+
+        :param part_size: The size of the parts of multipart uploads and ranged downloads in bytes
+        :param max_concurrency: The maximum number of parts transferred concurrently per object
+        :param max_retries: The maximum number of retries of a failed part
+        """
+
+        previous = getattr(cls._local, 'settings', None)
+        cls._local.settings = (part_size, max_concurrency, max_retries)
+        try:
+            yield
+        finally:
+            cls._local.settings = previous
+
+    @classmethod
+    def _settings(cls: Type) -> Tuple[int, int, int]:
+        settings = getattr(cls._local, 'settings', None)
+        return settings if settings is not None else (cls.part_size, cls.max_concurrency, cls.max_retries)
+
     @classmethod
     def get_client(cls: Type):
         if not cls.s3_client:
@@ -89,36 +368,110 @@ class S3CheckpointHelper():
         all_checkpoints: Dict[str, List] = {}
         path = f'{job_id}/'
 
-        response = cls.get_client().list_objects_v2(Bucket=bucket_name, Prefix=path, Delimiter='/')
-
-        if response.get('CommonPrefixes'):
-            for obj in response.get('CommonPrefixes'):
-                folder_path = obj.get('Prefix')
-                folder_name = folder_path.strip('/').split('/')[-1]
-                next_response = cls.get_client().list_objects_v2(Bucket=bucket_name,
-                                                                 Prefix=folder_path,
-                                                                 Delimiter='/')
-                if next_response.get('Contents'):
-                    all_checkpoints[folder_name] = []
-                    for next_obj in next_response.get('Contents'):
-                        file_path = next_obj.get('Key')
-                        file_name = file_path.strip('/').split('/')[-1]
-                        all_checkpoints[folder_name].append(file_name)
+        # List all the checkpoints of the job at once, instead of listing each checkpoint folder
+        paginator = cls.get_client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=path):
+            for obj in page.get('Contents', []):
+                # Format: <job id>/<checkpoint uid>/<checkpoint name>
+                parts = obj['Key'][len(path):].split('/')
+                if len(parts) != 2 or not parts[0] or not parts[1]:
+                    continue
+                all_checkpoints.setdefault(parts[0], []).append(parts[1])
 
         return all_checkpoints
 
     @classmethod
-    def save(cls: Type, bucket_name: str, job_id: str, uid: str, ckpt_name: str, checkpoint_data: bytes) -> None:
+    def load_index(cls: Type, bucket_name: str, job_id: str, name: str) -> Optional[Dict[str, List[str]]]:
+        r""" Load an index of checkpoints, which is the union of the entries saved for every checkpoint UID.
+
+        Entries are empty objects whose keys hold the checkpoint names, so the index is loaded by listing it, without
+        reading any object.
+
+        :return: The names of the checkpoints under each checkpoint UID, or `None` if the index has no entries
+        """
+
+        ckpt_names: Dict[str, List[str]] = {}
+        committed = set()
+        prefix = f'{job_id}/{name}.index/'
+
+        # Format: <job id>/<index name>.index/<checkpoint uid>/<checkpoint name> for every checkpoint, and
+        # <job id>/<index name>.index/<checkpoint uid>.committed once all of them are indexed
+        paginator = cls.get_client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                entry = obj['Key'][len(prefix):]
+                ckpt_uid, sep, ckpt_name = entry.partition('/')
+                if sep and ckpt_name and '/' not in ckpt_name:
+                    ckpt_names.setdefault(ckpt_uid, []).append(ckpt_name)
+                elif not sep and entry.endswith(_INDEX_COMMIT_SUFFIX):
+                    committed.add(entry[:-len(_INDEX_COMMIT_SUFFIX)])
+
+        index = {ckpt_uid: ckpt_names[ckpt_uid] for ckpt_uid in committed if ckpt_uid in ckpt_names}
+        return index or None
+
+    @classmethod
+    def save_index_entry(cls: Type, bucket_name: str, job_id: str, name: str, ckpt_uid: str,
+                         ckpt_names: List[str]) -> None:
+        r""" Save the entry of a checkpoint UID in an index of checkpoints.
+
+        Every checkpoint UID has its own entry, so writers of different checkpoint UIDs never overwrite each other's
+        entries. The entry is only loaded after its commit marker is saved, which is saved last.
+        """
+
+        prefix = f'{job_id}/{name}.index/{ckpt_uid}'
+        for ckpt_name in ckpt_names:
+            cls.get_client().put_object(Bucket=bucket_name, Key=f'{prefix}/{ckpt_name}', Body=b'')
+        cls.get_client().put_object(Bucket=bucket_name, Key=f'{prefix}{_INDEX_COMMIT_SUFFIX}', Body=b'')
+
+    @classmethod
+    def delete_index_entry(cls: Type, bucket_name: str, job_id: str, name: str, ckpt_uid: str,
+                           ckpt_names: List[str]) -> None:
+        r""" Delete the entry of a checkpoint UID from an index of checkpoints.
+
+        The commit marker is deleted first, so that a partially deleted entry is never loaded.
+        """
+
+        prefix = f'{job_id}/{name}.index/{ckpt_uid}'
+        cls.get_client().delete_object(Bucket=bucket_name, Key=f'{prefix}{_INDEX_COMMIT_SUFFIX}')
+        for ckpt_name in ckpt_names:
+            cls.get_client().delete_object(Bucket=bucket_name, Key=f'{prefix}/{ckpt_name}')
+
+    @classmethod
+    @contextmanager
+    def open_writer(cls: Type, bucket_name: str, job_id: str, uid: str, ckpt_name: str) -> Iterator[io.RawIOBase]:
+        r""" Open a binary stream which uploads a checkpoint as it is written.
+
+        The checkpoint is created when the stream is closed on exit, and it is not created if there is an exception.
+        """
+
         object_key = f'{job_id}/{uid}/{ckpt_name}'
-        cls.get_client().put_object(Bucket=bucket_name, Key=object_key, Body=checkpoint_data)
+        writer = _S3MultipartWriter(cls.get_client(), bucket_name, object_key, *cls._settings())
+        try:
+            yield writer
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
 
     @classmethod
-    def load(cls: Type, bucket_name: str, job_id: str, uid: str, ckpt_name: str) -> bytes:
+    @contextmanager
+    def open_reader(cls: Type, bucket_name: str, job_id: str, uid: str, ckpt_name: str) -> Iterator[io.BufferedReader]:
+        r""" Open a binary stream which downloads a checkpoint as it is read. """
+
         object_key = f'{job_id}/{uid}/{ckpt_name}'
-        response = cls.get_client().get_object(Bucket=bucket_name, Key=object_key)
-        checkpoint_data_from_s3 = response['Body'].read()
+        reader = _S3RangeReader(cls.get_client(), bucket_name, object_key, *cls._settings())
+        with io.BufferedReader(reader) as f:
+            yield f
 
-        return checkpoint_data_from_s3
+    @classmethod
+    def save(cls: Type, bucket_name: str, job_id: str, uid: str, ckpt_name: str, checkpoint_data: bytes) -> None:
+        with cls.open_writer(bucket_name, job_id, uid, ckpt_name) as f:
+            f.write(checkpoint_data)
+
+    @classmethod
+    def load(cls: Type, bucket_name: str, job_id: str, uid: str, ckpt_name: str) -> bytes:
+        with cls.open_reader(bucket_name, job_id, uid, ckpt_name) as f:
+            return f.read()
 
     @classmethod
     def delete(cls: Type, bucket_name: str, job_id: str, uid: str, ckpt_name: str) -> None:
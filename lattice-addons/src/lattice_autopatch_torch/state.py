@@ -2,73 +2,254 @@ from lattice_addons.state import (
     local_checkpoint_saver, local_checkpoint_loader,
     remote_checkpoint_saver, remote_checkpoint_loader,
     s3_checkpoint_saver, s3_checkpoint_loader,
+    committed_path, compressing_writer, decompressing_reader, open_checkpoint,
 )
-from lattice_addons.state import State
-from lattice_addons.state.distributed.utils import (
-    RequestType,
-    CheckpointMessage,
-)
+from lattice_addons.state import State, checkpoint_configs
+from lattice_addons.state import CONFIG_INCREMENTAL, CONFIG_MMAP
+from lattice_addons.state.distributed.utils import CheckpointStream, Connection
 from collections import OrderedDict
 from lattice_addons.state import S3CheckpointHelper
 
-import io
+from pathlib import Path
+from typing import Any, Dict, Optional, Set, Tuple
+
+import os
+import re
+import hashlib
+import threading
+import numpy as np
 import torch
-import zmq
 
 
 class TorchStateDict(OrderedDict, State):
     ...
 
 
+# Incremental checkpoints
+# -----------------------
+#
+# An incremental checkpoint is a directory with an index and one blob file per tensor, named by the fingerprint of
+# the tensor. A tensor that is unchanged since the last checkpoint of the same lineage is hard linked from the last
+# checkpoint instead of being written again. Since blobs are shared by hard links, deleting an old checkpoint never
+# breaks newer checkpoints referring to its blobs.
+
+_INDEX_NAME = 'index.pt'
+_BLOB_SUFFIX = '.pt'
+_ENTRY_BLOB = 'blob'
+_ENTRY_VALUE = 'value'
+
+_incremental_lock = threading.Lock()
+# Dictionary format: <lineage, (checkpoint directory, fingerprints of blobs)>
+_last_incremental: Dict[str, Tuple[Path, Set[str]]] = {}
+
+
+def _is_incremental() -> bool:
+    return checkpoint_configs()[CONFIG_INCREMENTAL]
+
+
+def _is_mmap() -> bool:
+    return checkpoint_configs()[CONFIG_MMAP]
+
+
+def _get_lineage(path: Path) -> str:
+    # Checkpoints of the same state only differ in the counter of checkpoint UIDs
+    return re.sub(r'_[0-9]{6}(?=[/.]|$)', '', str(path))
+
+
+def _fingerprint(tensor: torch.Tensor) -> Optional[str]:
+    try:
+        t = tensor.detach().cpu().contiguous()
+        h = hashlib.blake2b(f'{t.dtype}:{tuple(t.shape)}'.encode(), digest_size=16)
+
+        # bfloat16 is not supported by numpy, so hash its raw bits instead
+        if t.dtype == torch.bfloat16:
+            t = t.view(torch.int16)
+        h.update(t.numpy())
+        return h.hexdigest()
+    except Exception:
+        # E.g. quantized or sparse tensors, which are saved as plain values
+        return None
+
+
+def _save_tsd_incrementally(obj: TorchStateDict, path: Path) -> None:
+    # The checkpoint is renamed after it is committed
+    committed = Path(committed_path(str(path)))
+    lineage = _get_lineage(committed)
+    with _incremental_lock:
+        last = _last_incremental.get(lineage, None)
+
+    path.mkdir(parents=True, exist_ok=True)
+
+    entries: Dict[str, Tuple[str, Any]] = OrderedDict()
+    for name, value in obj.items():
+        fp = _fingerprint(value) if isinstance(value, torch.Tensor) else None
+        if fp is None:
+            entries[name] = (_ENTRY_VALUE, value)
+            continue
+
+        entries[name] = (_ENTRY_BLOB, fp)
+        blob = path / f'{fp}{_BLOB_SUFFIX}'
+        if blob.exists():
+            continue
+
+        if last is not None and fp in last[1]:
+            try:
+                os.link(last[0] / blob.name, blob)
+                continue
+            except OSError:
+                # The last checkpoint may be deleted, or hard links are not supported
+                pass
+
+        torch.save(value, blob)
+
+    # The index is written last, so a checkpoint without an index is incomplete
+    torch.save(entries, path / _INDEX_NAME)
+
+    with _incremental_lock:
+        _last_incremental[lineage] = (committed, {fp for kind, fp in entries.values() if kind == _ENTRY_BLOB})
+
+
+def _load_tsd_incrementally(path: Path) -> TorchStateDict:
+    entries: Dict[str, Tuple[str, Any]] = torch.load(path / _INDEX_NAME)
+
+    retval = TorchStateDict()
+    blobs: Dict[str, Any] = {}
+    for name, (kind, value) in entries.items():
+        if kind == _ENTRY_BLOB:
+            if value not in blobs:
+                blobs[value] = torch.load(path / f'{value}{_BLOB_SUFFIX}')
+            retval[name] = blobs[value]
+        else:
+            retval[name] = value
+
+    # Succeeding checkpoints can be built on the loaded one
+    with _incremental_lock:
+        _last_incremental[_get_lineage(path)] = (path, set(blobs.keys()))
+
+    return retval
+
+
+# Memory-mapped checkpoints
+# -------------------------
+#
+# A memory-mapped checkpoint is a directory with an index and a single file of raw tensor data. Tensors are loaded as
+# copy-on-write views over the mapped file, so loading does not copy tensor data into process memory, and processes
+# loading the same checkpoint share the pages of the file. Tensors without a plain memory layout, e.g. quantized or
+# sparse tensors, are saved in the index instead.
+
+_MMAP_DATA_NAME = 'tensors.bin'
+_MMAP_ALIGNMENT = 64
+
+
+def _to_numpy_dtype(dtype: torch.dtype) -> np.dtype:
+    # bfloat16 is not supported by numpy, so map its raw bits instead
+    if dtype == torch.bfloat16:
+        dtype = torch.int16
+    return torch.empty(0, dtype=dtype).numpy().dtype
+
+
+def _save_tsd_mmap(obj: TorchStateDict, path: Path) -> None:
+    path.mkdir(parents=True, exist_ok=True)
+
+    entries: Dict[str, Tuple[str, Any]] = OrderedDict()
+    with open(path / _MMAP_DATA_NAME, 'wb') as f:
+        for name, value in obj.items():
+            if not isinstance(value, torch.Tensor) or value.layout != torch.strided or value.is_quantized:
+                entries[name] = (_ENTRY_VALUE, value)
+                continue
+
+            t = value.detach().cpu().contiguous()
+            try:
+                array = t.view(torch.int16).numpy() if t.dtype == torch.bfloat16 else t.numpy()
+            except Exception:
+                entries[name] = (_ENTRY_VALUE, value)
+                continue
+
+            offset = (f.tell() + _MMAP_ALIGNMENT - 1) // _MMAP_ALIGNMENT * _MMAP_ALIGNMENT
+            f.seek(offset)
+            f.write(array.reshape(-1).view(np.uint8))
+            entries[name] = (_ENTRY_BLOB, (str(t.dtype), tuple(t.shape), offset, str(value.device)))
+
+    # The index is written last, so a checkpoint without an index is incomplete
+    torch.save(entries, path / _INDEX_NAME)
+
+
+def _load_tsd_mmap(path: Path) -> TorchStateDict:
+    entries: Dict[str, Tuple[str, Any]] = torch.load(path / _INDEX_NAME)
+
+    data = None
+    if (path / _MMAP_DATA_NAME).stat().st_size > 0:
+        data = np.memmap(path / _MMAP_DATA_NAME, dtype=np.uint8, mode='c')
+
+    retval = TorchStateDict()
+    for name, (kind, value) in entries.items():
+        if kind != _ENTRY_BLOB:
+            retval[name] = value
+            continue
+
+        dtype_str, shape, offset, device = value
+        dtype: torch.dtype = getattr(torch, dtype_str.split('.')[-1])
+        np_dtype = _to_numpy_dtype(dtype)
+        numel = int(np.prod(shape))
+
+        array = np.frombuffer(data, dtype=np_dtype, count=numel, offset=offset) if numel > 0 else \
+            np.empty(0, dtype=np_dtype)
+        t = torch.from_numpy(array).view(dtype).reshape(shape)
+        retval[name] = t if device == 'cpu' else t.to(device)
+
+    return retval
+
+
 @local_checkpoint_saver(type=TorchStateDict)
 def save_tsd_to_local(obj: TorchStateDict, path: str) -> None:
-    torch.save(obj, path)
+    if _is_incremental():
+        _save_tsd_incrementally(obj, Path(path))
+    elif _is_mmap():
+        _save_tsd_mmap(obj, Path(path))
+    else:
+        with open_checkpoint(path, 'wb') as f:
+            torch.save(obj, f)
 
 
 @local_checkpoint_loader(type=TorchStateDict)
 def load_tsd_from_local(path: str) -> TorchStateDict:
-    return torch.load(path)
+    if (Path(path) / _MMAP_DATA_NAME).exists():
+        return _load_tsd_mmap(Path(path))
+    if Path(path).is_dir():
+        return _load_tsd_incrementally(Path(path))
+
+    with open_checkpoint(path, 'rb', seekable=True) as f:
+        return torch.load(f)
 
 
 @remote_checkpoint_saver(type=TorchStateDict)
-def save_tsd_to_remote(obj: TorchStateDict, socket: zmq.Socket, job_id: str, uid: str, key: str):
-    with io.BytesIO() as buffer:
-        torch.save(obj, buffer)
-        buffer.seek(0)
-        msg = CheckpointMessage(RequestType.SAVE, job_id=job_id, uid=uid, ckpt_name=key, body=buffer.getvalue())
-        socket.send(msg.encode_message())
-        socket.recv()
+def save_tsd_to_remote(obj: TorchStateDict, socket: Connection, job_id: str, uid: str, key: str):
+    with CheckpointStream.open_writer(socket, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with compressing_writer(stream) as f:
+            torch.save(obj, f)
 
 
 @remote_checkpoint_loader(type=TorchStateDict)
-def load_tsd_from_remote(socket: zmq.Socket, job_id: str, uid: str, key: str) -> TorchStateDict:
-    msg = CheckpointMessage(RequestType.LOAD, job_id=job_id, uid=uid, ckpt_name=key, body=b'')
-    socket.send(msg.encode_message())
-    response = socket.recv()
-    ckpt_response = CheckpointMessage.parse_message(response)
-
-    with io.BytesIO(ckpt_response.body) as buffer:
-        buffer.seek(0)
-        sd = torch.load(buffer)
+def load_tsd_from_remote(socket: Connection, job_id: str, uid: str, key: str) -> TorchStateDict:
+    with CheckpointStream.open_reader(socket, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with decompressing_reader(stream, seekable=True) as f:
+            sd = torch.load(f)
 
     return TorchStateDict(sd)
 
 
 @s3_checkpoint_saver(type=TorchStateDict)
 def save_tsd_to_s3(obj: TorchStateDict, bucket_name: str, job_id: str, uid: str, key: str):
-    with io.BytesIO() as buffer:
-        torch.save(obj, buffer)
-        buffer.seek(0)
-        S3CheckpointHelper.save(bucket_name=bucket_name, job_id=job_id, uid=uid,
-                                ckpt_name=key, checkpoint_data=buffer.getvalue())
+    with S3CheckpointHelper.open_writer(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with compressing_writer(stream) as f:
+            torch.save(obj, f)
 
 
 @s3_checkpoint_loader(type=TorchStateDict)
 def load_tsd_from_s3(bucket_name: str, job_id: str, uid: str, key: str) -> TorchStateDict:
-    ckpt_response = S3CheckpointHelper.load(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key)
-
-    with io.BytesIO(ckpt_response) as buffer:
-        buffer.seek(0)
-        sd = torch.load(buffer)
+    # torch.load() needs a seekable stream, so the checkpoint is spooled to a temporary file while downloading
+    with S3CheckpointHelper.open_reader(bucket_name=bucket_name, job_id=job_id, uid=uid, ckpt_name=key) as stream:
+        with decompressing_reader(stream, seekable=True) as f:
+            sd = torch.load(f)
 
     return TorchStateDict(sd)
@@ -0,0 +1,16 @@
+import os
+import pytest
+
+from lattice_addons.state.util import _reset_singletons
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings():
+    # Settings and state manager groups are singletons parsing env vars once, so tests setting env vars must not
+    # see instances created by earlier tests, nor leak their env vars to later tests
+    environ = dict(os.environ)
+    _reset_singletons()
+    yield
+    _reset_singletons()
+    os.environ.clear()
+    os.environ.update(environ)
@@ -0,0 +1,331 @@
+r""" Benchmark saving and loading checkpoint collections with every backend and every built-in handler type.
+
+Every case saves a collection of one handler type with the checkpoint collection manager of one backend, and loads it
+back, ``--iterations`` times, and reports the throughput and the p50 and p99 latencies of saves and loads:
+
+- Backends: ``local`` to a temporary directory, ``remote`` to the `CheckpointService` of lattice-ckpt running
+  in-process, which is skipped unless ``lattice-ckpt/src`` is on the path, ``replica`` to a `ReplicaStore` running
+  in-process, i.e. the protocol without the store of the service, and ``s3`` to a local stand-in of S3, i.e. a moto
+  server, or MinIO with ``--s3-endpoint``.
+- Handlers: ``primitives``, i.e. ints, floats, bools and lists, ``picklable``, i.e. a `PicklableDict`, and ``torch``,
+  i.e. a `TorchStateDict`, the latter two of every size in ``--size``.
+
+Cases whose handler type has no handler registered for a backend are skipped, and cases failing are recorded with
+their error. Results are written as JSON baselines
+to ``baselines/<name>.json`` with ``--record``, and later runs are compared against the baseline of ``--baseline``,
+which defaults to the host name, e.g.
+
+    PYTHONPATH=src:../lattice-ckpt/src python tests/lattice_addons/benchmarks/bench_ckpt_manager.py --record
+    PYTHONPATH=src python tests/lattice_addons/benchmarks/bench_ckpt_manager.py --backend local --size 67108864
+"""
+
+from lattice_addons.state import (
+    PicklableDict,
+    LocalCheckpointCollectionManager, RemoteCheckpointCollectionManager, S3CheckpointCollectionManager,
+    BaseCheckpointCollectionManager, S3CheckpointHelper,
+)
+from lattice_addons.state.ckpt_manager import LocalCheckpointSaver, RemoteCheckpointSaver, S3CheckpointSaver
+from lattice_addons.state.distributed.replica import ReplicaStore
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import pickle
+import platform
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type
+from unittest.mock import patch
+
+try:
+    import torch
+    from lattice_autopatch_torch import TorchStateDict
+except ImportError:
+    torch = None
+
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+BACKENDS = ('local', 'remote', 'replica', 's3')
+HANDLERS = ('primitives', 'picklable', 'torch')
+S3_BUCKET = 'lattice-benchmark'
+
+# Savers of the backends, which tell whether a handler type can be saved with a backend
+_SAVERS: Dict[str, Type] = {
+    'local': LocalCheckpointSaver, 'remote': RemoteCheckpointSaver, 'replica': RemoteCheckpointSaver,
+    's3': S3CheckpointSaver,
+}
+
+
+parser = argparse.ArgumentParser(description='Benchmark saving and loading checkpoint collections')
+parser.add_argument('--backend', type=str, default=','.join(BACKENDS),
+                    help="Backends to benchmark, separated by commas")
+parser.add_argument('--handler', type=str, default=','.join(HANDLERS),
+                    help="Handler types to benchmark, separated by commas")
+parser.add_argument('--size', type=str, default='1048576,16777216',
+                    help="Bytes of the picklable and torch collections, or several separated by commas")
+parser.add_argument('--keys', type=int, default=4, help="Number of checkpoints a collection is split into")
+parser.add_argument('--iterations', type=int, default=10, help="Collections saved and loaded per case")
+parser.add_argument('--warmup', type=int, default=1, help="Collections saved and loaded per case before measuring")
+parser.add_argument('--s3-endpoint', type=str, default=None,
+                    help="Endpoint of an S3 compatible store, e.g. http://localhost:9000 of MinIO, instead of moto")
+parser.add_argument('--baseline', type=str, default=platform.node(),
+                    help="Name of the baseline in baselines/, or the path of a baseline, to record or compare to")
+parser.add_argument('--record', action='store_true', help="Record the results as the baseline")
+parser.add_argument('--tolerance', type=float, default=0.2,
+                    help="Fraction by which a p50 latency may exceed the baseline before it is a regression")
+parser.add_argument('--output', type=str, default=None, help="Path of the JSON file the results are written to")
+
+
+def make_collection(handler: str, size: int, keys: int) -> Dict[str, Any]:
+    r""" Make a collection of `keys` objects of a handler type, which add up to about `size` bytes. """
+
+    if handler == 'primitives':
+        # Primitives are small, whatever the size is. Strings are left out, since savers look them up as type names.
+        return {f'k{i}': [i, i * 0.5, i % 2 == 0, [i] * 16][i % 4] for i in range(keys)}
+    elif handler == 'picklable':
+        return {f'k{i}': PicklableDict(data=os.urandom(size // keys)) for i in range(keys)}
+    elif handler == 'torch':
+        return {f'k{i}': TorchStateDict(weight=torch.rand(size // keys // 4)) for i in range(keys)}
+    raise ValueError(f'Unknown handler type {handler}')
+
+
+def collection_bytes(objs: Dict[str, Any]) -> int:
+    return sum(
+        sum(t.numel() * t.element_size() for t in obj.values()) if torch and isinstance(obj, TorchStateDict)
+        else len(pickle.dumps(obj)) for obj in objs.values()
+    )
+
+
+def unsupported(backend: str, objs: Dict[str, Any]) -> Optional[str]:
+    r""" Tell why a collection can not be saved with a backend, or `None` if it can. """
+
+    for obj in objs.values():
+        try:
+            _SAVERS[backend]._lookup(type(obj))
+        except KeyError as e:
+            return str(e).strip("'")
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def local_backend() -> Iterator[Callable[..., BaseCheckpointCollectionManager]]:
+    # Managers lock their root, so every manager gets a root of its own
+    with tempfile.TemporaryDirectory() as root:
+        yield lambda uid, **configs: LocalCheckpointCollectionManager(uid, os.path.join(root, uid), **configs)
+
+
+@contextlib.contextmanager
+def remote_backend() -> Iterator[Optional[Callable[..., BaseCheckpointCollectionManager]]]:
+    # The service is not a dependency, so its cases are skipped unless it is importable
+    try:
+        from ckpt_server.main import CheckpointService
+    except ImportError:
+        yield None
+        return
+
+    # The service runs in threads of this process, and holds the checkpoints in memory up to its default budget
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as root:
+        service = CheckpointService(root, 4, port=port, metrics_port=0)
+        threading.Thread(target=service.launch, daemon=True).start()
+        try:
+            yield lambda uid, **configs: RemoteCheckpointCollectionManager(uid, 'benchmark', f'localhost:{port}',
+                                                                           **configs)
+        finally:
+            service.store.close()
+
+
+@contextlib.contextmanager
+def replica_backend() -> Iterator[Callable[..., BaseCheckpointCollectionManager]]:
+    # The store runs in a thread of this process, so the protocol is measured without the store of the service
+    port = _free_port()
+    ReplicaStore(port).start()
+    yield lambda uid, **configs: RemoteCheckpointCollectionManager(uid, 'benchmark', f'localhost:{port}', **configs)
+
+
+@contextlib.contextmanager
+def s3_backend(endpoint: Optional[str]) -> Iterator[Callable[..., BaseCheckpointCollectionManager]]:
+    server = None
+    if endpoint is None:
+        # moto is only needed without an S3 compatible store
+        from moto.server import ThreadedMotoServer
+
+        # The server logs every request it serves
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        port = _free_port()
+        server = ThreadedMotoServer(ip_address='localhost', port=port)
+        server.start()
+        endpoint = f'http://localhost:{port}'
+
+    env = {'AWS_ENDPOINT_URL': endpoint}
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        env[name] = os.environ.get(name, 'benchmark')
+    env['AWS_DEFAULT_REGION'] = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
+
+    try:
+        with patch.dict(os.environ, env), patch.object(S3CheckpointHelper, 's3_client', None):
+            client = S3CheckpointHelper.get_client()
+            with contextlib.suppress(client.exceptions.BucketAlreadyOwnedByYou):
+                client.create_bucket(Bucket=S3_BUCKET)
+            yield lambda uid, **configs: S3CheckpointCollectionManager(uid, f's3://{S3_BUCKET}/benchmark', **configs)
+    finally:
+        if server is not None:
+            server.stop()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    # Nearest rank, so that the percentile is a measured latency
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def _summarize(latencies: List[float], nbytes: int) -> Dict[str, float]:
+    elapsed = sum(latencies)
+    return {
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / elapsed,
+        'mib_per_sec': len(latencies) * nbytes / elapsed / 1024 ** 2,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+    }
+
+
+def run_case(make_manager: Callable[..., BaseCheckpointCollectionManager], uid: str, objs: Dict[str, Any],
+             args: Any) -> Dict[str, Any]:
+    r""" Save and load a collection, and measure both. Only the last collections are kept, as training would. """
+
+    mgr = make_manager(uid, atexit_saving='disabled', keep_last='2')
+    saves: List[float] = []
+    loads: List[float] = []
+    for i in range(args.warmup + args.iterations):
+        start = time.perf_counter()
+        mgr.save(objs)
+        saved = time.perf_counter()
+        loaded = mgr.load()
+        end = time.perf_counter()
+
+        if loaded is None or loaded.keys() != objs.keys():
+            # Managers log why a checkpoint could not be loaded and fall back to older ones
+            raise RuntimeError(f'Unable to load the collection saved by {mgr}')
+        if i >= args.warmup:
+            saves.append(saved - start)
+            loads.append(end - saved)
+    mgr.wait()
+
+    nbytes = collection_bytes(objs)
+    return {'bytes': nbytes, 'save': _summarize(saves, nbytes), 'load': _summarize(loads, nbytes)}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    r""" Print how the p50 latencies of the cases compare to the baseline, and return the cases which regressed. """
+
+    regressions = []
+    print(f'\nCompared to the baseline of {baseline["environment"]["host"]}, recorded {baseline["recorded"]}:')
+    print(f'{"case":<36} {"op":>5} {"p50 ms":>9} {"baseline":>9} {"change":>8}')
+    for case, result in results.items():
+        expected = baseline['results'].get(case)
+        if 'save' not in result or expected is None or 'save' not in expected:
+            continue
+        for op in ('save', 'load'):
+            p50, base = result[op]['p50_ms'], expected[op]['p50_ms']
+            change = p50 / base - 1 if base > 0 else 0.0
+            regressed = change > tolerance
+            if regressed:
+                regressions.append(f'{case} {op}')
+            print(f'{case:<36} {op:>5} {p50:>9.2f} {base:>9.2f} {change:>+7.0%}{" !" if regressed else ""}')
+    return regressions
+
+
+def _baseline_path(name: str) -> Path:
+    return Path(name) if name.endswith('.json') else BASELINE_DIR / f'{name}.json'
+
+
+def main() -> None:
+    args = parser.parse_args()
+    if args.iterations < 1 or args.keys < 1:
+        parser.error('--iterations and --keys must be positive')
+    backends = args.backend.split(',')
+    handlers = args.handler.split(',')
+    sizes = [int(size) for size in args.size.split(',')]
+    for name, choices in ((backends, BACKENDS), (handlers, HANDLERS)):
+        if not set(name) <= set(choices):
+            parser.error(f'Choose from {", ".join(choices)}')
+
+    factories = {
+        'local': local_backend,
+        'remote': remote_backend,
+        'replica': replica_backend,
+        's3': lambda: s3_backend(args.s3_endpoint),
+    }
+
+    results: Dict[str, Any] = {}
+    print(f'{"case":<36} {"op":>5} {"ops/s":>10} {"MiB/s":>10} {"p50 ms":>9} {"p99 ms":>9}')
+    for backend in backends:
+        with factories[backend]() as make_manager:
+            for handler in handlers:
+                for size in ([0] if handler == 'primitives' else sizes):
+                    case = f'{backend}/{handler}' + (f'/{size}' if size else '')
+                    if make_manager is None:
+                        results[case] = {'skipped': 'lattice-ckpt is not importable'}
+                    elif handler == 'torch' and torch is None:
+                        results[case] = {'skipped': 'torch is not installed'}
+                    else:
+                        objs = make_collection(handler, size, args.keys)
+                        reason = unsupported(backend, objs)
+                        try:
+                            results[case] = {'skipped': reason} if reason else \
+                                run_case(make_manager, f'{handler}{size}', objs, args)
+                        except Exception as e:
+                            # A failing case is recorded, so that the other cases are still measured
+                            results[case] = {'error': str(e)}
+
+                    result = results[case]
+                    if 'skipped' in result or 'error' in result:
+                        outcome = 'skipped' if 'skipped' in result else 'error'
+                        print(f'{case:<36} {outcome}: {result[outcome]}')
+                        continue
+                    for op in ('save', 'load'):
+                        stats = result[op]
+                        print(f'{case:<36} {op:>5} {stats["ops_per_sec"]:>10.1f} {stats["mib_per_sec"]:>10.1f} '
+                              f'{stats["p50_ms"]:>9.2f} {stats["p99_ms"]:>9.2f}')
+
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'record', 'baseline', 'tolerance')},
+        'environment': {'host': platform.node(), 'python': platform.python_version(),
+                        'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'torch': torch.__version__ if torch else None},
+        'recorded': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+
+    path = _baseline_path(args.baseline)
+    if args.record:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline recorded to {path}')
+    elif path.exists():
+        with open(path) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} p50 latencies regressed by more than {args.tolerance:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
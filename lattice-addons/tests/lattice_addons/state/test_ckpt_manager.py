@@ -1,14 +1,20 @@
 from unittest import mock
 from lattice_addons.state import (
     PicklableDict, PicklableWrapper, LocalCheckpoint,
-    LocalCheckpointManager, LocalCheckpointCollectionManager,
+    LocalCheckpointManager, LocalCheckpointCollectionManager, ShardedLocalCheckpointCollectionManager,
+    CASLocalCheckpointCollectionManager,
     RemoteCheckpoint, RemoteCheckpointCollectionManager,
     CheckpointSetting, CheckpointCollectionSetting,
-    S3Checkpoint, S3CheckpointCollectionManager,
-    CHECKPOINT_TYPE, CHECKPOINT_CONFIG
+    S3Checkpoint, S3CheckpointCollectionManager, PeerCheckpointCollectionManager, TieredCheckpointCollectionManager,
+    CHECKPOINT_TYPE, CHECKPOINT_CONFIG, decompressing_reader
 )
 
-from lattice_addons.state.distributed.utils import CheckpointMessage, RequestType
+from lattice_addons.state.distributed.utils import (
+    CheckpointClient, CheckpointMessage, CheckpointStream, RecvTimedOutException, RequestType
+)
+from lattice_addons.state.distributed.lease import LeaseTable
+from lattice_addons.state.distributed.replica import ReplicaStore
+from lattice_addons.state.distributed.ring import HashRing
 
 # Import internal components
 from lattice_addons.state.ckpt_manager import (
@@ -16,10 +22,13 @@ from lattice_addons.state.ckpt_manager import (
     RemoteCheckpointSaver, RemoteCheckpointLoader, RemoteCheckpointDeleter,
     S3CheckpointSaver, S3CheckpointLoader,
 )
+from lattice_addons.state.util import S3CheckpointHelper
 
+import contextlib
 import io
 import dill
 import os
+import socket
 import tempfile
 from pathlib import Path
 import copy
@@ -27,10 +36,11 @@ import pytest
 import zmq
 from time import sleep
 import multiprocessing as mp
+import threading
+import zlib
 
-from typing import List, Dict, Any
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from unittest.mock import MagicMock, patch
-import boto3
 import botocore
 
 
@@ -350,11 +360,284 @@ def test_local_ckpt_coll_mgr_checks_permissions():
     assert mgr is None
 
 
-def create_server_response_message(req_type: RequestType, job_id: str, uid: str, ckpt_name: str, body: Any) -> bytes:
+def test_ckpt_mgr_optional_configs():
+    root = tempfile.mkdtemp()
+
+    mgr = LocalCheckpointCollectionManager('lccm', root)
+    assert mgr.get_configs()['max_inflight_saves'] == 1
+
+    mgr = LocalCheckpointCollectionManager('lccm', root, max_inflight_saves='3')
+    assert mgr.get_configs()['max_inflight_saves'] == 3
+
+    with pytest.raises(ValueError):
+        _ = LocalCheckpointCollectionManager('lccm', root, max_inflight_saves='0')
+
+    # Conflicting layouts of PyTorch states
+    with pytest.raises(ValueError):
+        _ = LocalCheckpointCollectionManager('lccm', root, incremental='enabled', mmap='enabled')
+
+    # Unknown config
+    with pytest.raises(TypeError):
+        _ = LocalCheckpointCollectionManager('lccm', root, max_inflight='3')
+
+
+def test_local_ckpt_mgr_retention():
+    root = Path(tempfile.mkdtemp())
+
+    mgr = LocalCheckpointManager('lcm', str(root), keep_last='1')
+    for i in range(3):
+        mgr.save(PicklableDict(k1=i))
+    mgr.wait()
+
+    assert mgr.len() == 1
+    assert [f.name for f in root.iterdir()] == ['LocalCheckpointManager:lcm_000002.Picklable']
+    assert mgr.load() == PicklableDict(k1=2)
+
+
+def test_local_ckpt_coll_mgr_retention():
+    root = Path(tempfile.mkdtemp())
+
+    mgr = LocalCheckpointCollectionManager('lccm', str(root), keep_last='2', keep_every='3')
+    for i in range(7):
+        mgr.save({'o1': PicklableDict(k1=i)})
+    mgr.wait()
+
+    expected = [f'LocalCheckpointCollectionManager:lccm_00000{i}' for i in [0, 3, 5, 6]]
+    assert sorted(d.name for d in root.iterdir() if d.is_dir()) == expected
+    mgr._lock.release(force=True)
+
+    # Retention is applied to discovered checkpoints as well
+    mgr = LocalCheckpointCollectionManager('lccm', str(root), keep_last='1')
+    assert mgr.len() == 4
+    mgr.save({'o1': PicklableDict(k1=7)})
+    mgr.wait()
+
+    assert mgr.len() == 1
+    assert sorted(d.name for d in root.iterdir() if d.is_dir()) == ['LocalCheckpointCollectionManager:lccm_000007']
+
+
+def test_local_ckpt_coll_mgr_w_io_workers():
+    root = tempfile.mkdtemp()
+
+    mgr = LocalCheckpointCollectionManager('lccm', root, io_workers='4')
+    state = {f'o{i}': PicklableDict(k=i) for i in range(8)}
+    mgr.save(state)
+    assert mgr.load() == state
+
+    # A collection is not committed if any key fails
+    with pytest.raises(KeyError):
+        mgr.save({**state, 'o8': {'k': 8}})
+    assert mgr.len() == 1
+
+
+def test_local_ckpt_coll_mgr_w_manifest():
+    root = Path(tempfile.mkdtemp())
+
+    mgr = LocalCheckpointCollectionManager('lccm', str(root))
+    for i in range(3):
+        mgr.save({'o1': PicklableDict(k1=i), 'o2': PicklableDict(k2=i)})
+    mgr._lock.release(force=True)
+
+    # A collection is committed by renaming its temporary directory after writing the manifest
+    ckpt_root = root / 'LocalCheckpointCollectionManager:lccm_000002'
+    assert (ckpt_root / 'manifest.json').exists()
+    assert not list(root.glob('*.tmp'))
+
+    # Truncated collections are skipped without being loaded
+    (root / 'LocalCheckpointCollectionManager:lccm_000003.tmp').mkdir()
+    with open(ckpt_root / 'o2.Picklable', 'r+b') as f:
+        f.truncate(1)
+    mgr = LocalCheckpointCollectionManager('lccm', str(root))
+    assert mgr.len() == 2
+
+    # Corrupted collections fail the checksum, and the previous collection is loaded instead
+    with open(root / 'LocalCheckpointCollectionManager:lccm_000001' / 'o1.Picklable', 'r+b') as f:
+        f.write(bytes([f.read(1)[0] ^ 0xff]))
+    with mock.patch.object(LocalCheckpointLoader, 'invoke', wraps=LocalCheckpointLoader.invoke) as invoke:
+        assert mgr.load() == {'o1': PicklableDict(k1=0), 'o2': PicklableDict(k2=0)}
+        assert all('lccm_000000' in call.args[0].path for call in invoke.call_args_list)
+
+
+def test_local_ckpt_coll_mgr_w_linked_files():
+    class Blobs:
+        def __init__(self, step: int, blob: bytes = b'', linked_from: Optional[str] = None) -> None:
+            self.step, self.blob, self.linked_from = step, blob, linked_from
+
+    # Saved like incremental checkpoints, as a directory with an index and a blob linked from the previous checkpoint
+    def saver(obj: Blobs, path: str) -> LocalCheckpoint:
+        ckpt = LocalCheckpoint(obj, path)
+        d = Path(ckpt.path)
+        d.mkdir()
+        (d / 'index').write_text(str(obj.step))
+        if obj.linked_from is None:
+            (d / 'blob').write_bytes(obj.blob)
+        else:
+            os.link(Path(obj.linked_from) / 'blob', d / 'blob')
+        return ckpt
+
+    def loader(ckpt: LocalCheckpoint) -> Tuple[int, bytes]:
+        d = Path(ckpt.path)
+        return int((d / 'index').read_text()), (d / 'blob').read_bytes()
+
+    LocalCheckpointSaver.register_handler(Blobs, saver)
+    LocalCheckpointLoader.register_handler(Blobs, loader)
+    blob = os.urandom(1 << 16)
+
+    mgr = LocalCheckpointCollectionManager('lccm', tempfile.mkdtemp())
+    mgr.save({'o1': Blobs(0, blob)})
+    with patch.object(zlib, 'crc32', wraps=zlib.crc32) as crc32:
+        mgr.save({'o1': Blobs(1, linked_from=mgr._ckpt_list[-1]['o1'].path)})
+
+    # The checksum of the linked blob is not computed again, but loading still verifies it
+    assert all(call.args[0] != blob for call in crc32.call_args_list)
+    assert mgr.load() == {'o1': (1, blob)}
+    with open(Path(mgr._ckpt_list[-1]['o1'].path) / 'blob', 'r+b') as f:
+        f.write(bytes([blob[0] ^ 0xff]))
+    with pytest.raises(Exception, match='Checksum'):
+        mgr._load_impl(mgr._ckpt_list[-1])
+    mgr._lock.release(force=True)
+
+
+@pytest.mark.parametrize('codec,magic,module', [
+    ('zstd', b'\x28\xb5\x2f\xfd', 'zstandard'),
+    ('lz4', b'\x04\x22\x4d\x18', 'lz4'),
+])
+def test_local_ckpt_coll_mgr_w_compression(codec: str, magic: bytes, module: str):
+    pytest.importorskip(module)
+
+    root = Path(tempfile.mkdtemp())
+    state = {'o1': PicklableDict(k1=[0] * 1024), 'o2': 3}
+
+    # Keys saved by the I/O workers are compressed too
+    mgr = LocalCheckpointCollectionManager('lccm', str(root), compression=codec, io_workers='2')
+    mgr.save(state)
+    for f in (root / 'LocalCheckpointCollectionManager:lccm_000000').glob('o*'):
+        with open(f, 'rb') as fp:
+            assert fp.read(4) == magic
+    assert mgr.load() == state
+
+    # Other managers in the process compress with their own configs
+    plain_root = Path(tempfile.mkdtemp())
+    LocalCheckpointCollectionManager('lccm', str(plain_root)).save(state)
+    for f in (plain_root / 'LocalCheckpointCollectionManager:lccm_000000').glob('o*'):
+        with open(f, 'rb') as fp:
+            assert fp.read(4) != magic
+
+    # Uncompressed checkpoints can still be loaded
+    with decompressing_reader(io.BytesIO(dill.dumps(state))) as f:
+        assert dill.load(f) == state
+
+    # Decompressed data is spilled to a temporary file rather than held in memory when it has to be seekable
+    ckpt_path = next((root / 'LocalCheckpointCollectionManager:lccm_000000').glob('o1*'))
+    with open(ckpt_path, 'rb') as fp, patch('lattice_addons.state.compression._SPOOL_MAX_SIZE', 1024):
+        with decompressing_reader(fp, seekable=True) as f:
+            assert f._rolled  # type: ignore[attr-defined]
+            assert dill.load(f) == state['o1']
+
+
+def test_sharded_local_ckpt_coll_mgr():
+    root = Path(tempfile.mkdtemp())
+    state = {
+        'o1': PicklableDict({f'k{i}': i for i in range(5)}),
+        'o2': PicklableWrapper([1, 2, 3]),
+    }
+
+    def create_mgr(rank: int, world_size: int) -> ShardedLocalCheckpointCollectionManager:
+        with patch.dict(os.environ, {'RANK': str(rank), 'WORLD_SIZE': str(world_size)}):
+            return ShardedLocalCheckpointCollectionManager('slccm', str(root), shard_commit_timeout='1')
+
+    # Rank 0 can not commit before rank 1 writes its shard
+    mgr0 = create_mgr(0, 2)
+    with pytest.raises(TimeoutError):
+        mgr0.save(state)
+    assert mgr0.len() == 0
+    assert create_mgr(0, 2).len() == 0
+
+    # Shards left by the failed attempt are rewritten
+    ckpt_root = root / 'ShardedLocalCheckpointCollectionManager:slccm_000000'
+    (ckpt_root / 'rank_1').mkdir()
+    (ckpt_root / 'rank_1' / 'stale').touch()
+    (ckpt_root / 'rank_1' / 'committed').touch()
+
+    mgr0, mgr1 = create_mgr(0, 2), create_mgr(1, 2)
+    mgr1.save(state)
+    mgr0.save(state)
+
+    assert (ckpt_root / 'manifest.json').exists()
+    assert not (ckpt_root / 'rank_1' / 'stale').exists()
+    assert len(list((ckpt_root / 'rank_0').iterdir())) > 1
+    assert len(list((ckpt_root / 'rank_1').iterdir())) > 1
+
+    # Load with a different world size
+    loaded = create_mgr(0, 3).load()
+    assert loaded['o1'] == state['o1']
+    assert list(loaded['o1'].keys()) == list(state['o1'].keys())
+    assert type(loaded['o1']) is PicklableDict
+    assert loaded['o2'].wrapped == state['o2'].wrapped
+
+
+def test_cas_local_ckpt_coll_mgr():
+    root = Path(tempfile.mkdtemp())
+
+    mgr = CASLocalCheckpointCollectionManager('cccm', str(root), keep_last='1', sweep_grace_period='0')
+    mgr.save({'o1': PicklableDict(k1=1), 'o2': PicklableDict(k2=2)})
+    mgr.save({'o1': PicklableDict(k1=1), 'o2': PicklableDict(k2=3)})
+    mgr.wait()
+
+    # Unchanged objects are stored once, and unreferenced objects are swept
+    assert [f.name for f in root.glob('*.json')] == ['CASLocalCheckpointCollectionManager:cccm_000001.json']
+    assert len(list((root / 'objects').glob('*/*'))) == 2
+
+    # Objects deleted by another process after they are listed do not stop the sweep
+    unreferenced = [root / 'objects' / 'ff' / f'ff{i}.Picklable' for i in range(2)]
+    for f in unreferenced:
+        f.parent.mkdir(exist_ok=True)
+        f.write_bytes(b'x')
+    stat = Path.stat
+
+    def deleted_after_listing(self, **kwargs):
+        if self == unreferenced[0]:
+            self.unlink()
+        return stat(self, **kwargs)
+
+    with patch.object(Path, 'stat', deleted_after_listing):
+        mgr._sweep()
+    assert not any(f.exists() for f in unreferenced)
+    assert len(list((root / 'objects').glob('*/*'))) == 2
+    mgr._lock.release(force=True)
+
+    # Uncommitted collections are not discovered
+    (root / 'CASLocalCheckpointCollectionManager:cccm_000002.json').write_text('{')
+    mgr = CASLocalCheckpointCollectionManager('cccm', str(root))
+    assert mgr.len() == 1
+    assert mgr.load() == {'o1': PicklableDict(k1=1), 'o2': PicklableDict(k2=3)}
+
+
+def create_server_response_message(req_type: RequestType, job_id: str, uid: str, ckpt_name: str,
+                                   body: Any) -> List[bytes]:
     response_msg = CheckpointMessage(req_type, job_id, uid, ckpt_name, body)
     return response_msg.encode_message()
 
 
+@contextlib.contextmanager
+def scripted_service(responses: List[List[bytes]]) -> Iterator[int]:
+    # Answers requests with the scripted responses in order, and yields the port it listens on
+    port = _free_port()
+    with zmq.Context() as context, context.socket(zmq.REP) as s:
+        s.bind(f'tcp://*:{port}')
+
+        def serve() -> None:
+            for response in responses:
+                CheckpointMessage.recv(s)
+                s.send_multipart(response)
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        yield port
+        thread.join(timeout=10)
+        assert not thread.is_alive(), 'Not all the scripted responses were requested'
+
+
 def test_create_remote_ckpt():
     obj = PicklableDict(k1=3)
     _ = RemoteCheckpoint(obj, '', '', '')
@@ -377,29 +660,38 @@ def test_remote_ckpt_processors_for_picklable_dict():
     key_name = "obj"
 
     with patch('zmq.Socket') as mock_socket:
-        mock_socket.recv.return_value = b'ACK'
+        mock_socket.recv_multipart.return_value = create_server_response_message(RequestType.SAVE, JOB_ID, UID,
+                                                                                 'obj.Picklable', b'ACK')
         ckpt = RemoteCheckpointSaver.invoke(obj, mock_socket, JOB_ID, UID, key_name)
 
-        response_msg = CheckpointMessage(RequestType.LIST, '', '', '', {UID: ['obj.Picklable']}).encode_message()
-        mock_socket.recv.return_value = response_msg
+        # The checkpoint is sent as a raw frame after the header frame
+        (frames,), _ = mock_socket.send_multipart.call_args
+        request = CheckpointMessage.parse_message(frames)
+        assert request.req_type == RequestType.SAVE and request.ckpt_name == 'obj.Picklable'
+        assert dill.loads(request.body) == obj
+
+        response_msg = CheckpointMessage(RequestType.EXISTS, JOB_ID, UID, 'obj.Picklable', True).encode_message()
+        mock_socket.recv_multipart.return_value = response_msg
         assert ckpt.exists(mock_socket)
 
     with patch('zmq.Socket') as mock_socket:
         byte_buffer = io.BytesIO()
         dill.dump(obj, byte_buffer)
-        response_msg = CheckpointMessage(RequestType.LOAD, JOB_ID, UID, "obj", byte_buffer.getvalue()).encode_message()
-        mock_socket.recv.return_value = response_msg
+        response_msg = CheckpointMessage(RequestType.LOAD_CHUNK, JOB_ID, UID, "obj",
+                                         byte_buffer.getvalue()).encode_message()
+        mock_socket.recv_multipart.return_value = response_msg
 
         resumed_obj = RemoteCheckpointLoader.invoke(ckpt, mock_socket)
         assert resumed_obj == obj
         assert type(resumed_obj) == type(obj)
 
     with patch('zmq.Socket') as mock_socket:
-        mock_socket.recv.return_value = b'ACK'
+        mock_socket.recv_multipart.return_value = create_server_response_message(RequestType.DEL, JOB_ID, UID,
+                                                                                 'obj.Picklable', b'ACK')
         RemoteCheckpointDeleter.invoke(ckpt, mock_socket)
 
-        response_msg = CheckpointMessage(RequestType.LIST, '', '', '', {UID: []}).encode_message()
-        mock_socket.recv.return_value = response_msg
+        response_msg = CheckpointMessage(RequestType.EXISTS, JOB_ID, UID, 'obj.Picklable', False).encode_message()
+        mock_socket.recv_multipart.return_value = response_msg
         assert not ckpt.exists(mock_socket)
 
 
@@ -408,7 +700,6 @@ def test_remote_collection_ckpt_mgr_w_history():
     UID = "RemoteCheckpointCollectionManager:rccm_000000"
 
     ckpt_service_endpoint = 'localhost'
-    ckpt_service_port = '5555'
 
     obj1 = PicklableDict(k1=3)
     obj2 = PicklableDict(k2=4)
@@ -428,14 +719,13 @@ def test_remote_collection_ckpt_mgr_w_history():
                                                                   uid=UID,
                                                                   ckpt_name='',
                                                                   body=scope1_discover_response_body)
-        scope1_save_response_obj1 = b'ACK'
-        scope1_save_response_obj2 = b'ACK'
+        # Both objects are saved with a single request
+        scope1_save_response = create_server_response_message(RequestType.SAVE_MANY, JOB_ID, UID, '', b'ACK')
 
         # Messages that will be read from socket for scope1
         mocked_responses.append(scope1_validate_response)
         mocked_responses.append(scope1_discover_response)
-        mocked_responses.append(scope1_save_response_obj1)
-        mocked_responses.append(scope1_save_response_obj2)
+        mocked_responses.append(scope1_save_response)
 
         # Expected messages on socket for scope 2
         scope2_validate_response = create_server_response_message(RequestType.PING,
@@ -450,48 +740,40 @@ def test_remote_collection_ckpt_mgr_w_history():
                                                                   ckpt_name='',
                                                                   body=scope2_discover_response_body)
 
-        buffer = io.BytesIO()
-        dill.dump(obj1, buffer)
-        scope2_load_response_obj1 = create_server_response_message(RequestType.LOAD,
-                                                                   job_id=JOB_ID,
-                                                                   uid=UID,
-                                                                   ckpt_name='o1',
-                                                                   body=buffer.getvalue())
-
-        buffer = io.BytesIO()
-        dill.dump(obj2, buffer)
-        scope2_load_response_obj2 = CheckpointMessage(RequestType.LOAD,
-                                                      job_id=JOB_ID,
-                                                      uid=UID,
-                                                      ckpt_name='o2',
-                                                      body=buffer.getvalue()).encode_message()
+        # Both objects are loaded with a single request, and their first chunks are attached to the response
+        scope2_load_response = CheckpointMessage(RequestType.LOAD_MANY,
+                                                 job_id=JOB_ID,
+                                                 uid=UID,
+                                                 ckpt_name='',
+                                                 body={'names': ['o1.Picklable', 'o2.Picklable'], 'missing': []},
+                                                 attachments=[dill.dumps(obj1), dill.dumps(obj2)]).encode_message()
 
         # Messages that will be read from socket for scope 2
         mocked_responses.append(scope2_validate_response)
         mocked_responses.append(scope2_discover_response)
-        mocked_responses.append(scope2_load_response_obj1)
-        mocked_responses.append(scope2_load_response_obj2)
+        mocked_responses.append(scope2_load_response)
 
         return mocked_responses
 
     # Functions testing the scope of checkpoints
-    def scope1() -> Dict[str, PicklableDict]:
-        rccm = RemoteCheckpointCollectionManager('rccm', JOB_ID, ckpt_service_endpoint, ckpt_service_port)
+    def scope1(ckpt_service_port: str) -> Dict[str, PicklableDict]:
+        # Without leases, so that only the saves are requested
+        rccm = RemoteCheckpointCollectionManager('rccm', JOB_ID, ckpt_service_endpoint, ckpt_service_port,
+                                                 ckpt_service_lease_ttl='0')
 
         state = {'o1': obj1, 'o2': obj2}
 
         rccm.save(state)
         return copy.deepcopy(state)
 
-    def scope2(objs: Dict[str, PicklableDict]) -> None:
+    def scope2(ckpt_service_port: str, objs: Dict[str, PicklableDict]) -> None:
         rccm = RemoteCheckpointCollectionManager('rccm', JOB_ID, ckpt_service_endpoint, ckpt_service_port)
 
         assert rccm.len() != 0
         assert objs == rccm.load()
 
-    with patch.object(zmq.Socket, 'recv', side_effect=side_effects()), \
-         patch.object(zmq.Socket, 'send', side_effects=[0, 0, 0, 0, 0, 0, 0]):
-        scope2(scope1())
+    with scripted_service(side_effects()) as port:
+        scope2(str(port), scope1(str(port)))
 
 
 def test_default_global_ckpt_setting():
@@ -573,40 +855,177 @@ def test_create_s3_ckpt():
 def test_s3_ckpt_processors_for_picklable_dict():
 
     mock_s3_client = MagicMock()
-    boto3.client = MagicMock(return_value=mock_s3_client)
+    with patch.object(S3CheckpointHelper, 's3_client', mock_s3_client):
+        mock_s3_client.head_bucket.return_value = {}
+        mock_s3_client.head_object.return_value = {}
+        mock_s3_client.put_object.return_value = {}
+
+        BUCKET_NAME = "test-bucket"
+        JOB_ID = "test-job"
+        UID = "test_uid"
+        obj = PicklableDict(k1=3)
+        key_name = "obj"
 
-    mock_s3_client.head_bucket.return_value = {}
-    mock_s3_client.head_object.return_value = {}
-    mock_s3_client.put_object.return_value = {}
+        ckpt = S3CheckpointSaver.invoke(obj, BUCKET_NAME, JOB_ID, UID, key_name)
+        byte_buffer = io.BytesIO()
+        dill.dump(obj, byte_buffer)
 
-    BUCKET_NAME = "test-bucket"
-    JOB_ID = "test-job"
-    UID = "test_uid"
-    obj = PicklableDict(k1=3)
-    key_name = "obj"
+        body = io.BytesIO(byte_buffer.getvalue())
+        streaming_body = botocore.response.StreamingBody(raw_stream=body, content_length=len(body.getbuffer()))
+        mock_s3_client.get_object.return_value = {'Body': streaming_body}
 
-    ckpt = S3CheckpointSaver.invoke(obj, BUCKET_NAME, JOB_ID, UID, key_name)
-    byte_buffer = io.BytesIO()
-    dill.dump(obj, byte_buffer)
+        resumed_obj = S3CheckpointLoader.invoke(ckpt)
 
-    body = io.BytesIO(byte_buffer.getvalue())
-    streaming_body = botocore.response.StreamingBody(raw_stream=body, content_length=len(body.getbuffer()))
-    mock_s3_client.get_object.return_value = {'Body': streaming_body}
+        assert resumed_obj == obj
+        assert type(resumed_obj) == type(obj)
 
-    resumed_obj = S3CheckpointLoader.invoke(ckpt)
 
-    assert resumed_obj == obj
-    assert type(resumed_obj) == type(obj)
+def test_s3_multipart_transfers():
+    class FakeS3Client():
+        def __init__(self):
+            self.objects: Dict[str, bytes] = {}
+            self.uploads: Dict[str, Dict[int, bytes]] = {}
+            self.failures = {'upload_part': 1, 'get_object': 1}
+
+        def _fail_once(self, op: str) -> None:
+            if self.failures[op] > 0:
+                self.failures[op] -= 1
+                raise ConnectionError(op)
+
+        def put_object(self, Bucket, Key, Body):
+            self.objects[Key] = Body
+            return {}
+
+        def create_multipart_upload(self, Bucket, Key):
+            self.uploads['upload-id'] = {}
+            return {'UploadId': 'upload-id'}
+
+        def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+            self._fail_once('upload_part')
+            self.uploads[UploadId][PartNumber] = Body
+            return {'ETag': str(PartNumber)}
+
+        def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+            parts = self.uploads.pop(UploadId)
+            assert [p['PartNumber'] for p in MultipartUpload['Parts']] == sorted(parts)
+            self.objects[Key] = b''.join(parts[n] for n in sorted(parts))
+            return {}
+
+        def abort_multipart_upload(self, Bucket, Key, UploadId):
+            self.uploads.pop(UploadId)
+            return {}
+
+        def get_object(self, Bucket, Key, Range):
+            data = self.objects[Key]
+            start, end = map(int, Range[len('bytes='):].split('-'))
+            if start > 0:
+                self._fail_once('get_object')
+            end = min(end, len(data) - 1)
+            return {'Body': io.BytesIO(data[start:end + 1]), 'ContentRange': f'bytes {start}-{end}/{len(data)}'}
+
+    client = FakeS3Client()
+    with patch.object(S3CheckpointHelper, 's3_client', client), \
+            S3CheckpointHelper.configured(part_size=1024, max_concurrency=2, max_retries=1):
+        data = os.urandom(10 * 1024 + 17)
+        with S3CheckpointHelper.open_writer('bucket', 'job', 'uid', 'obj') as f:
+            for i in range(0, len(data), 100):
+                f.write(data[i:i + 100])
+        assert client.objects['job/uid/obj'] == data
+        assert not client.uploads
+
+        with S3CheckpointHelper.open_reader('bucket', 'job', 'uid', 'obj') as f:
+            assert f.read() == data
+
+        # Small objects are uploaded with a single request
+        S3CheckpointHelper.save('bucket', 'job', 'uid', 'small', b'small')
+        assert S3CheckpointHelper.load('bucket', 'job', 'uid', 'small') == b'small'
+
+        # Failed uploads are aborted
+        with pytest.raises(RuntimeError):
+            with S3CheckpointHelper.open_writer('bucket', 'job', 'uid', 'failed') as f:
+                f.write(data)
+                raise RuntimeError()
+        assert 'job/uid/failed' not in client.objects
+        assert not client.uploads
+
+    # The settings only apply to the transfers of the thread which configured them
+    assert S3CheckpointHelper._settings() == (64 * 1024 * 1024, 4, 3)
+
+
+def test_s3_list_paginates():
+    mock_s3_client = MagicMock()
+    mock_s3_client.get_paginator.return_value.paginate.return_value = [
+        {'Contents': [{'Key': 'job/uid_000000/o1.Picklable'}, {'Key': 'job/uid_000000/o2.Picklable'}]},
+        {'Contents': [{'Key': 'job/uid_000001/o1.Picklable'}, {'Key': 'job/mgr.index.json'}]},
+        {},
+    ]
+
+    with patch.object(S3CheckpointHelper, 's3_client', mock_s3_client):
+        assert S3CheckpointHelper.list('bucket', 'job') == {
+            'uid_000000': ['o1.Picklable', 'o2.Picklable'],
+            'uid_000001': ['o1.Picklable'],
+        }
+
+    mock_s3_client.get_paginator.assert_called_once_with('list_objects_v2')
+    mock_s3_client.get_paginator.return_value.paginate.assert_called_once_with(Bucket='bucket', Prefix='job/')
+
+
+def test_s3_index_entries():
+    class FakeS3Client():
+        def __init__(self):
+            self.objects: Dict[str, bytes] = {}
+            self.get_object = MagicMock()
+
+        def put_object(self, Bucket, Key, Body):
+            self.objects[Key] = Body
+
+        def delete_object(self, Bucket, Key):
+            self.objects.pop(Key, None)
+
+        def get_paginator(self, op):
+            pages = MagicMock()
+            pages.paginate.side_effect = lambda Bucket, Prefix: [
+                {'Contents': [{'Key': k} for k in sorted(self.objects) if k.startswith(Prefix)]}
+            ]
+            return pages
+
+    client = FakeS3Client()
+    with patch.object(S3CheckpointHelper, 's3_client', client):
+        assert S3CheckpointHelper.load_index('bucket', 'job', 'mgr') is None
+
+        # Writers of different checkpoint UIDs, e.g. in different processes, do not overwrite each other's entries
+        S3CheckpointHelper.save_index_entry('bucket', 'job', 'mgr', 'mgr_000000', ['o1'])
+        S3CheckpointHelper.save_index_entry('bucket', 'job', 'mgr', 'mgr_000001', ['o1', 'o2'])
+        S3CheckpointHelper.save_index_entry('bucket', 'job', 'other', 'other_000000', ['o3'])
+        index = S3CheckpointHelper.load_index('bucket', 'job', 'mgr')
+        assert index == {'mgr_000000': ['o1'], 'mgr_000001': ['o1', 'o2']}
+
+        # Entries without commit markers are not loaded
+        S3CheckpointHelper.save_index_entry('bucket', 'job', 'mgr', 'mgr_000002', ['o1'])
+        del client.objects['job/mgr.index/mgr_000002.committed']
+        S3CheckpointHelper.delete_index_entry('bucket', 'job', 'mgr', 'mgr_000000', ['o1'])
+        assert S3CheckpointHelper.load_index('bucket', 'job', 'mgr') == {'mgr_000001': ['o1', 'o2']}
+
+    # Indexes are loaded from the listing alone
+    assert client.get_object.call_count == 0
 
 
 @mock.patch('lattice_addons.state.util.S3CheckpointHelper.ping')
 @mock.patch('lattice_addons.state.util.S3CheckpointHelper.list')
-@mock.patch('lattice_addons.state.util.S3CheckpointHelper.save')
-@mock.patch('lattice_addons.state.util.S3CheckpointHelper.load')
-def test_s3_collection_ckpt_mgr(mock_load, mock_save, mock_list, mock_ping):
+@mock.patch('lattice_addons.state.util.S3CheckpointHelper.load_index')
+@mock.patch('lattice_addons.state.util.S3CheckpointHelper.save_index_entry')
+@mock.patch('lattice_addons.state.util.S3CheckpointHelper.open_writer')
+@mock.patch('lattice_addons.state.util.S3CheckpointHelper.open_reader')
+def test_s3_collection_ckpt_mgr(mock_load, mock_save, mock_save_index, mock_load_index, mock_list, mock_ping):
 
     mock_ping.return_value = True
-    mock_list.side_effect = [{}, {'S3CheckpointCollectionManager:smg_000000': ['o1.Picklable', 'o2.Picklable']}]
+    mock_list.return_value = {}
+
+    # The first manager falls back to listing, and the second one discovers checkpoints from the saved index
+    saved_index: Dict[str, List[str]] = {}
+    mock_save_index.side_effect = lambda bucket_name, job_id, name, ckpt_uid, ckpt_names: \
+        saved_index.update({ckpt_uid: list(ckpt_names)})
+    mock_load_index.side_effect = [None, saved_index]
 
     obj1 = PicklableDict(k1=3)
     obj2 = PicklableDict(k2=4)
@@ -615,13 +1034,15 @@ def test_s3_collection_ckpt_mgr(mock_load, mock_save, mock_list, mock_ping):
     buffer2 = io.BytesIO()
     dill.dump(obj1, buffer1)
     dill.dump(obj2, buffer2)
-    mock_load.side_effect = [buffer1.getvalue(), buffer2.getvalue()]
+    mock_save.side_effect = lambda **_: contextlib.nullcontext(io.BytesIO())
+    mock_load.side_effect = [contextlib.nullcontext(buffer1), contextlib.nullcontext(buffer2)]
+    buffer1.seek(0)
+    buffer2.seek(0)
 
     ROOT = "s3://test-bucket/test-job/"
     UID = "smg"
 
     def scope1() -> Dict[str, PicklableDict]:
-        mock_list.return_value = {}
         mgr = S3CheckpointCollectionManager(UID, ROOT)
 
         state = {'o1': obj1, 'o2': obj2}
@@ -636,3 +1057,414 @@ def test_s3_collection_ckpt_mgr(mock_load, mock_save, mock_list, mock_ping):
         return copy.deepcopy(mgr.load())
 
     assert scope1() == scope2()
+    assert saved_index == {'S3CheckpointCollectionManager:smg_000000': ['o1.Picklable', 'o2.Picklable']}
+    mock_list.assert_called_once()
+
+
+def test_tiered_ckpt_coll_mgr():
+    # An in-memory durable tier
+    objects: Dict[str, bytes] = {}
+    indexes: Dict[str, Dict[str, List[str]]] = {}
+
+    @contextlib.contextmanager
+    def open_writer(bucket_name, job_id, uid, ckpt_name):
+        with io.BytesIO() as f:
+            yield f
+            objects[f'{uid}/{ckpt_name}'] = f.getvalue()
+
+    def open_reader(bucket_name, job_id, uid, ckpt_name):
+        return contextlib.nullcontext(io.BytesIO(objects[f'{uid}/{ckpt_name}']))
+
+    def delete(bucket_name, job_id, uid, ckpt_name):
+        del objects[f'{uid}/{ckpt_name}']
+
+    def load_index(bucket_name, job_id, name):
+        return copy.deepcopy(indexes.get(name)) or None
+
+    def save_index_entry(bucket_name, job_id, name, ckpt_uid, ckpt_names):
+        indexes.setdefault(name, {})[ckpt_uid] = list(ckpt_names)
+
+    def delete_index_entry(bucket_name, job_id, name, ckpt_uid, ckpt_names):
+        del indexes[name][ckpt_uid]
+
+    with patch.multiple(S3CheckpointHelper, ping=MagicMock(return_value=True), list=MagicMock(return_value={}),
+                        load_index=load_index, save_index_entry=save_index_entry,
+                        delete_index_entry=delete_index_entry, open_writer=open_writer,
+                        open_reader=MagicMock(side_effect=open_reader), delete=delete):
+        root = Path(tempfile.mkdtemp())
+        configs = {'durable_root': 's3://test-bucket/test-job', 'keep_last': '1'}
+
+        mgr = TieredCheckpointCollectionManager('tcm', str(root), **configs)
+        for i in range(2):
+            mgr.save({'o1': PicklableDict(k1=i), 'o2': PicklableDict(k2=i)})
+        mgr.wait()
+        mgr.release()
+
+        # Collections are copied to the durable tier, and expired in both tiers
+        assert sorted(objects) == [f'S3CheckpointCollectionManager:tcm_000001/{k}.Picklable' for k in ['o1', 'o2']]
+        assert sorted(d.name for d in root.iterdir() if d.is_dir()) == ['LocalCheckpointCollectionManager:tcm_000001']
+
+        # Restarting on the same node loads from the fast tier
+        mgr = TieredCheckpointCollectionManager('tcm', str(root), **configs)
+        assert mgr.load() == {'o1': PicklableDict(k1=1), 'o2': PicklableDict(k2=1)}
+        S3CheckpointHelper.open_reader.assert_not_called()
+
+        # Checkpoints are created in the fast tier
+        ckpt = mgr._create_checkpoint('Picklable', 'LocalCheckpointCollectionManager:tcm_000001', 'o1')
+        assert isinstance(ckpt, LocalCheckpoint) and Path(ckpt.path).parent.parent == root
+        mgr.release()
+
+        # Restarting on another node loads from the durable tier
+        mgr = TieredCheckpointCollectionManager('tcm', tempfile.mkdtemp(), **configs)
+        assert mgr.load() == {'o1': PicklableDict(k1=1), 'o2': PicklableDict(k2=1)}
+        assert S3CheckpointHelper.open_reader.call_count == 2
+        mgr.save({'o1': PicklableDict(k1=2), 'o2': PicklableDict(k2=2)})
+        mgr.wait()
+        assert sorted(objects) == [f'S3CheckpointCollectionManager:tcm_000002/{k}.Picklable' for k in ['o1', 'o2']]
+
+    # The durable tier is required
+    with pytest.raises(ValueError):
+        TieredCheckpointCollectionManager('tcm', tempfile.mkdtemp())
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def test_peer_ckpt_coll_mgr():
+    ports = [_free_port() for _ in range(3)]
+    for port in ports[:2]:
+        ReplicaStore(port).start()
+    # The third store is down
+    peers = ';'.join(f'localhost:{port}' for port in ports)
+    configs = {'peers': peers, 'peer_replicas': '2', 'peer_timeout': '0.5', 'keep_last': '1'}
+
+    with patch.dict(os.environ, {'RANK': '0'}):
+        mgr = PeerCheckpointCollectionManager('pcm', **configs)
+        for i in range(2):
+            mgr.save({'o1': PicklableDict(k1=i)})
+        mgr.wait()
+        assert mgr._holders == {'PeerCheckpointCollectionManager:pcm_000001': [f'localhost:{p}' for p in ports[:2]]}
+
+    # A partially saved collection is not discovered
+    with zmq.Context() as context, context.socket(zmq.REQ) as s:
+        s.connect(f'tcp://localhost:{ports[1]}')
+        msg = CheckpointMessage(RequestType.SAVE, 'rank_0', 'PeerCheckpointCollectionManager:pcm_000002',
+                                'o1.PicklableDict', b'')
+        msg.send(s)
+        CheckpointMessage.recv(s)
+
+    # A process replacing the failed node of rank 0 restores from the memory of its peer
+    peers = ';'.join(f'localhost:{port}' for port in [ports[2], ports[1]])
+    with patch.dict(os.environ, {'RANK': '0'}):
+        mgr = PeerCheckpointCollectionManager('pcm', **{**configs, 'peers': peers})
+        assert mgr.len() == 1
+        assert mgr.load() == {'o1': PicklableDict(k1=1)}
+
+    with pytest.raises(ValueError):
+        PeerCheckpointCollectionManager('pcm')
+
+
+def test_remote_ckpt_streams_chunks():
+    port = _free_port()
+    store = ReplicaStore(port)
+    store.start()
+    obj = PicklableDict(k1=list(range(1000)))
+
+    with patch.multiple(CheckpointStream, chunk_size=256, credit=3), zmq.Context() as context:
+        for socket_type in [zmq.DEALER, zmq.REQ]:
+            with context.socket(socket_type) as s:
+                s.connect(f'tcp://localhost:{port}')
+                uid = f'uid_{socket_type}'
+                ckpt = RemoteCheckpointSaver.invoke(obj, s, 'job', uid, 'obj')
+
+                # The checkpoint is sent in chunks, and neither side joins them
+                chunks = store._checkpoints['job'][uid]['obj.Picklable']
+                assert len(chunks) > 3 and all(len(chunk) == 256 for chunk in chunks[:-1])
+                assert RemoteCheckpointLoader.invoke(ckpt, s) == obj
+
+                # A failed save is aborted, and the socket can still be used
+                with pytest.raises(RuntimeError):
+                    with CheckpointStream.open_writer(s, 'job', uid, 'failed') as f:
+                        f.write(b'0' * 1000)
+                        raise RuntimeError()
+                assert 'failed' not in store._checkpoints['job'][uid] and not store._uploads
+                with pytest.raises(Exception, match='Checkpoint not found'):
+                    RemoteCheckpointLoader.invoke(RemoteCheckpoint(obj, 'job', uid, 'missing'), s)
+                assert RemoteCheckpointLoader.invoke(ckpt, s) == obj
+
+
+def test_checkpoint_client():
+    port = _free_port()
+
+    def load(ckpt_name: str) -> CheckpointMessage:
+        return CheckpointMessage(RequestType.LOAD, 'job', 'uid', ckpt_name, b'')
+
+    def answer(s: zmq.Socket, frames: List[bytes]) -> None:
+        # The envelope, i.e. the identity of the client, the correlation ID and the delimiter, is echoed
+        ckpt_name = CheckpointMessage.parse_message(frames[3:]).ckpt_name
+        response = CheckpointMessage(RequestType.LOAD, 'job', 'uid', ckpt_name, ckpt_name.encode())
+        s.send_multipart(frames[:3] + response.encode_message())
+
+    with zmq.Context() as context, context.socket(zmq.ROUTER) as s:
+        s.bind(f'tcp://*:{port}')
+        with CheckpointClient(f'tcp://localhost:{port}', context, timeout=0.5) as client:
+            # Requests are in flight at once, and responses are matched with them in whatever order they arrive
+            futures = [client.request(load(f'c{i}')) for i in range(3)]
+            for frames in reversed([s.recv_multipart() for _ in futures]):
+                answer(s, frames)
+            assert [bytes(future.result().body) for future in futures] == [b'c0', b'c1', b'c2']
+
+            # A request not answered in time fails, and its late response is dropped
+            future = client.request(load('late'))
+            frames = s.recv_multipart()
+            with pytest.raises(RecvTimedOutException):
+                future.result()
+            answer(s, frames)
+            future = client.request(load('next'), timeout=None)
+            answer(s, s.recv_multipart())
+            assert bytes(future.result().body) == b'next'
+
+        with pytest.raises(RuntimeError):
+            client.request(load('closed'))
+
+
+def test_hash_ring():
+    ring = HashRing(['a', 'b', 'c'])
+    keys = [f'key_{i}' for i in range(1000)]
+    owners = {k: ring.owners(k, 2) for k in keys}
+    assert all(len(set(o)) == 2 for o in owners.values())
+    # Keys are spread evenly
+    assert all(200 < sum(o[0] == node for o in owners.values()) < 470 for node in ring.nodes)
+    assert ring.owners('key', 5) == ring.owners('key', 3)
+
+    # Adding a node only moves keys to it
+    bigger = HashRing(['a', 'b', 'c', 'd'])
+    assert all(bigger.owners(k)[0] in (owners[k][0], 'd') for k in keys)
+
+    with pytest.raises(ValueError):
+        HashRing([])
+
+
+def test_sharded_remote_collection_ckpt_mgr():
+    ports = [_free_port() for _ in range(2)]
+    stores = [ReplicaStore(port) for port in ports]
+    for store in stores:
+        store.start()
+    endpoint = ';'.join(f'localhost:{port}' for port in ports)
+    objs = {f'o{i}': PicklableDict(k=i) for i in range(8)}
+
+    mgr = RemoteCheckpointCollectionManager('srccm', 'job', endpoint, io_workers='2')
+    mgr.save(objs)
+    mgr.wait()
+    # Keys are spread over the shards, and every key is held by one shard
+    held = [set(store._checkpoints['job'].get('RemoteCheckpointCollectionManager:srccm_000000', {}))
+            for store in stores]
+    assert all(held) and not held[0] & held[1] and len(held[0] | held[1]) == len(objs)
+
+    mgr = RemoteCheckpointCollectionManager('srccm', 'job', endpoint)
+    assert mgr.len() == 1 and mgr.load() == objs
+
+    # With replicas, a key is loaded from another shard if its primary shard lost it
+    objs = {k: PicklableDict(k=-obj['k']) for k, obj in objs.items()}
+    mgr = RemoteCheckpointCollectionManager('srccm', 'job', endpoint, ckpt_service_replicas='2')
+    mgr.save(objs)
+    mgr.wait()
+    for store in stores:
+        assert len(store._checkpoints['job']['RemoteCheckpointCollectionManager:srccm_000001']) == len(objs)
+    stores[0]._checkpoints['job']['RemoteCheckpointCollectionManager:srccm_000001'].clear()
+    assert RemoteCheckpointCollectionManager('srccm', 'job', endpoint, ckpt_service_replicas='2').load() == objs
+
+
+def test_remote_collection_ckpt_mgr_w_leases():
+    port = _free_port()
+    store = ReplicaStore(port)
+    store.start()
+    endpoint = f'localhost:{port}'
+    objs = {f'o{i}': PicklableDict(k=i) for i in range(4)}
+
+    # Only the first rank uploads the collection, and the others skip the upload
+    ranks = [RemoteCheckpointCollectionManager('lrccm', 'job', endpoint) for _ in range(3)]
+    with patch.object(RemoteCheckpointSaver, 'invoke', wraps=RemoteCheckpointSaver.invoke) as mock_invoke:
+        for rank in ranks:
+            rank.save(objs)
+    assert mock_invoke.call_count == len(objs)
+    assert all(rank.len() == 1 and rank.load() == objs for rank in ranks)
+
+    # A rank waits for the holder of the lease, and takes over when the lease expires
+    with zmq.Context() as context, context.socket(zmq.DEALER) as s:
+        s.connect(f'tcp://{endpoint}')
+        uid = 'RemoteCheckpointCollectionManager:lrccm_000001'
+        CheckpointMessage(RequestType.ACQUIRE, 'job', uid, 'writer',
+                          {'holder': 'stale', 'ttl': 0.5}).send(s)
+        stale = CheckpointMessage.recv(s).body
+        assert stale['holder'] == 'stale'
+
+        objs = {k: PicklableDict(k=-obj['k']) for k, obj in objs.items()}
+        ranks[0].save(objs)
+        assert RemoteCheckpointCollectionManager('lrccm', 'job', endpoint).load() == objs
+
+        # The stale holder can not overwrite the collection of the rank which took over
+        with pytest.raises(Exception, match='Stale fencing token'), CheckpointStream.fenced(stale['token']):
+            RemoteCheckpointSaver.invoke(PicklableDict(k=0), s, 'job', uid, 'o0')
+
+
+def test_lease_table_serializes_commits_per_uid():
+    leases = LeaseTable()
+    committed = threading.Event()
+
+    def commit():
+        with leases.fenced('job', 'uid0', 3):
+            committed.set()
+
+    with leases.fenced('job', 'uid0', 2):
+        # Leases and commits of other UIDs do not wait for the commit in progress
+        assert leases.acquire('job', 'uid0', 'o0', {'holder': 0})['holder'] == 0
+        with leases.fenced('job', 'uid1', 1):
+            pass
+
+        # Commits of the same UID do
+        t = threading.Thread(target=commit)
+        t.start()
+        assert not committed.wait(0.1)
+    t.join()
+    assert committed.is_set()
+
+    with pytest.raises(ValueError, match='Stale fencing token'):
+        with leases.fenced('job', 'uid0', 2):
+            pass
+    assert not leases._commit_locks
+
+
+def test_remote_collection_ckpt_mgr_batches_requests():
+    port = _free_port()
+    store = ReplicaStore(port)
+    store.start()
+    endpoint = f'localhost:{port}'
+    objs = {f'o{i}': PicklableDict(k=i) for i in range(8)}
+    objs['large'] = PicklableDict(k=list(range(1000)))
+
+    requests: List[RequestType] = []
+    handle = store._handle
+
+    def record(req):
+        requests.append(req.req_type)
+        return handle(req)
+
+    configs = {'stream_chunk_size': '1024', 'stream_credit': '2'}
+    with patch.object(store, '_handle', side_effect=record), patch.multiple(CheckpointStream, chunk_size=0, credit=0):
+        # Small objects are saved with a single request, and large ones are streamed and committed
+        mgr = RemoteCheckpointCollectionManager('brccm', 'job', endpoint, **configs)
+        mgr.save(objs)
+        assert requests.count(RequestType.SAVE_MANY) == 1 and requests.count(RequestType.SAVE) == 1
+        assert requests.count(RequestType.SAVE_CHUNK) > 1
+
+        # The first chunks of all the objects are loaded with a single request
+        requests.clear()
+        assert RemoteCheckpointCollectionManager('brccm', 'job', endpoint, **configs).load() == objs
+        assert requests.count(RequestType.LOAD_MANY) == 1 and requests.count(RequestType.LOAD_CHUNK) > 0
+
+    # Listings and existence checks are scoped to a UID
+    uid = 'RemoteCheckpointCollectionManager:brccm_000000'
+    with zmq.Context() as context, context.socket(zmq.REQ) as s:
+        s.connect(f'tcp://{endpoint}')
+        CheckpointMessage(RequestType.SAVE, 'job', 'other', 'o0', b'').send(s)
+        CheckpointMessage.recv(s)
+        CheckpointMessage(RequestType.LIST, 'job', uid, '', b'').send(s)
+        assert list(CheckpointMessage.recv(s).body) == [uid]
+        assert RemoteCheckpoint(PicklableDict, 'job', uid, 'o0').exists(s)
+        assert not RemoteCheckpoint(PicklableDict, 'job', uid, 'missing').exists(s)
+
+
+def test_remote_collection_ckpt_mgr_sets_policies():
+    port = _free_port()
+    store = ReplicaStore(port)
+    store.start()
+    endpoint = f'localhost:{port}'
+
+    policies: List[Any] = []
+    handle = store._handle
+
+    def record(req):
+        if req.req_type == RequestType.POLICY:
+            policies.append((req.job_id, req.body))
+        return handle(req)
+
+    with patch.object(store, '_handle', side_effect=record):
+        # The policies left out are the ones of the service
+        RemoteCheckpointCollectionManager('prccm', 'job', endpoint, ckpt_service_keep_last='2',
+                                          ckpt_service_job_ttl='3600')
+        assert policies == [('job', {'keep_last': 2, 'job_ttl': 3600.0})]
+
+        # Jobs without policies of their own do not send them
+        RemoteCheckpointCollectionManager('prccm', 'job', endpoint)
+        assert len(policies) == 1
+
+    with pytest.raises(ValueError):
+        RemoteCheckpointCollectionManager('prccm', 'job', endpoint, ckpt_service_job_quota_bytes='-1')
+
+
+def test_tiered_ckpt_coll_mgr_w_peers():
+    objects: Dict[str, bytes] = {}
+
+    @contextlib.contextmanager
+    def open_writer(bucket_name, job_id, uid, ckpt_name):
+        with io.BytesIO() as f:
+            yield f
+            objects[f'{uid}/{ckpt_name}'] = f.getvalue()
+
+    port = _free_port()
+    ReplicaStore(port).start()
+    configs = {'durable_root': 's3://test-bucket/test-job', 'peers': f'localhost:{port}', 'peer_timeout': '0.5'}
+
+    with patch.multiple(S3CheckpointHelper, ping=MagicMock(return_value=True), list=MagicMock(return_value={}),
+                        load_index=MagicMock(return_value=None), save_index_entry=MagicMock(), open_writer=open_writer,
+                        open_reader=MagicMock(side_effect=KeyError())):
+        mgr = TieredCheckpointCollectionManager('tcm', tempfile.mkdtemp(), **configs)
+        for i in range(3):
+            mgr.save({'o1': PicklableDict(k1=i)})
+        mgr.wait()
+        mgr.release()
+
+        # Every collection is copied to the durable tier, and only the most recent one is kept in memory
+        assert len(objects) == 3
+        assert [[ckpt.copies[1] is not None for ckpt in ckpts.values()] for ckpts in mgr._ckpt_list] == \
+            [[False], [False], [True]]
+
+        # A process on a new node restores from the memory of its peers, instead of the durable tier
+        mgr = TieredCheckpointCollectionManager('tcm', tempfile.mkdtemp(), **configs)
+        assert mgr.load() == {'o1': PicklableDict(k1=2)}
+        S3CheckpointHelper.open_reader.assert_not_called()
+
+
+def test_tiered_ckpt_coll_mgr_w_remote_durable_tier():
+    port = _free_port()
+    ReplicaStore(port).start()
+    configs = {'durable_root': f'tcp://localhost:{port}/job'}
+
+    lessees: List[threading.Thread] = []
+    try_acquire_lease = RemoteCheckpointCollectionManager._try_acquire_lease
+
+    def record_lessee(self, ckpt_uid):
+        lessees.append(threading.current_thread())
+        return try_acquire_lease(self, ckpt_uid)
+
+    with patch.object(RemoteCheckpointCollectionManager, '_try_acquire_lease', record_lessee):
+        mgr = TieredCheckpointCollectionManager('tcm', tempfile.mkdtemp(), **configs)
+        mgr.acquire()
+
+        # The remote tier is not leased until the trickler copies a collection to it, which it does on its own thread
+        assert mgr.acquired and not lessees
+        mgr.save({'o1': PicklableDict(k1=1)})
+        mgr.wait()
+        assert lessees and threading.current_thread() not in lessees
+        mgr.release()
+
+    # Every tier is loaded from with its own configs
+    mgr = TieredCheckpointCollectionManager('tcm', tempfile.mkdtemp(), **configs)
+    with patch.object(RemoteCheckpointCollectionManager, '_configured', autospec=True,
+                      side_effect=lambda self: contextlib.nullcontext()) as configured:
+        assert mgr.load() == {'o1': PicklableDict(k1=1)}
+    configured.assert_called_once_with(mgr._tiers[-1])
@@ -1,9 +1,10 @@
 from lattice_addons.state import (
     State, PicklableDict,
     StateManager, StateCopyManager, StateRefManager, StateClosureManager, StateManagerGroup,
-    StateSymbolicManager,
+    StateSymbolicManager, LocalCheckpointCollectionManager,
     CHECKPOINT_TYPE, CHECKPOINT_CONFIG
 )
+from lattice_addons.state.state_manager import StateManagerGroupCheckpointUID
 
 import os
 import sys
@@ -415,3 +416,122 @@ def test_priodic_saving():
     p.join()
 
     fn2()
+
+
+def test_async_saving():
+    root = tempfile.mkdtemp()
+    os.environ[CHECKPOINT_TYPE] = 'local'
+    os.environ[CHECKPOINT_CONFIG] = (f'root={root},'
+                                     'atexit_saving=disabled,'
+                                     'max_inflight_saves=2')
+
+    def fn1():
+        mgr = StateManagerGroup()
+        mgr.register('state1', StateManager)
+        state = PicklableDict(k1=3)
+        mgr.update('state1', state)
+        mgr.async_save()
+
+        # The snapshot is not affected by later updates
+        state["k2"] = 4
+        mgr.async_save()
+        mgr.wait()
+
+        assert mgr._ckpt_mgr.len() == 2
+
+    def fn2():
+        mgr = StateManagerGroup()
+        mgr.register('state1', StateManager)
+
+        state = mgr.get('state1')
+        assert state["k1"] == 3
+        assert state["k2"] == 4
+
+    p = mp.Process(target=fn1)
+    p.start()
+    p.join()
+    assert p.exitcode == 0
+
+    p = mp.Process(target=fn2)
+    p.start()
+    p.join()
+    assert p.exitcode == 0
+
+
+def test_lazy_loading():
+    root = tempfile.mkdtemp()
+    os.environ[CHECKPOINT_TYPE] = 'local'
+    os.environ[CHECKPOINT_CONFIG] = f'root={root},atexit_saving=disabled'
+
+    def fn1():
+        mgr = StateManagerGroup()
+        for i in range(3):
+            mgr.register(f'state{i}')
+            mgr.update(f'state{i}', PicklableDict(k=i))
+        mgr.save()
+
+    def fn2():
+        mgr = StateManagerGroup()
+        assert sorted(mgr._ckpt_mgr.keys()) == ['state0', 'state1', 'state2']
+
+        loaded_keys = []
+        load_impl = mgr._ckpt_mgr._load_impl
+
+        def load(ckpts):
+            loaded_keys.append(list(ckpts))
+            return load_impl(ckpts)
+
+        mgr._ckpt_mgr._load_impl = load
+        for i in range(3):
+            mgr.register(f'state{i}')
+            assert mgr.get(f'state{i}') == PicklableDict(k=i)
+
+        # Every key is loaded alone
+        assert loaded_keys == [['state0'], ['state1'], ['state2']]
+
+    p = mp.Process(target=fn1)
+    p.start()
+    p.join()
+    assert p.exitcode == 0
+
+    p = mp.Process(target=fn2)
+    p.start()
+    p.join()
+    assert p.exitcode == 0
+
+
+def test_loading_from_one_collection():
+    root = tempfile.mkdtemp()
+    os.environ[CHECKPOINT_TYPE] = 'local'
+    os.environ[CHECKPOINT_CONFIG] = f'root={root},atexit_saving=disabled'
+
+    def fn1():
+        # The most recent collection misses one of the keys
+        mgr = LocalCheckpointCollectionManager(StateManagerGroupCheckpointUID, root, atexit_saving='disabled')
+        mgr.save({'state0': PicklableDict(k=0), 'state1': PicklableDict(k=0)})
+        mgr.save({'state0': PicklableDict(k=1)})
+
+    def fn2():
+        mgr = StateManagerGroup()
+        mgr.register('state0')
+        assert mgr.get('state0') == PicklableDict(k=1)
+
+        # Both states are loaded from the older collection, rather than each from the most recent one having it
+        mgr.register('state1')
+        assert mgr.get('state0') == PicklableDict(k=0)
+        assert mgr.get('state1') == PicklableDict(k=0)
+
+        # Keys saved in no collection do not drop the pinned one
+        mgr.register('state2')
+        assert mgr.get('state2') is None
+        assert mgr.get('state0') == PicklableDict(k=0)
+
+    p = mp.Process(target=fn1)
+    p.start()
+    p.join()
+    assert p.exitcode == 0
+
+    p = mp.Process(target=fn2)
+    p.start()
+    p.join()
+    assert p.exitcode == 0
@@ -12,38 +12,38 @@ import torch
 def test_patch_methods():
     mod = torch.nn.Module()
     with pytest.raises(Exception):
-        getattr(mod, 'patch')
+        getattr(mod, 'patched_methods')
 
     def wrapper(wrapped, instance, args, kwargs):
         retval = wrapped(*args, **kwargs)
-        setattr(instance, 'patch', 1)
+        setattr(instance, 'patched_methods', 1)
         return retval
 
     patch_methods('torch', 'nn.Module', {'__init__': wrapper})
 
     mod = torch.nn.Module()
-    assert getattr(mod, 'patch') == 1
+    assert getattr(mod, 'patched_methods') == 1
 
 
 def test_patch_methods_for_subclasses():
     mod = torch.nn.Conv2d(3, 64, kernel_size=11, stride=4, padding=2)
     with pytest.raises(Exception):
-        getattr(mod, 'patch')
+        getattr(mod, 'patched_subclasses')
 
     def wrapper(wrapped, instance, args, kwargs):
         retval = wrapped(*args, **kwargs)
 
         # NOTE: a chile class may use super(), which also gives a wrapped
         # function. So we need to keep these nested cases.
-        if not hasattr(instance, 'patch'):
-            setattr(instance, 'patch', 1)
+        if not hasattr(instance, 'patched_subclasses'):
+            setattr(instance, 'patched_subclasses', 1)
 
         return retval
 
     patch_methods_for_subclasses('torch', 'nn.Module', {'__init__': wrapper})
 
     mod = torch.nn.Conv2d(3, 64, kernel_size=11, stride=4, padding=2)
-    assert getattr(mod, 'patch') == 1
+    assert getattr(mod, 'patched_subclasses') == 1
 
 
 def test_patch_methods_for_new_subclasses():
@@ -57,12 +57,12 @@ def test_patch_methods_for_new_subclasses():
 
     mod = MyModule1()
     with pytest.raises(Exception):
-        getattr(mod, 'patch')
+        getattr(mod, 'patched_new_subclasses')
 
     def wrapper(wrapped, instance, args, kwargs):
         retval = wrapped(*args, **kwargs)
-        if not hasattr(instance, 'patch'):
-            setattr(instance, 'patch', 1)
+        if not hasattr(instance, 'patched_new_subclasses'):
+            setattr(instance, 'patched_new_subclasses', 1)
         return retval
 
     patch_methods_for_new_subclasses('torch', 'nn.Module', {'__init__': wrapper})
@@ -76,14 +76,14 @@ def test_patch_methods_for_new_subclasses():
             return self.conv1(x)
 
     mod = MyModule2()
-    assert getattr(mod, 'patch') == 1
+    assert getattr(mod, 'patched_new_subclasses') == 1
 
 
 def test_patch_methods_for_all():
     def wrapper(wrapped, instance, args, kwargs):
         retval = wrapped(*args, **kwargs)
-        if not hasattr(instance, 'patch'):
-            setattr(instance, 'patch', 1)
+        if not hasattr(instance, 'patched_all'):
+            setattr(instance, 'patched_all', 1)
         return retval
 
     patch_methods('torch', 'nn.Module', {'__init__': wrapper})
@@ -91,10 +91,10 @@ def test_patch_methods_for_all():
     patch_methods_for_new_subclasses('torch', 'nn.Module', {'__init__': wrapper})
 
     mod = torch.nn.Module()
-    assert getattr(mod, 'patch') == 1
+    assert getattr(mod, 'patched_all') == 1
 
     mod = torch.nn.Conv2d(3, 64, kernel_size=11, stride=4, padding=2)
-    assert getattr(mod, 'patch') == 1
+    assert getattr(mod, 'patched_all') == 1
 
     class MyModule(torch.nn.Module):
         def __init__(self) -> None:
@@ -105,4 +105,4 @@ def test_patch_methods_for_all():
             return self.conv1(x)
 
     mod = MyModule()
-    assert getattr(mod, 'patch') == 1
+    assert getattr(mod, 'patched_all') == 1
@@ -8,8 +8,9 @@ import pytest
 import atexit
 import multiprocessing as mp
 from dataclasses import dataclass
+from pathlib import Path
 
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, List
 
 import numpy as np
 import torch
@@ -557,3 +558,70 @@ def test_added_param_group_optimizer():
 
     # The patched version should be closer to the golden
     assert abs(patched - golden) < abs(baseline - golden)
+
+
+def test_incremental_tsd_checkpoint():
+    from lattice_addons.state import LocalCheckpointCollectionManager
+    from lattice_autopatch_torch import TorchStateDict
+
+    root = tempfile.mkdtemp()
+
+    def blobs(counter: int) -> Dict[str, int]:
+        paths = Path(root).glob(f'LocalCheckpointCollectionManager:lccm_{counter:06}/mod.TorchStateDict/*.pt')
+        return {p.name: p.stat().st_ino for p in paths if p.name != 'index.pt'}
+
+    mod = torch.nn.Sequential(torch.nn.Linear(4, 4), torch.nn.Linear(4, 2))
+    mgr = LocalCheckpointCollectionManager('lccm', root, incremental='enabled', keep_last='1')
+    mgr.save({'mod': TorchStateDict(mod.state_dict())})
+    first = blobs(0)
+    assert len(first) == 4
+
+    with torch.no_grad():
+        mod[1].weight.add_(1.0)
+    mgr.save({'mod': TorchStateDict(mod.state_dict())})
+    mgr.wait()
+
+    # Unchanged tensors are hard linked rather than written again, and outlive the deleted checkpoint
+    second = blobs(1)
+    assert not blobs(0)
+    assert len(second) == 4
+    assert {name: ino for name, ino in second.items() if name in first} == \
+        {name: ino for name, ino in first.items() if name in second}
+    assert len(first.keys() & second.keys()) == 3
+
+    state = mgr.load()['mod']
+    assert list(state.keys()) == list(mod.state_dict().keys())
+    for k, v in mod.state_dict().items():
+        assert torch.equal(state[k], v)
+
+
+def test_mmap_tsd_checkpoint():
+    from lattice_addons.state import LocalCheckpointCollectionManager
+    from lattice_autopatch_torch import TorchStateDict
+
+    root = tempfile.mkdtemp()
+    sd = TorchStateDict(
+        weight=torch.randn(4, 4), half=torch.randn(3).to(torch.bfloat16), step=torch.tensor(3),
+        strided=torch.arange(8)[::2], value=5
+    )
+    mgr = LocalCheckpointCollectionManager('lccm', root, mmap='enabled')
+    mgr.save({'sd': sd})
+
+    state = mgr.load()['sd']
+    assert list(state.keys()) == list(sd.keys())
+    for k, v in sd.items():
+        if isinstance(v, torch.Tensor):
+            assert state[k].dtype == v.dtype
+            assert torch.equal(state[k], v)
+        else:
+            assert state[k] == v
+
+    # Loaded tensors are copy-on-write views, so updating them does not change the checkpoint
+    state['weight'].add_(1.0)
+    assert torch.equal(mgr.load()['sd']['weight'], sd['weight'])
+
+    # Managers without mmap enabled keep writing single files
+    plain_root = tempfile.mkdtemp()
+    LocalCheckpointCollectionManager('lccm', plain_root).save({'sd': sd})
+    files = sorted(p.name for p in Path(plain_root).glob('*/*') if p.is_file())
+    assert files == ['manifest.json', 'sd.TorchStateDict']
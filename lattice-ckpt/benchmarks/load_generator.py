@@ -0,0 +1,370 @@
+r""" Drive the checkpoint service with concurrent simulated clients, and report throughput, latency and memory.
+
+Every client saves a state dict of ``--keys`` checkpoints adding up to ``--size`` bytes as a new generation, loads it
+back and deletes it, ``--iterations`` times, over the protocol of the service. A service is started for every value of
+``--num-threads`` unless ``--endpoint`` is given, and the results are printed and written as JSON to ``--output``, e.g.
+
+    python benchmarks/load_generator.py --clients 8 --size 1048576,67108864 --num-threads 1,2,4,8 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zmq
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SRC_DIR = Path(__file__).resolve().parent.parent / 'src'
+sys.path.append(str(SRC_DIR))
+
+from utils.utils import (  # noqa: E402
+    RequestType,
+    CheckpointMessage,
+    CheckpointResponse,
+)
+
+
+parser = argparse.ArgumentParser(description='Benchmark the checkpoint service with concurrent clients')
+parser.add_argument('--clients', type=int, default=8, help="Number of concurrent clients")
+parser.add_argument('--size', type=str, default='1048576',
+                    help="Bytes of the state dict of every client, or several separated by commas")
+parser.add_argument('--keys', type=int, default=8, help="Number of checkpoints a state dict is split into")
+parser.add_argument('--iterations', type=int, default=10, help="Generations every client saves and loads")
+parser.add_argument('--warmup', type=int, default=1, help="Generations every client saves and loads before measuring")
+parser.add_argument('--chunk-size', type=int, default=4 * 1024 * 1024,
+                    help="Bytes of the chunks larger checkpoints are streamed in")
+parser.add_argument('--credit', type=int, default=4, help="Chunks a client keeps in flight")
+parser.add_argument('--batched', action='store_true',
+                    help="Save and load the checkpoints not larger than a chunk with SAVE_MANY and LOAD_MANY")
+parser.add_argument('--num-threads', type=str, default='4',
+                    help="Worker threads of the service, or several separated by commas to compare them")
+parser.add_argument('--endpoint', type=str, default=None,
+                    help="Endpoint of a running service, e.g. localhost:5555, instead of starting one")
+parser.add_argument('--output', type=str, default=None, help="Path of the JSON file the results are written to")
+
+
+class RequestFailed(Exception):
+    pass
+
+
+def _check(response: CheckpointResponse) -> CheckpointResponse:
+    if response.req_type == RequestType.ERROR:
+        raise RequestFailed(bytes(response.body).decode(errors='replace'))
+    return response
+
+
+class SimulatedClient:
+    r""" A client saving, loading and deleting generations of a state dict, which records the latency of each.
+
+    Requests are sent over a DEALER socket, so that up to ``credit`` chunks of a checkpoint are in flight at once.
+    """
+
+    def __init__(self, context: zmq.Context, endpoint: str, client_id: int, ckpts: Dict[str, bytes], chunk_size: int,
+                 credit: int, batched: bool):
+        self.socket = context.socket(zmq.DEALER)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(f'tcp://{endpoint}')
+        self.job_id = f'benchmark-{os.getpid()}'
+        self.client_id = client_id
+        self.ckpts = ckpts
+        self.chunk_size = chunk_size
+        self.credit = credit
+        self.batched = batched
+        self.latencies: Dict[str, List[float]] = {'save': [], 'load': []}
+
+    def _request(self, msg: CheckpointMessage) -> CheckpointResponse:
+        msg.send(self.socket)
+        return _check(CheckpointMessage.recv(self.socket))
+
+    def _small(self) -> List[str]:
+        return [name for name, data in self.ckpts.items() if self.batched and len(data) <= self.chunk_size]
+
+    def _save_streamed(self, uid: str, name: str, data: bytes) -> None:
+        view = memoryview(data)
+        chunks = [view[offset:offset + self.chunk_size] for offset in range(0, len(data), self.chunk_size)] or [view]
+        outstanding = 0
+        for seq, chunk in enumerate(chunks):
+            if outstanding >= self.credit:
+                _check(CheckpointMessage.recv(self.socket))
+                outstanding -= 1
+            CheckpointMessage(RequestType.SAVE_CHUNK, self.job_id, uid, name, chunk, seq=seq).send(self.socket)
+            outstanding += 1
+        for _ in range(outstanding):
+            _check(CheckpointMessage.recv(self.socket))
+        self._request(CheckpointMessage(RequestType.SAVE, self.job_id, uid, name, {'chunks': len(chunks)}))
+
+    def _load_streamed(self, uid: str, name: str) -> int:
+        # Chunks are requested ahead, and may be answered out of order
+        body = {'chunk_size': self.chunk_size}
+        received: Dict[int, memoryview] = {}
+        next_seq, outstanding = 0, 0
+        last: Optional[int] = None
+        while last is None or any(seq not in received for seq in range(last + 1)):
+            while last is None and outstanding < self.credit:
+                CheckpointMessage(RequestType.LOAD_CHUNK, self.job_id, uid, name, body, seq=next_seq).send(self.socket)
+                next_seq += 1
+                outstanding += 1
+            response = _check(CheckpointMessage.recv(self.socket))
+            outstanding -= 1
+            received[response.seq] = response.body
+            if len(response.body) < self.chunk_size:
+                last = response.seq if last is None else min(last, response.seq)
+        for _ in range(outstanding):
+            CheckpointMessage.recv(self.socket)
+        return sum(len(received[seq]) for seq in range(last + 1))
+
+    def save(self, uid: str) -> None:
+        small = self._small()
+        if small:
+            self._request(CheckpointMessage(RequestType.SAVE_MANY, self.job_id, uid, '', {'names': small},
+                                            attachments=[self.ckpts[name] for name in small]))
+        for name, data in self.ckpts.items():
+            if name in small:
+                continue
+            if len(data) <= self.chunk_size:
+                self._request(CheckpointMessage(RequestType.SAVE, self.job_id, uid, name, data))
+            else:
+                self._save_streamed(uid, name, data)
+
+    def load(self, uid: str) -> int:
+        nbytes = 0
+        small = self._small()
+        if small:
+            body = {'names': small, 'chunk_size': self.chunk_size, 'max_bytes': self.chunk_size * self.credit}
+            response = self._request(CheckpointMessage(RequestType.LOAD_MANY, self.job_id, uid, '', body))
+            nbytes += sum(len(attachment) for attachment in response.attachments)
+            small = response.body['names']
+        for name in self.ckpts:
+            if name not in small:
+                nbytes += self._load_streamed(uid, name)
+        return nbytes
+
+    def delete(self, uid: str) -> None:
+        for name in self.ckpts:
+            self._request(CheckpointMessage(RequestType.DEL, self.job_id, uid, name, b''))
+
+    def run(self, warmup: int, iterations: int, start: threading.Barrier, measure: threading.Barrier) -> None:
+        start.wait()
+        for i in range(warmup + iterations):
+            if i == warmup:
+                measure.wait()
+            uid = f'LoadGenerator:client{self.client_id}_{i:06}'
+            begin = time.perf_counter()
+            self.save(uid)
+            saved = time.perf_counter()
+            nbytes = self.load(uid)
+            loaded = time.perf_counter()
+            if nbytes != sum(len(data) for data in self.ckpts.values()):
+                raise RequestFailed(f'Loaded {nbytes} bytes of {uid}')
+            self.delete(uid)
+
+            if i >= warmup:
+                self.latencies['save'].append(saved - begin)
+                self.latencies['load'].append(loaded - saved)
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class RssSampler:
+    r""" Sample the resident set size of a process, which is read from procfs, so it is only available on Linux. """
+
+    def __init__(self, pid: Optional[int], interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[int] = None
+        self.last: Optional[int] = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample)
+        self._thread.daemon = True
+
+    def rss(self) -> Optional[int]:
+        if self.pid is None:
+            return None
+        try:
+            with open(f'/proc/{self.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    def _sample(self) -> None:
+        while not self._stopped.is_set():
+            self.last = self.rss()
+            if self.last is not None:
+                self.peak = max(self.peak or 0, self.last)
+            self._stopped.wait(self.interval)
+
+    def __enter__(self) -> 'RssSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    # Nearest rank, so that the percentile is a measured latency
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def _summarize(latencies: List[float], elapsed: float, nbytes: int) -> Dict[str, float]:
+    return {
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / elapsed,
+        'mib_per_sec': len(latencies) * nbytes / elapsed / 1024 ** 2,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def start_service(num_threads: int, root_dir: str) -> subprocess.Popen:
+    r""" Start the service in a process of its own, so that its memory is measured apart from the clients. """
+
+    port = _free_port()
+    args = [sys.executable, 'ckpt_server/main.py', '--root-dir', root_dir, '--port', str(port),
+            '--num-threads', str(num_threads), '--max-total-bytes', str(1024 ** 4),
+            '--max-checkpoint-bytes', str(1024 ** 4), '--metrics-port', '0']
+    service = subprocess.Popen(args, cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    service.endpoint = f'localhost:{port}'  # type: ignore[attr-defined]
+    return service
+
+
+def wait_for_service(context: zmq.Context, endpoint: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        with context.socket(zmq.REQ) as s:
+            s.setsockopt(zmq.LINGER, 0)
+            s.setsockopt(zmq.RCVTIMEO, 500)
+            s.connect(f'tcp://{endpoint}')
+            try:
+                CheckpointMessage(RequestType.PING, '', '', '', b'').send(s)
+                CheckpointMessage.recv(s)
+                return
+            except zmq.error.Again:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'The service at {endpoint} did not respond within {timeout} seconds')
+
+
+def run_benchmark(context: zmq.Context, endpoint: str, pid: Optional[int], size: int, args: Any) -> Dict[str, Any]:
+    keys = max(1, args.keys)
+    payload = os.urandom(size)
+    ckpts = {f'key{i}.pt': payload[i * size // keys:(i + 1) * size // keys] for i in range(keys)}
+    clients = [SimulatedClient(context, endpoint, i, ckpts, args.chunk_size, args.credit, args.batched)
+               for i in range(args.clients)]
+
+    errors: List[Exception] = []
+    # Clients start at once, and are measured from when all of them finished warming up
+    start = threading.Barrier(len(clients) + 1)
+    measure = threading.Barrier(len(clients) + 1)
+
+    def run(client: SimulatedClient) -> None:
+        try:
+            client.run(args.warmup, args.iterations, start, measure)
+        except Exception as e:
+            errors.append(e)
+            start.abort()
+            measure.abort()
+
+    threads = [threading.Thread(target=run, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+
+    with RssSampler(pid) as sampler:
+        try:
+            start.wait()
+            measure.wait()
+        except threading.BrokenBarrierError:
+            pass
+        begin = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - begin
+    for client in clients:
+        client.close()
+    if errors:
+        raise errors[0]
+
+    # Throughput is over the measured run, in which the clients save, load and delete generations alike
+    return {
+        'size': size,
+        'save': _summarize([t for client in clients for t in client.latencies['save']], elapsed, size),
+        'load': _summarize([t for client in clients for t in client.latencies['load']], elapsed, size),
+        'server_rss_peak_bytes': sampler.peak,
+        'server_rss_bytes': sampler.last,
+    }
+
+
+def _print_result(result: Dict[str, Any]) -> None:
+    rss = result['server_rss_peak_bytes']
+    rss_mib = 'n/a' if rss is None else f'{rss / 1024 ** 2:.1f}'
+    for op in ('save', 'load'):
+        stats = result[op]
+        print(f'{str(result["num_threads"]):>8} {result["size"]:>12} {op:>5} {stats["ops_per_sec"]:>10.1f} '
+              f'{stats["mib_per_sec"]:>10.1f} {stats["p50_ms"]:>9.2f} {stats["p99_ms"]:>9.2f} {rss_mib:>9}')
+
+
+def main():
+    args = parser.parse_args()
+    if args.clients < 1 or args.iterations < 1:
+        parser.error('--clients and --iterations must be positive')
+    sizes = [int(size) for size in args.size.split(',')]
+    thread_counts: List[Optional[int]] = [None] if args.endpoint else [int(n) for n in args.num_threads.split(',')]
+
+    context = zmq.Context()
+    results = []
+    print(f'{"threads":>8} {"size":>12} {"op":>5} {"ops/s":>10} {"MiB/s":>10} {"p50 ms":>9} {"p99 ms":>9} '
+          f'{"RSS MiB":>9}')
+    for num_threads in thread_counts:
+        with tempfile.TemporaryDirectory() as root_dir:
+            service = None if num_threads is None else start_service(num_threads, root_dir)
+            endpoint = args.endpoint or service.endpoint  # type: ignore[union-attr]
+            try:
+                wait_for_service(context, endpoint)
+                for size in sizes:
+                    result = {'num_threads': num_threads,
+                              **run_benchmark(context, endpoint, service and service.pid, size, args)}
+                    _print_result(result)
+                    results.append(result)
+            finally:
+                if service is not None:
+                    # The service spills the checkpoints held in memory when it is stopped
+                    service.terminate()
+                    try:
+                        service.wait(timeout=60)
+                    except subprocess.TimeoutExpired:
+                        service.kill()
+                        service.wait()
+
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+    context.term()
+
+
+if __name__ == '__main__':
+    main()
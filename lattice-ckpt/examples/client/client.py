@@ -1,13 +1,14 @@
 import argparse
 import random
-import dill
 import io
+import json
+import struct
 import zmq
 import torch
 import time
 from enum import Enum
-from dataclasses import dataclass
-from typing import Any
+from dataclasses import dataclass, field
+from typing import Any, List, Sequence, Union
 
 
 
@@ -19,6 +20,11 @@ class RequestType(Enum):
     DEL = 4
     ACQUIRE = 5
     RELEASE = 6
+    SAVE_CHUNK = 7
+    LOAD_CHUNK = 8
+    SAVE_MANY = 9
+    LOAD_MANY = 10
+    EXISTS = 11
     ERROR = 101
 
 
@@ -34,35 +40,148 @@ class CheckpointResponse:
     uid: str
     ckpt_name: str
     body: Any
+    seq: int = 0
+    attachments: List[memoryview] = field(default_factory=list)
+
+
+# Wire format
+# -----------
+#
+# A message is sent as two ZMQ frames, a header frame and a body frame, which may be followed by attachment frames
+# carrying the checkpoints of batched requests. The header starts with a fixed part:
+#
+#   magic (2 bytes) | version (1 byte) | request type (1 byte) | body encoding (1 byte) | sequence number (4 bytes) |
+#   job ID length (2 bytes) | UID length (2 bytes) | checkpoint name length (2 bytes)
+#
+# in network byte order, followed by the UTF-8 encoded job ID, UID and checkpoint name. Binary bodies, e.g.
+# checkpoints, are sent as they are without being copied, and other bodies, e.g. listings, are encoded as JSON.
+# Messages sent over DEALER sockets are preceded by an empty delimiter frame, as REQ sockets do. Frames before the
+# delimiter, e.g. the correlation IDs of pipelined clients, are echoed in the responses.
+#
+# Large checkpoints are streamed in chunks numbered by the sequence number:
+#
+# - Saving: SAVE_CHUNK requests carry the chunks, and each is acknowledged with the number of chunks, i.e. credits,
+#   the sender may have unacknowledged. A SAVE request with a JSON body ``{"chunks": <count>}`` commits the checkpoint,
+#   and ``{"abort": true}`` discards the chunks. A SAVE request with a binary body saves a checkpoint at once.
+# - Loading: LOAD_CHUNK requests with a JSON body ``{"chunk_size": <bytes>}`` are answered with the chunk at the
+#   offset of the sequence number times the chunk size. The last chunk is shorter than the chunk size, possibly
+#   empty, and the receiver requests at most as many chunks ahead as it grants itself credits.
+#
+# Writers coordinate through leases on names within the checkpoints of a UID:
+#
+# - ACQUIRE requests with a JSON body identifying the holder, e.g. ``{"holder": <ID>, "ttl": <seconds>}``, are answered
+#   with the holder of the lease, along with its fencing token, whether it is committed and the seconds left. A lease
+#   is granted if it is free or expired, and renewed if the requester already holds it.
+# - RELEASE requests with a JSON body ``{"token": <token>, "committed": <bool>}`` release a lease. A committed lease is
+#   kept until the checkpoints of the UID are deleted, so that the writers waiting for it skip their writes.
+# - Commits with a JSON body including ``"token"`` are rejected if a larger token was committed with for the UID.
+#
+# Checkpoints of a UID are batched to save round trips:
+#
+# - SAVE_MANY requests with a JSON body ``{"names": [<name>, ...]}``, optionally including ``"token"``, carry the
+#   checkpoints as attachments in the order of their names, and save them at once.
+# - LOAD_MANY requests with a JSON body ``{"names": [<name>, ...], "chunk_size": <bytes>, "max_bytes": <bytes>}`` are
+#   answered with ``{"names": [<name>, ...], "missing": [<name>, ...]}`` and the first chunks of the checkpoints in
+#   ``"names"`` as attachments. Checkpoints which are neither answered nor missing did not fit in ``"max_bytes"``, and
+#   are loaded with LOAD_CHUNK requests, as are the following chunks of the answered ones.
+# - LIST requests with a UID only list the checkpoints of that UID, and EXISTS requests are answered with whether a
+#   checkpoint exists.
+
+PROTOCOL_MAGIC = b'LC'
+PROTOCOL_VERSION = 2
+
+_HEADER = struct.Struct('!2sBBBIHHH')
+_BODY_RAW = 0
+_BODY_JSON = 1
+
+Frame = Union[bytes, memoryview, zmq.Frame]
+
+
+def _buffer(frame: Frame) -> memoryview:
+    return frame.buffer if isinstance(frame, zmq.Frame) else memoryview(frame)
 
 
 class CheckpointMessage():
-    def __init__(self, req_type: RequestType, job_id: str, uid: str, ckpt_name: str, body: bytes):
+    def __init__(self, req_type: RequestType, job_id: str, uid: str, ckpt_name: str, body: Any, seq: int = 0,
+                 attachments: Sequence[Any] = ()):
         self._req_type = req_type
         self._job_id = job_id
         self._uid = uid
         self._ckpt_name = ckpt_name
         self._body = body
+        self._seq = seq
+        self._attachments = list(attachments)
 
+    def encode_message(self) -> List[Frame]:
+        r""" Encode the message into a header frame, a body frame and the attachment frames. """
 
-    def encode_message(self):
-        bytes_to_send = {
-            'type': self._req_type.value,
-            'job_id': self._job_id,
-            'uid': self._uid,
-            'ckpt_name': self._ckpt_name,
-            'body': self._body
-        }
+        job_id, uid, ckpt_name = (s.encode() for s in (self._job_id, self._uid, self._ckpt_name))
 
-        return dill.dumps(bytes_to_send)
+        if isinstance(self._body, (bytes, bytearray, memoryview)):
+            encoding, body = _BODY_RAW, self._body
+        else:
+            encoding, body = _BODY_JSON, json.dumps(self._body).encode()
 
+        header = _HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, self._req_type.value, encoding, self._seq,
+                              len(job_id), len(uid), len(ckpt_name)) + job_id + uid + ckpt_name
+        return [header, body, *self._attachments]
 
     @staticmethod
-    def parse_message(message):
-        decoded_message = dill.loads(message)
+    def parse_message(frames: Sequence[Frame]) -> CheckpointResponse:
+        r""" Parse a message from its header frame, body frame and attachment frames.
+
+        The body of a binary message and the attachments are views of the frames, so they are not copied.
+
+        :raises ValueError: The message is malformed or uses another version of the protocol
+        """
+
+        if len(frames) < 2:
+            raise ValueError(f'Expected at least 2 frames, but got {len(frames)}')
+
+        header = _buffer(frames[0])
+        if len(header) < _HEADER.size:
+            raise ValueError('Truncated message header')
+        magic, version, req_type, encoding, seq, *lengths = _HEADER.unpack_from(header)
+        if magic != PROTOCOL_MAGIC:
+            raise ValueError('Invalid message header')
+        if version != PROTOCOL_VERSION:
+            raise ValueError(f'Unsupported protocol version {version}')
+        if _HEADER.size + sum(lengths) != len(header):
+            raise ValueError('Invalid message header length')
+
+        fields = []
+        offset = _HEADER.size
+        for length in lengths:
+            fields.append(bytes(header[offset:offset + length]).decode())
+            offset += length
+
+        body: Any = _buffer(frames[1])
+        if encoding == _BODY_JSON:
+            body = json.loads(bytes(body))
+        elif encoding != _BODY_RAW:
+            raise ValueError(f'Invalid body encoding {encoding}')
+
+        return CheckpointResponse(RequestType(req_type), *fields, body, seq,
+                                  [_buffer(frame) for frame in frames[2:]])
+
+    def send(self, socket: zmq.Socket) -> None:
+        r""" Send the message without copying its body. """
+
+        frames = self.encode_message()
+        if socket.socket_type == zmq.DEALER:
+            frames.insert(0, b'')
+        socket.send_multipart(frames, copy=False)
+
+    @staticmethod
+    def recv(socket: zmq.Socket) -> CheckpointResponse:
+        r""" Receive a message without copying its body. """
+
+        frames = socket.recv_multipart(copy=False)
+        # Header frames are never empty
+        if len(frames) > 2 and len(frames[0]) == 0:
+            frames = frames[1:]
+        return CheckpointMessage.parse_message(frames)
 
-        return CheckpointResponse(RequestType(decoded_message['type']), decoded_message['job_id'],
-                                  decoded_message['uid'], decoded_message['ckpt_name'], decoded_message['body'])
 
 
 JOB_ID = 'test-job'
@@ -91,21 +210,19 @@ start_time = time.time()
 socket.connect(f'tcp://{args.endpoint}:5555')
 
 ping_msg = CheckpointMessage(RequestType.PING, JOB_ID, U_ID, '', b'')
-socket.send(ping_msg.encode_message())
-response = socket.recv()
-response = CheckpointMessage.parse_message(response)
+ping_msg.send(socket)
+response = CheckpointMessage.recv(socket)
 print(response)
 
 # lock the checkpoint
 lock_name = 'lock.model.pt'
-node_info = {'node_id': NODE_ID}
+node_info = {'node_id': NODE_ID, 'ttl': 60}
 print(f'Acquiring lock: {lock_name} for node: {node_info}')
-lock_msg = CheckpointMessage(RequestType.ACQUIRE, JOB_ID, U_ID, lock_name, dill.dumps(node_info))
-socket.send(lock_msg.encode_message())
+lock_msg = CheckpointMessage(RequestType.ACQUIRE, JOB_ID, U_ID, lock_name, node_info)
+lock_msg.send(socket)
 
-response = socket.recv()
-response = CheckpointMessage.parse_message(response)
-response_node_info = dill.loads(response.body)
+response = CheckpointMessage.recv(socket)
+response_node_info = response.body
 print("Lock response: ", response_node_info)
 
 if (response_node_info['node_id'] == NODE_ID):
@@ -115,30 +232,28 @@ if (response_node_info['node_id'] == NODE_ID):
         print('Creating model checkpoint message')
         save_msg1 = CheckpointMessage(RequestType.SAVE, JOB_ID, U_ID, 'model.pt', cp_file.getvalue())
         print('Sending model checkpoint message')
-        socket.send(save_msg1.encode_message())
-        response = socket.recv()
-        response = CheckpointMessage.parse_message(response)
-        print(response.body)
+        save_msg1.send(socket)
+        response = CheckpointMessage.recv(socket)
+        print(bytes(response.body))
 
     # release the lock
     print(f'Releasing lock: {lock_name} for node: {node_info}')
-    release_msg = CheckpointMessage(RequestType.RELEASE, JOB_ID, U_ID, lock_name, b'')
-    socket.send(release_msg.encode_message())
+    release_msg = CheckpointMessage(RequestType.RELEASE, JOB_ID, U_ID, lock_name,
+                                    {'token': response_node_info['token'], 'committed': True})
+    release_msg.send(socket)
 
-    response = socket.recv()
-    response = CheckpointMessage.parse_message(response)
-    print(response.body)
+    response = CheckpointMessage.recv(socket)
+    print(bytes(response.body))
 
 # lock the checkpoint
 lock_name = 'lock.opt.pt'
-node_info = {'node_id': NODE_ID}
+node_info = {'node_id': NODE_ID, 'ttl': 60}
 print(f'Acquiring lock: {lock_name} for node: {node_info}')
-lock_msg = CheckpointMessage(RequestType.ACQUIRE, JOB_ID, U_ID, lock_name, dill.dumps(node_info))
-socket.send(lock_msg.encode_message())
+lock_msg = CheckpointMessage(RequestType.ACQUIRE, JOB_ID, U_ID, lock_name, node_info)
+lock_msg.send(socket)
 
-response = socket.recv()
-response = CheckpointMessage.parse_message(response)
-response_node_info = dill.loads(response.body)
+response = CheckpointMessage.recv(socket)
+response_node_info = response.body
 print("Lock response: ", response_node_info)
 
 if (response_node_info['node_id'] == NODE_ID):
@@ -148,56 +263,65 @@ if (response_node_info['node_id'] == NODE_ID):
         print('Creating optimizer checkpoint message')
         save_msg2 = CheckpointMessage(RequestType.SAVE, JOB_ID, U_ID, 'opt.pt', cp_file.getvalue())
         print('Sending optimizer checkpoint message')
-        socket.send(save_msg2.encode_message())
-        response = socket.recv()
-        response = CheckpointMessage.parse_message(response)
-        print(response.body)
+        save_msg2.send(socket)
+        response = CheckpointMessage.recv(socket)
+        print(bytes(response.body))
 
     # release the lock
     print(f'Releasing lock: {lock_name} for node: {node_info}')
-    release_msg = CheckpointMessage(RequestType.RELEASE, JOB_ID, U_ID, lock_name, b'')
-    socket.send(release_msg.encode_message())
+    release_msg = CheckpointMessage(RequestType.RELEASE, JOB_ID, U_ID, lock_name,
+                                    {'token': response_node_info['token'], 'committed': True})
+    release_msg.send(socket)
 
-    response = socket.recv()
-    response = CheckpointMessage.parse_message(response)
-    print(response.body)
+    response = CheckpointMessage.recv(socket)
+    print(bytes(response.body))
 
 print('Getting list of all checkpoints')
 list_msg = CheckpointMessage(RequestType.LIST, JOB_ID, U_ID, '', b'')
-socket.send(list_msg.encode_message())
+list_msg.send(socket)
 
-list_response = socket.recv()
-ckpt_response = CheckpointMessage.parse_message(list_response)
+ckpt_response = CheckpointMessage.recv(socket)
 print('LIST', ckpt_response.body)
 
+print('Retrieving all checkpoints at once')
+load_msg = CheckpointMessage(RequestType.LOAD_MANY, JOB_ID, U_ID, '',
+                             {'names': ['model.pt', 'opt.pt'], 'chunk_size': 1024 ** 3, 'max_bytes': 1024 ** 3})
+load_msg.send(socket)
+
+ckpt_response = CheckpointMessage.recv(socket)
+print('LOAD_MANY', ckpt_response.body, [len(attachment) for attachment in ckpt_response.attachments])
+
 ckpt_name = 'model.pt'
 
 print('Retrievining a checkpoint')
 load_msg = CheckpointMessage(RequestType.LOAD, JOB_ID, U_ID, ckpt_name, b'')
-socket.send(load_msg.encode_message())
+load_msg.send(socket)
 
-load_response = socket.recv()
-ckpt_response = CheckpointMessage.parse_message(load_response)
+ckpt_response = CheckpointMessage.recv(socket)
 if(ckpt_response.req_type == RequestType.LOAD):
     model.load_state_dict(torch.load(io.BytesIO(ckpt_response.body)))
     print('Loaded model: ', model)
 else:
-    print('Error loading model: ', ckpt_response.body)
+    print('Error loading model: ', bytes(ckpt_response.body))
 
 print(f'Deleting checkpoint "{ckpt_name}"')
 del_msg = CheckpointMessage(RequestType.DEL, JOB_ID, U_ID, ckpt_name, b'')
-socket.send(del_msg.encode_message())
+del_msg.send(socket)
+
+ckpt_response = CheckpointMessage.recv(socket)
+print('DEL', bytes(ckpt_response.body))
+
+exists_msg = CheckpointMessage(RequestType.EXISTS, JOB_ID, U_ID, ckpt_name, b'')
+exists_msg.send(socket)
 
-del_response = socket.recv()
-ckpt_response = CheckpointMessage.parse_message(del_response)
-print('DEL', ckpt_response.body)
+ckpt_response = CheckpointMessage.recv(socket)
+print('EXISTS', ckpt_response.body)
 
 print('Getting list of all checkpoints')
 list_msg = CheckpointMessage(RequestType.LIST, JOB_ID, U_ID, '', b'')
-socket.send(list_msg.encode_message())
+list_msg.send(socket)
 
-list_response = socket.recv()
-ckpt_response = CheckpointMessage.parse_message(list_response)
+ckpt_response = CheckpointMessage.recv(socket)
 print('LIST', ckpt_response.body)
 
 print("Client run completed successfully.\n")
@@ -0,0 +1,134 @@
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class _Lease:
+    def __init__(self, holder: Dict[str, Any], token: int) -> None:
+        self.holder = holder
+        self.token = token
+        self.expires: Optional[float] = None
+        self.committed = False
+
+    def expired(self, now: float) -> bool:
+        return self.expires is not None and self.expires <= now
+
+    def describe(self, now: float) -> Dict[str, Any]:
+        ttl = None if self.expires is None else max(0.0, self.expires - now)
+        return {**self.holder, 'token': self.token, 'committed': self.committed, 'ttl': ttl}
+
+
+class LeaseTable:
+    r""" Leases on names within the checkpoints of a UID, which expire unless they are renewed.
+
+    Every granted lease comes with a fencing token, which is larger than the tokens of the leases granted before it.
+    Writers commit checkpoints with the tokens of their leases, and commits with tokens smaller than the largest one
+    committed with are rejected, so a writer whose lease expired meanwhile does not overwrite the checkpoints of the
+    writer which took over. A lease released as committed is kept, so that the writers waiting for it skip their
+    writes, until the checkpoints of the UID are deleted.
+
+    The replica store of lattice-addons serves the same requests, and links to this module instead of copying it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (job ID, UID, lease name) -> lease
+        self._leases: Dict[Tuple[str, str, str], _Lease] = {}
+        # (job ID, UID) -> the largest fencing token committed with
+        self._fences: Dict[Tuple[str, str], int] = {}
+        # (job ID, UID) -> the lock serializing the commits, and the number of commits holding or waiting for it
+        self._commit_locks: Dict[Tuple[str, str], Tuple[threading.Lock, int]] = {}
+        # Tokens start from the clock, so that they keep increasing across restarts
+        self._next_token = time.time_ns()
+
+    def acquire(self, job_id: str, uid: str, name: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        r""" Acquire or renew a lease.
+
+        :param request: The holder, e.g. ``{"holder": <ID>}``, and optionally ``"ttl"``, the seconds the lease lasts
+            for without being renewed. Leases without TTLs never expire.
+        :return: The holder of the lease, which is the requester if the lease was free, expired or already held by
+            it, along with ``"token"``, ``"committed"`` and ``"ttl"``, the seconds left
+        """
+
+        ttl = request.get('ttl')
+        holder = {k: v for k, v in request.items() if k != 'ttl'}
+        key = (job_id, uid, name)
+        now = time.monotonic()
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or (not lease.committed and lease.expired(now)):
+                self._next_token += 1
+                lease = self._leases[key] = _Lease(holder, self._next_token)
+            if lease.holder == holder and not lease.committed:
+                lease.expires = None if ttl is None else now + ttl
+            return lease.describe(time.monotonic())
+
+    def release(self, job_id: str, uid: str, name: str, token: Optional[int] = None, committed: bool = False) -> None:
+        r""" Release a lease, which is kept as committed if the holder finished its writes.
+
+        :param token: The token of the lease, or `None` to release the lease whoever holds it
+        :raises KeyError: The lease is not held, or not with the token
+        """
+
+        key = (job_id, uid, name)
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease.committed or (token is not None and token != lease.token):
+                raise KeyError(f'Lease {name} is not held')
+
+            if committed:
+                lease.committed = True
+                lease.expires = None
+            else:
+                del self._leases[key]
+
+    @contextmanager
+    def fenced(self, job_id: str, uid: str, token: Optional[int]) -> Iterator[None]:
+        r""" Commit checkpoints of a UID with a fencing token, which is skipped if the token is `None`.
+
+        Commits are serialized, so that a commit with a smaller token can not overtake a commit with a larger token.
+
+        :raises ValueError: A larger token was committed with
+        """
+
+        if token is None:
+            yield
+            return
+
+        # Only the commits of the same UID wait for each other, and the table is not locked while committing
+        key = (job_id, uid)
+        with self._commit_lock(key):
+            with self._lock:
+                fence = self._fences.get(key, 0)
+                if token < fence:
+                    raise ValueError(f'Stale fencing token {token}, {fence} was committed with')
+                self._fences[key] = token
+            yield
+
+    @contextmanager
+    def _commit_lock(self, key: Tuple[str, str]) -> Iterator[None]:
+        with self._lock:
+            lock, users = self._commit_locks.get(key, (threading.Lock(), 0))
+            self._commit_locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            # Drop the lock once no commit needs it, so that the table does not grow with the UIDs ever committed
+            with self._lock:
+                lock, users = self._commit_locks[key]
+                if users == 1:
+                    del self._commit_locks[key]
+                else:
+                    self._commit_locks[key] = (lock, users - 1)
+
+    def forget(self, job_id: str, uid: str) -> None:
+        r""" Drop the leases and the fence of a UID whose checkpoints are deleted. """
+
+        with self._lock:
+            self._fences.pop((job_id, uid), None)
+            for key in [key for key in self._leases if key[:2] == (job_id, uid)]:
+                del self._leases[key]
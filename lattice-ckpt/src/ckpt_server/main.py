@@ -1,37 +1,75 @@
 import argparse
+import itertools
+import logging
 import os
+import signal
 import sys
 import time
 import zmq
 import threading
-from collections import defaultdict
-from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, List, Tuple
 
 sys.path.append('./')
 
 from utils.utils import (
     RequestType,
-    RecvTimedOutException,
     CheckpointMessage,
+    CheckpointResponse,
 )
+from ckpt_server.lease import LeaseTable
+from ckpt_server.metrics import ServiceMetrics
+from ckpt_server.store import CheckpointStore
 
 
 TOTAL_BYTES_THRESHHOLD = (1024 ** 3) * 4 # 4 GiB toal
 SINGLE_CKPT_BYTES_THRESHHOLD = (1024 ** 3) * 1 # 1 GiB per ckpt
+MEMORY_BYTES_THRESHHOLD = (1024 ** 3) * 1 # 1 GiB held in memory
+EVICTION_INTERVAL = 10
+METRICS_PORT = 9090
+LOG_SAMPLE_EVERY = 100
 ACK = b'ACK'
 
+logger = logging.getLogger('ckpt_server')
+
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--root-dir', type=str, required=True, help="Path to directory where checkpoints should be stored")
 parser.add_argument('--num-threads', type=int, default=4, help="Number of threads to use")
+parser.add_argument('--port', type=int, default=5555, help="Port to listen on")
+parser.add_argument('--memory-budget', type=int, default=MEMORY_BYTES_THRESHHOLD,
+                    help="Bytes of checkpoints held in memory before the least recently used ones are spilled to disk")
+parser.add_argument('--max-total-bytes', type=int, default=TOTAL_BYTES_THRESHHOLD,
+                    help="Bytes of all checkpoints, in memory and on disk")
+parser.add_argument('--max-checkpoint-bytes', type=int, default=SINGLE_CKPT_BYTES_THRESHHOLD,
+                    help="Bytes of a single checkpoint")
+parser.add_argument('--keep-last', type=int, default=0,
+                    help="Generations kept of every series of a job, e.g. of a checkpoint manager, unless the job "
+                         "sets its own. 0 keeps all of them")
+parser.add_argument('--job-quota-bytes', type=int, default=0,
+                    help="Bytes of checkpoints of a job, beyond which its oldest generations are evicted, unless the "
+                         "job sets its own. 0 for no quota")
+parser.add_argument('--job-ttl', type=float, default=0,
+                    help="Seconds after which the checkpoints of a job without requests are evicted, unless the job "
+                         "sets its own. 0 keeps them")
+parser.add_argument('--eviction-interval', type=float, default=EVICTION_INTERVAL,
+                    help="Seconds between eviction passes")
+parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                    help="Port to serve Prometheus metrics on at /metrics. 0 disables the metrics")
+parser.add_argument('--log-level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                    help="Level of the messages logged")
+parser.add_argument('--log-sample-every', type=int, default=LOG_SAMPLE_EVERY,
+                    help="Only one in this many handled requests is logged at the DEBUG level")
 
 
 class CheckpointService:
-    def __init__(self, root_dir, num_threads, context=None):
+    def __init__(self, root_dir, num_threads, context=None, port=5555, memory_budget=MEMORY_BYTES_THRESHHOLD,
+                 max_total_bytes=TOTAL_BYTES_THRESHHOLD, max_checkpoint_bytes=SINGLE_CKPT_BYTES_THRESHHOLD,
+                 keep_last=0, job_quota_bytes=0, job_ttl=0, eviction_interval=EVICTION_INTERVAL,
+                 metrics_port=METRICS_PORT, log_sample_every=LOG_SAMPLE_EVERY):
         self.context = context or zmq.Context.instance()
         self.url_worker = "inproc://workers"
-        self.url_client = "tcp://*:5555"
+        self.url_capture = "inproc://capture"
+        self.url_client = f"tcp://*:{port}"
         
         # Socket to talk to clients
         self.clients = self.context.socket(zmq.ROUTER)
@@ -42,90 +80,173 @@ class CheckpointService:
         self.workers.bind(self.url_worker)
         
         self.num_threads = num_threads
-        self._lock = threading.Lock()
 
-        self.checkpoint_cache: Dict[Dict[str, bytes]] = defaultdict(lambda: defaultdict(dict))
-        self._root_dir = Path(root_dir)
+        # The index of the checkpoints spilled to the root directory is rebuilt, so they survive restarts
+        self.store = CheckpointStore(root_dir, memory_budget, max_total_bytes, max_checkpoint_bytes)
+        # Leases and fencing tokens live in memory, so after a restart, writers waiting for a lease take it over
+        self.leases = LeaseTable()
+
+        # Eviction policies, which apply to the jobs without policies of their own
+        self.keep_last = keep_last
+        self.job_quota_bytes = job_quota_bytes
+        self.job_ttl = job_ttl
+        self.eviction_interval = eviction_interval
+        # job ID -> (keep_last, job_quota_bytes, job_ttl) set by the job with its POLICY requests
+        self.policies: Dict[str, Tuple[int, int, float]] = {}
+
+        self.metrics = ServiceMetrics(self.store, num_threads)
+        self.metrics_port = metrics_port
+        # Requests are logged sampled, since logging every one of them slows down the workers
+        self.log_sample_every = max(1, log_sample_every)
+        self._handled = itertools.count()
 
     def cleanup(self):
         self.clients.close()
         self.workers.close()
         self.context.term()
 
+    def _handle_ping_request(self, socket, job_id: str) -> None:
+        msg = CheckpointMessage(RequestType.PING, job_id=job_id, uid='', ckpt_name='', body=ACK)
+        msg.send(socket)
 
-    def _timed_recv(self, timeout: int = 5) -> bytes:
-        start = time.time()
-        while time.time() - start < timeout:
-            try:
-                return self.socket.recv(zmq.NOBLOCK)
-            except zmq.error.Again:
-                time.sleep(0.1)
-
-        raise RecvTimedOutException()
 
+    def _handle_list_request(self, socket, job_id: str, uid: str) -> None:
+        # Requests with a UID only list its checkpoints, so they do not grow with the generations of the job
+        checkpoints = self.store.list(job_id, uid or None)
 
-    def _handle_ping_request(self, socket, job_id: str) -> None:
-        msg = CheckpointMessage(RequestType.PING, job_id=job_id, uid='', ckpt_name='', body=ACK)
-        socket.send(msg.encode_message())
+        msg = CheckpointMessage(RequestType.LIST, job_id=job_id, uid=uid, ckpt_name='', body=checkpoints)
+        msg.send(socket)
 
 
-    def _handle_list_request(self, socket, job_id: str) -> None:
-        all_checkpoints = {}
-        for k, v in self.checkpoint_cache[job_id].items():
-            all_checkpoints[k] = list(v.keys())
+    def _handle_exists_request(self, socket, job_id: str, uid: str, ckpt_name: str) -> None:
+        exists = self.store.exists(job_id, uid, ckpt_name)
 
-        msg = CheckpointMessage(RequestType.LIST, job_id=job_id, uid='', ckpt_name='', body=all_checkpoints)
-        socket.send(msg.encode_message())
+        msg = CheckpointMessage(RequestType.EXISTS, job_id, uid, ckpt_name, exists)
+        msg.send(socket)
 
 
-    def _handle_save_request(self, socket, job_id: str, uid: str, ckpt_name: str, checkpoint_data: bytes) -> None:
-        # TODO: If we need to save space, write some checkpoints to disk
-        self.checkpoint_cache[job_id][uid][ckpt_name] = checkpoint_data
+    def _handle_save_request(self, socket, job_id: str, uid: str, ckpt_name: str, body: Any) -> None:
+        # A JSON body commits or aborts a checkpoint streamed in chunks
+        if isinstance(body, dict) and body.get('abort'):
+            self.store.abort(job_id, uid, ckpt_name)
+        elif isinstance(body, dict):
+            try:
+                with self.leases.fenced(job_id, uid, body.get('token')):
+                    self.store.commit(job_id, uid, ckpt_name, body['chunks'])
+            except ValueError:
+                self.store.abort(job_id, uid, ckpt_name)
+                raise
+        else:
+            self.store.put(job_id, uid, ckpt_name, body)
 
         msg = CheckpointMessage(RequestType.SAVE, job_id, uid, ckpt_name, ACK)
-        socket.send(msg.encode_message())
+        msg.send(socket)
+
+
+    def _handle_save_many_request(self, socket, job_id: str, uid: str, body: Dict,
+                                  attachments: List[memoryview]) -> None:
+        # The checkpoints are views of the received frames, which are held as they are
+        if len(body['names']) != len(attachments):
+            raise ValueError(f'Expected {len(body["names"])} checkpoints, but got {len(attachments)}')
+
+        with self.leases.fenced(job_id, uid, body.get('token')):
+            self.store.put_many(job_id, uid, list(zip(body['names'], attachments)))
+
+        msg = CheckpointMessage(RequestType.SAVE_MANY, job_id, uid, '', ACK)
+        msg.send(socket)
+
+
+    def _handle_save_chunk_request(self, socket, job_id: str, uid: str, ckpt_name: str, seq: int,
+                                   chunk: memoryview) -> None:
+        credit = self.store.write_chunk(job_id, uid, ckpt_name, seq, chunk)
+
+        msg = CheckpointMessage(RequestType.SAVE_CHUNK, job_id, uid, ckpt_name, {'credit': credit}, seq=seq)
+        msg.send(socket)
 
 
     def _handle_load_request(self, socket, job_id: str, uid: str, ckpt_name: str) -> None:
         try:
-            checkpoint_data = self.checkpoint_cache[job_id][uid][ckpt_name]
+            checkpoint_data = self.store.read(job_id, uid, ckpt_name)
             response_msg = CheckpointMessage(RequestType.LOAD, job_id, uid, ckpt_name, checkpoint_data)
-            socket.send(response_msg.encode_message())
+            response_msg.send(socket)
+        except KeyError:
+            error_response = CheckpointMessage(RequestType.ERROR, job_id, uid, ckpt_name, b'Checkpoint not found')
+            error_response.send(socket)
+
+
+    def _handle_load_chunk_request(self, socket, job_id: str, uid: str, ckpt_name: str, seq: int,
+                                   chunk_size: int) -> None:
+        # Only the requested chunk is read, so loading does not depend on the checkpoint size
+        try:
+            chunk = self.store.read(job_id, uid, ckpt_name, seq * chunk_size, chunk_size)
+            response_msg = CheckpointMessage(RequestType.LOAD_CHUNK, job_id, uid, ckpt_name, chunk, seq=seq)
+            response_msg.send(socket)
         except KeyError:
             error_response = CheckpointMessage(RequestType.ERROR, job_id, uid, ckpt_name, b'Checkpoint not found')
-            socket.send(error_response.encode_message())
+            error_response.send(socket)
+
+
+    def _handle_load_many_request(self, socket, job_id: str, uid: str, body: Dict) -> None:
+        # The first chunks are answered until they add up to the maximum bytes, but at least one is answered however
+        # large it is. Clients load the rest of the checkpoints chunk by chunk.
+        names, missing, chunks, nbytes = [], [], [], 0
+        for ckpt_name in body['names']:
+            if chunks and nbytes >= body['max_bytes']:
+                if not self.store.exists(job_id, uid, ckpt_name):
+                    missing.append(ckpt_name)
+                continue
+            try:
+                chunks.append(self.store.read(job_id, uid, ckpt_name, 0, body['chunk_size']))
+            except KeyError:
+                missing.append(ckpt_name)
+                continue
+            names.append(ckpt_name)
+            nbytes += len(chunks[-1])
+
+        response_msg = CheckpointMessage(RequestType.LOAD_MANY, job_id, uid, '', {'names': names, 'missing': missing},
+                                         attachments=chunks)
+        response_msg.send(socket)
 
 
     def _handle_del_request(self, socket, job_id: str, uid: str, ckpt_name: str) -> None:
         try:
-            del self.checkpoint_cache[job_id][uid][ckpt_name]
+            self.store.delete(job_id, uid, ckpt_name)
+            # The UID is expired, so its leases are not waited for any more
+            self.leases.forget(job_id, uid)
             msg = CheckpointMessage(RequestType.DEL, job_id, uid, ckpt_name, ACK)
-            socket.send(msg.encode_message())
+            msg.send(socket)
         except KeyError:
             error_response = CheckpointMessage(RequestType.ERROR, job_id, uid, ckpt_name, b'Checkpoint not found')
-            socket.send(error_response.encode_message())
+            error_response.send(socket)
+
+
+    def _handle_policy_request(self, socket, job_id: str, policy: Dict) -> None:
+        # Policies missing from the request fall back to the ones of the service
+        self.policies[job_id] = (int(policy.get('keep_last', self.keep_last)),
+                                 int(policy.get('job_quota_bytes', self.job_quota_bytes)),
+                                 float(policy.get('job_ttl', self.job_ttl)))
+
+        msg = CheckpointMessage(RequestType.POLICY, job_id, '', '', ACK)
+        msg.send(socket)
 
 
     def _handle_acquire_request(self, socket, job_id: str, uid: str, lock_name: str, node_info: Dict) -> None:
-        with self._lock:
-            try:
-                lock = self.checkpoint_cache[job_id][uid][lock_name]
-                msg = CheckpointMessage(RequestType.ACQUIRE, job_id, uid, lock_name, lock)
-                socket.send(msg.encode_message())
-            except KeyError:
-                self.checkpoint_cache[job_id][uid][lock_name] = node_info
-                msg = CheckpointMessage(RequestType.ACQUIRE, job_id, uid, lock_name, node_info)
-                socket.send(msg.encode_message())
+        # Responds with the holder of the lease, which is the requester if it got the lease
+        lease = self.leases.acquire(job_id, uid, lock_name, node_info)
+        msg = CheckpointMessage(RequestType.ACQUIRE, job_id, uid, lock_name, lease)
+        msg.send(socket)
 
 
-    def _handle_release_request(self, socket, job_id: str, uid: str, lock_name: str) -> None:
+    def _handle_release_request(self, socket, job_id: str, uid: str, lock_name: str, body: Any) -> None:
+        # Clients releasing locks without tokens send empty bodies
+        body = body if isinstance(body, dict) else {}
         try:
-            del self.checkpoint_cache[job_id][uid][lock_name]
+            self.leases.release(job_id, uid, lock_name, body.get('token'), body.get('committed', False))
             msg = CheckpointMessage(RequestType.RELEASE, job_id, uid, lock_name, ACK)
-            socket.send(msg.encode_message())
+            msg.send(socket)
         except KeyError:
             error_response = CheckpointMessage(RequestType.ERROR, job_id, uid, lock_name, b'Lock not found')
-            socket.send(error_response.encode_message())
+            error_response.send(socket)
 
 
     def worker_routine(self, worker_id: int) -> None:
@@ -134,35 +255,95 @@ class CheckpointService:
         socket.connect(self.url_worker)
 
         while True:
-            print(f'Worker {worker_id} waiting for message...')
-
-            message = socket.recv()
-
-            parsed_msg = CheckpointMessage.parse_message(message)
-
-            if parsed_msg.req_type == RequestType.PING:
-                self._handle_ping_request(socket, parsed_msg.job_id)
-            elif parsed_msg.req_type == RequestType.LIST:
-                self._handle_list_request(socket, parsed_msg.job_id)
-            elif parsed_msg.req_type == RequestType.SAVE:
-                self._handle_save_request(socket, parsed_msg.job_id, parsed_msg.uid,
-                                          parsed_msg.ckpt_name, parsed_msg.body)
-            elif parsed_msg.req_type == RequestType.LOAD:
-                self._handle_load_request(socket, parsed_msg.job_id, parsed_msg.uid,
-                                          parsed_msg.ckpt_name)
-            elif parsed_msg.req_type == RequestType.DEL:
-                self._handle_del_request(socket, parsed_msg.job_id, parsed_msg.uid, 
-                                         parsed_msg.ckpt_name)
-            elif parsed_msg.req_type == RequestType.ACQUIRE:
-                self._handle_acquire_request(socket, parsed_msg.job_id, parsed_msg.uid,
-                                             parsed_msg.ckpt_name, parsed_msg.body)
-            elif parsed_msg.req_type == RequestType.RELEASE:
-                self._handle_release_request(socket, parsed_msg.job_id, parsed_msg.uid,
-                                             parsed_msg.ckpt_name)
-            else:
-                raise ValueError(f'Invalid request type {parsed_msg.req_type}')
-
-            print(f'Worker {worker_id} finished handling message')
+            # The body of a checkpoint is a view of the received frame, which is written as it is
+            try:
+                parsed_msg = CheckpointMessage.recv(socket)
+            except Exception as e:
+                # A REP socket has to respond to every request
+                logger.warning('Worker %d received an invalid message: %s', worker_id, e)
+                self.metrics.invalid()
+                CheckpointMessage(RequestType.ERROR, '', '', '', str(e).encode()).send(socket)
+                continue
+
+            self.metrics.started()
+            start = time.perf_counter()
+            failed = False
+            try:
+                self._handle_request(socket, parsed_msg)
+            except Exception as e:
+                failed = True
+                logger.warning('Worker %d failed to handle %s of %s/%s: %s', worker_id, parsed_msg.req_type.name,
+                               parsed_msg.job_id, parsed_msg.uid, e)
+                CheckpointMessage(RequestType.ERROR, '', '', '', str(e).encode()).send(socket)
+            elapsed = time.perf_counter() - start
+            self.metrics.finished(worker_id, parsed_msg.req_type, elapsed, failed)
+
+            if logger.isEnabledFor(logging.DEBUG) and next(self._handled) % self.log_sample_every == 0:
+                logger.debug('Worker %d handled %s of %s/%s in %.3f ms', worker_id, parsed_msg.req_type.name,
+                             parsed_msg.job_id, parsed_msg.uid, elapsed * 1000)
+
+    def evict(self) -> None:
+        r""" Evict the generations which the eviction policies of their jobs expire. """
+
+        evicted = self.store.evict(self.keep_last, self.job_quota_bytes, self.job_ttl, dict(self.policies))
+        for job_id, uid in evicted:
+            # Writers waiting for a committed lease of an evicted generation upload it again
+            self.leases.forget(job_id, uid)
+            logger.info('Evicted checkpoints of %s/%s', job_id, uid)
+            # The policy of a job is forgotten with its last generation
+            if not self.store.list(job_id):
+                self.policies.pop(job_id, None)
+
+    def eviction_routine(self) -> None:
+        # Generations are evicted apart from the workers, which only wait for the store while victims are picked
+        while True:
+            time.sleep(self.eviction_interval)
+            try:
+                self.evict()
+            except Exception as e:
+                logger.warning('Unable to evict checkpoints due to: %s', e)
+
+    def _handle_request(self, socket, parsed_msg: CheckpointResponse) -> None:
+        if parsed_msg.job_id:
+            self.store.touch(parsed_msg.job_id)
+
+        if parsed_msg.req_type == RequestType.PING:
+            self._handle_ping_request(socket, parsed_msg.job_id)
+        elif parsed_msg.req_type == RequestType.LIST:
+            self._handle_list_request(socket, parsed_msg.job_id, parsed_msg.uid)
+        elif parsed_msg.req_type == RequestType.EXISTS:
+            self._handle_exists_request(socket, parsed_msg.job_id, parsed_msg.uid, parsed_msg.ckpt_name)
+        elif parsed_msg.req_type == RequestType.SAVE:
+            self._handle_save_request(socket, parsed_msg.job_id, parsed_msg.uid,
+                                      parsed_msg.ckpt_name, parsed_msg.body)
+        elif parsed_msg.req_type == RequestType.SAVE_MANY:
+            self._handle_save_many_request(socket, parsed_msg.job_id, parsed_msg.uid, parsed_msg.body,
+                                           parsed_msg.attachments)
+        elif parsed_msg.req_type == RequestType.SAVE_CHUNK:
+            self._handle_save_chunk_request(socket, parsed_msg.job_id, parsed_msg.uid,
+                                            parsed_msg.ckpt_name, parsed_msg.seq, parsed_msg.body)
+        elif parsed_msg.req_type == RequestType.LOAD:
+            self._handle_load_request(socket, parsed_msg.job_id, parsed_msg.uid,
+                                      parsed_msg.ckpt_name)
+        elif parsed_msg.req_type == RequestType.LOAD_MANY:
+            self._handle_load_many_request(socket, parsed_msg.job_id, parsed_msg.uid, parsed_msg.body)
+        elif parsed_msg.req_type == RequestType.LOAD_CHUNK:
+            self._handle_load_chunk_request(socket, parsed_msg.job_id, parsed_msg.uid,
+                                            parsed_msg.ckpt_name, parsed_msg.seq, parsed_msg.body['chunk_size'])
+        elif parsed_msg.req_type == RequestType.DEL:
+            self._handle_del_request(socket, parsed_msg.job_id, parsed_msg.uid,
+                                     parsed_msg.ckpt_name)
+        elif parsed_msg.req_type == RequestType.ACQUIRE:
+            self._handle_acquire_request(socket, parsed_msg.job_id, parsed_msg.uid,
+                                         parsed_msg.ckpt_name, parsed_msg.body)
+        elif parsed_msg.req_type == RequestType.RELEASE:
+            self._handle_release_request(socket, parsed_msg.job_id, parsed_msg.uid,
+                                         parsed_msg.ckpt_name, parsed_msg.body)
+        elif parsed_msg.req_type == RequestType.POLICY:
+            self._handle_policy_request(socket, parsed_msg.job_id, parsed_msg.body)
+        else:
+            raise ValueError(f'Invalid request type {parsed_msg.req_type}')
+
 
     def launch(self) -> None:
         # Launch pool of worker threads
@@ -171,13 +352,48 @@ class CheckpointService:
             thread.daemon = True
             thread.start()
 
-        zmq.proxy(self.clients, self.workers)
+        # Jobs may set policies of their own, so the eviction thread runs even if the service sets none
+        if self.eviction_interval > 0:
+            thread = threading.Thread(target=self.eviction_routine)
+            thread.daemon = True
+            thread.start()
+
+        if self.metrics_port <= 0:
+            zmq.proxy(self.clients, self.workers)
+            return
+
+        self.metrics.serve(self.metrics_port)
+        logger.info('Serving metrics on port %d', self.metrics_port)
+
+        # The proxy sends every message it forwards to the capture socket, whose messages are counted by another
+        # thread, so requests are not slowed down by counting them
+        capture = self.context.socket(zmq.PUSH)
+        capture.bind(self.url_capture)
+        thread = threading.Thread(target=self.capture_routine)
+        thread.daemon = True
+        thread.start()
+        zmq.proxy(self.clients, self.workers, capture)
+
+    def capture_routine(self) -> None:
+        socket = self.context.socket(zmq.PULL)
+        socket.connect(self.url_capture)
+        self.metrics.count_forwarded(socket)
 
 def main():
     args = parser.parse_args()
-
-    manager = CheckpointService(args.root_dir, args.num_threads)
-    manager.launch()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    manager = CheckpointService(args.root_dir, args.num_threads, port=args.port, memory_budget=args.memory_budget,
+                                max_total_bytes=args.max_total_bytes, max_checkpoint_bytes=args.max_checkpoint_bytes,
+                                keep_last=args.keep_last, job_quota_bytes=args.job_quota_bytes, job_ttl=args.job_ttl,
+                                eviction_interval=args.eviction_interval, metrics_port=args.metrics_port,
+                                log_sample_every=args.log_sample_every)
+    # Spill the checkpoints held in memory when the pod is stopped
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        manager.launch()
+    finally:
+        manager.store.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,128 @@
+import threading
+from typing import Any, Iterator
+
+import zmq
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+from utils.utils import RequestType
+
+
+# Seconds requests take, from a chunk read from memory to a large checkpoint written to disk
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _StoreCollector:
+    r""" Read the checkpoints stored and the requests queued when the metrics are scraped. """
+
+    def __init__(self, metrics: 'ServiceMetrics', store: Any):
+        self._metrics = metrics
+        self._store = store
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        job_bytes = GaugeMetricFamily('lattice_ckpt_job_bytes', 'Bytes of checkpoints stored per job', labels=['job'])
+        generations = GaugeMetricFamily('lattice_ckpt_job_generations', 'Generations stored per job', labels=['job'])
+        for job_id, (nbytes, count) in self._store.job_stats().items():
+            job_bytes.add_metric([job_id], nbytes)
+            generations.add_metric([job_id], count)
+        yield job_bytes
+        yield generations
+
+        yield GaugeMetricFamily('lattice_ckpt_memory_bytes', 'Bytes of checkpoints held in memory',
+                                value=self._store.memory_bytes)
+        yield GaugeMetricFamily('lattice_ckpt_stored_bytes', 'Bytes of checkpoints held in memory and on disk',
+                                value=self._store.total_bytes)
+        yield GaugeMetricFamily('lattice_ckpt_queued_requests',
+                                'Requests forwarded to the workers, which no worker picked up yet',
+                                value=self._metrics.queued)
+
+
+class ServiceMetrics:
+    r""" Metrics of the checkpoint service, which are exposed in the Prometheus text format.
+
+    Requests are instrumented as workers handle them, and the checkpoints stored are read when the metrics are scraped,
+    so they cost nothing in between. The requests queued are the messages the proxy forwarded, which its capture socket
+    sends to :meth:`count_forwarded`, less the requests workers received and the responses they sent.
+
+    :param store: The store of the checkpoints
+    :param num_workers: The number of worker threads
+    """
+
+    def __init__(self, store: Any, num_workers: int):
+        self.registry = CollectorRegistry()
+        self._requests = Counter('lattice_ckpt_requests', 'Requests handled by type and outcome',
+                                 ['type', 'outcome'], registry=self.registry)
+        self._latency = Histogram('lattice_ckpt_request_duration_seconds', 'Seconds workers take to handle requests',
+                                  ['type'], buckets=LATENCY_BUCKETS, registry=self.registry)
+        self._busy_seconds = Counter('lattice_ckpt_worker_busy_seconds',
+                                     'Seconds workers spent handling requests, which over time is their utilization',
+                                     ['worker'], registry=self.registry)
+        self._busy_workers = Gauge('lattice_ckpt_workers_busy', 'Workers handling a request', registry=self.registry)
+        Gauge('lattice_ckpt_workers', 'Worker threads', registry=self.registry).set(num_workers)
+
+        # Children are created up front, so that every type is exposed before it is requested. Errors are only
+        # responses.
+        for req_type in RequestType:
+            if req_type == RequestType.ERROR:
+                continue
+            self._latency.labels(req_type.name)
+            for outcome in ('ok', 'failed'):
+                self._requests.labels(req_type.name, outcome)
+        self._requests.labels('INVALID', 'failed')
+        for worker_id in range(num_workers):
+            self._busy_seconds.labels(str(worker_id))
+
+        # Messages forwarded by the proxy in either direction, and requests workers received and answered
+        self.forwarded = 0
+        self.received = 0
+        self.answered = 0
+        self._lock = threading.Lock()
+        self.registry.register(_StoreCollector(self, store))
+
+    @property
+    def queued(self) -> int:
+        r""" The requests forwarded to the workers, which no worker picked up yet. """
+
+        with self._lock:
+            # Every response the workers sent is forwarded too, and counters are read while they are updated
+            return max(0, self.forwarded - self.answered - self.received)
+
+    def started(self) -> None:
+        r""" Record that a worker picked up a request. """
+
+        with self._lock:
+            self.received += 1
+        self._busy_workers.inc()
+
+    def finished(self, worker_id: int, req_type: RequestType, seconds: float, failed: bool) -> None:
+        r""" Record that a worker handled a request, or failed to. """
+
+        with self._lock:
+            self.answered += 1
+        self._busy_workers.dec()
+        self._busy_seconds.labels(str(worker_id)).inc(seconds)
+        self._requests.labels(req_type.name, 'failed' if failed else 'ok').inc()
+        self._latency.labels(req_type.name).observe(seconds)
+
+    def invalid(self) -> None:
+        r""" Record a message which could not be parsed, and is answered with an error. """
+
+        with self._lock:
+            self.received += 1
+            self.answered += 1
+        self._requests.labels('INVALID', 'failed').inc()
+
+    def count_forwarded(self, socket: zmq.Socket) -> None:
+        r""" Count the messages received from the capture socket of the proxy, which forwards them in C without
+        waiting for this thread. """
+
+        while True:
+            socket.recv_multipart(copy=False)
+            with self._lock:
+                self.forwarded += 1
+
+    def serve(self, port: int) -> None:
+        r""" Serve the metrics over HTTP at ``/metrics`` in a background thread. """
+
+        start_http_server(port, registry=self.registry)
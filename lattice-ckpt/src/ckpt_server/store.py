@@ -0,0 +1,498 @@
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Chunks a client may send ahead of the acknowledgements. Chunks received out of order are buffered until the chunks
+# before them arrive, and credits shrink as the buffered bytes of all uploads approach the threshold
+STREAM_CREDIT = 8
+STREAM_BUFFER_BYTES_THRESHHOLD = (1024 ** 2) * 256  # 256 MiB total
+
+# Suffixes of files being written, which are removed when the index is rebuilt
+_PARTIAL_SUFFIX = '.partial'
+_TMP_SUFFIX = '.tmp'
+
+# UIDs of generations end with a counter, e.g. ``RemoteCheckpointCollectionManager:job_000012``
+_COUNTER = re.compile(r'_\d+$')
+
+
+def _series(uid: str) -> str:
+    r""" The series of a generation, i.e. its UID without the counter, e.g. the checkpoint manager saving it. """
+
+    return _COUNTER.sub('', uid)
+
+
+class StoreLimitExceeded(Exception):
+    pass
+
+
+class _Entry:
+    r""" A checkpoint, which is held in memory until it is spilled to its file. """
+
+    def __init__(self, path: Path, size: int, data: Optional[memoryview] = None):
+        self.path = path
+        self.size = size
+        self.data = data
+
+
+class _Upload:
+    r""" A checkpoint being received in chunks, which are written to a temporary file in order. """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.next_seq = 0
+        self.size = 0
+        # Sequence numbers of the chunks counted in the size, which are written or buffered once however often they are
+        # received
+        self.received: Set[int] = set()
+        self.pending: Dict[int, memoryview] = {}
+        self.lock = threading.Lock()
+
+    def discard(self) -> int:
+        r""" Close and remove the temporary file, and return the bytes of the chunks that were buffered. """
+
+        self.file.close()
+        self.path.unlink(missing_ok=True)
+        buffered = sum(len(chunk) for chunk in self.pending.values())
+        self.pending.clear()
+        return buffered
+
+
+class CheckpointStore:
+    r""" Checkpoints of all jobs, held in memory within a budget and spilled to files under the root directory.
+
+    Checkpoints saved at once are held in memory, and when the memory budget is exceeded, the generations, i.e. the
+    checkpoints of a UID, used least recently are spilled to files. Checkpoints streamed in chunks are written to files
+    as they are received. Spilled checkpoints survive restarts, since the index is rebuilt from the files, and held
+    checkpoints are spilled when the store is closed. Generations expired by the eviction policies of their jobs are
+    deleted by :meth:`evict`.
+
+    :param root_dir: The directory where checkpoints are spilled to
+    :param memory_budget: The maximum number of bytes of checkpoints held in memory
+    :param max_total_bytes: The maximum number of bytes of all checkpoints, in memory and on disk
+    :param max_checkpoint_bytes: The maximum number of bytes of a checkpoint
+    """
+
+    def __init__(self, root_dir: str, memory_budget: int, max_total_bytes: int, max_checkpoint_bytes: int):
+        self._root_dir = Path(root_dir)
+        self._root_dir.mkdir(parents=True, exist_ok=True)
+        self._memory_budget = memory_budget
+        self._max_total_bytes = max_total_bytes
+        self._max_checkpoint_bytes = max_checkpoint_bytes
+
+        self._lock = threading.Lock()
+        # Spills by different workers would pick the same checkpoints
+        self._spill_lock = threading.Lock()
+        # (job ID, UID) -> checkpoint name -> checkpoint, least recently used first
+        self._generations: 'OrderedDict[Tuple[str, str], Dict[str, _Entry]]' = OrderedDict()
+        self._memory_bytes = 0
+        self._total_bytes = 0
+        # (job ID, UID) -> the order in which the generation was created
+        self._created: Dict[Tuple[str, str], int] = {}
+        self._next_created = itertools.count()
+        # job ID -> when the job last sent a request, by the monotonic clock
+        self._last_seen: Dict[str, float] = {}
+
+        self._uploads: Dict[Tuple[str, str, str], _Upload] = {}
+        self._buffered_bytes = 0
+
+        self._rebuild_index()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _path(self, job_id: str, uid: str, ckpt_name: str) -> Path:
+        for part in (job_id, uid, ckpt_name):
+            if not part or part in ('.', '..') or '/' in part or os.sep in part:
+                raise ValueError(f'Invalid checkpoint {job_id}/{uid}/{ckpt_name}')
+
+        return self._root_dir / job_id / uid / ckpt_name
+
+    def _rebuild_index(self) -> None:
+        files = []
+        for path in self._root_dir.glob('*/*/*'):
+            if not path.is_file():
+                continue
+            # Leftovers of writes interrupted by a restart
+            if path.name.endswith(_PARTIAL_SUFFIX) or path.name.endswith(_TMP_SUFFIX):
+                path.unlink()
+                continue
+            stat = path.stat()
+            files.append((stat.st_mtime, path, stat.st_size))
+
+        # Generations written most recently are the most recently used
+        for _, path, size in sorted(files, key=lambda f: f[0]):
+            key = (path.parent.parent.name, path.parent.name)
+            self._created.setdefault(key, next(self._next_created))
+            self._generations.setdefault(key, {})[path.name] = _Entry(path, size)
+            self._generations.move_to_end(key)
+            self._total_bytes += size
+
+    def _check_limits(self, size: int, added: int) -> None:
+        # Called with the lock held
+        if size > self._max_checkpoint_bytes:
+            raise StoreLimitExceeded(f'Checkpoint exceeds the limit of {self._max_checkpoint_bytes} bytes')
+        if self._total_bytes + added > self._max_total_bytes:
+            raise StoreLimitExceeded(f'Checkpoints exceed the limit of {self._max_total_bytes} bytes')
+
+    def _add(self, job_id: str, uid: str, ckpt_name: str, entry: _Entry) -> None:
+        # Called with the lock held, replacing the existing checkpoint
+        if (job_id, uid) not in self._generations:
+            self._created[(job_id, uid)] = next(self._next_created)
+        generation = self._generations.setdefault((job_id, uid), {})
+        self._generations.move_to_end((job_id, uid))
+        old = generation.pop(ckpt_name, None)
+        if old is not None:
+            self._total_bytes -= old.size
+            if old.data is not None:
+                self._memory_bytes -= old.size
+                # So that a spill in progress does not overwrite the new checkpoint
+                old.data = None
+        generation[ckpt_name] = entry
+        self._total_bytes += entry.size
+        if entry.data is not None:
+            self._memory_bytes += entry.size
+
+    def _lookup(self, job_id: str, uid: str, ckpt_name: str) -> _Entry:
+        # Called with the lock held
+        entry = self._generations.get((job_id, uid), {})[ckpt_name]
+        self._generations.move_to_end((job_id, uid))
+        return entry
+
+    def list(self, job_id: str, uid: Optional[str] = None) -> Dict[str, List[str]]:
+        r""" List the checkpoints of a job, or only of one of its UIDs. """
+
+        with self._lock:
+            if uid is not None:
+                generation = self._generations.get((job_id, uid))
+                return {uid: list(generation)} if generation else {}
+            return {uid: list(generation) for (job, uid), generation in self._generations.items() if job == job_id}
+
+    def job_stats(self) -> Dict[str, Tuple[int, int]]:
+        r""" Get the bytes and the number of generations of the checkpoints of every job. """
+
+        stats: Dict[str, Tuple[int, int]] = {}
+        with self._lock:
+            for (job_id, _), generation in self._generations.items():
+                nbytes, count = stats.get(job_id, (0, 0))
+                stats[job_id] = (nbytes + sum(entry.size for entry in generation.values()), count + 1)
+        return stats
+
+    def exists(self, job_id: str, uid: str, ckpt_name: str) -> bool:
+        with self._lock:
+            return ckpt_name in self._generations.get((job_id, uid), {})
+
+    def put(self, job_id: str, uid: str, ckpt_name: str, data: memoryview) -> None:
+        r""" Save a checkpoint received at once, which is held in memory without being copied. """
+
+        path = self._path(job_id, uid, ckpt_name)
+        with self._lock:
+            old = self._generations.get((job_id, uid), {}).get(ckpt_name)
+            self._check_limits(len(data), len(data) - (old.size if old is not None else 0))
+            self._add(job_id, uid, ckpt_name, _Entry(path, len(data), data))
+
+        self._spill()
+
+    def put_many(self, job_id: str, uid: str, checkpoints: List[Tuple[str, memoryview]]) -> None:
+        r""" Save checkpoints of a UID received at once, all of them or none of them. """
+
+        paths = [self._path(job_id, uid, ckpt_name) for ckpt_name, _ in checkpoints]
+        with self._lock:
+            generation = self._generations.get((job_id, uid), {})
+            added = 0
+            for ckpt_name, data in dict(checkpoints).items():
+                old = generation.get(ckpt_name)
+                self._check_limits(len(data), 0)
+                added += len(data) - (old.size if old is not None else 0)
+            self._check_limits(0, added)
+            for path, (ckpt_name, data) in zip(paths, checkpoints):
+                self._add(job_id, uid, ckpt_name, _Entry(path, len(data), data))
+
+        self._spill()
+
+    def _spill(self) -> None:
+        r""" Spill the generations used least recently to files, until the memory budget is met. """
+
+        with self._spill_lock:
+            self._spill_locked()
+
+    def _spill_locked(self) -> None:
+        with self._lock:
+            victims = []
+            excess = self._memory_bytes - self._memory_budget
+            for generation in self._generations.values():
+                if excess <= 0:
+                    break
+                for entry in generation.values():
+                    if entry.data is not None:
+                        victims.append((entry, entry.data))
+                        excess -= entry.size
+
+        # Files are written without the lock, and the checkpoints are served from memory meanwhile
+        for entry, data in victims:
+            tmp_path = entry.path.with_name(f'{entry.path.name}{_TMP_SUFFIX}')
+            try:
+                entry.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+            except OSError as e:
+                # The checkpoint stays in memory, e.g. if it was deleted along with its directory meanwhile
+                logger.warning('Unable to spill %s due to: %s', entry.path, e)
+                continue
+
+            with self._lock:
+                # The checkpoint may have been replaced or deleted meanwhile
+                if entry.data is data:
+                    os.replace(tmp_path, entry.path)
+                    entry.data = None
+                    self._memory_bytes -= entry.size
+                else:
+                    tmp_path.unlink()
+
+    def write_chunk(self, job_id: str, uid: str, ckpt_name: str, seq: int, chunk: memoryview) -> int:
+        r""" Write a chunk of a checkpoint streamed in chunks, and return the credits granted to the sender. """
+
+        key = (job_id, uid, ckpt_name)
+        path = self._path(job_id, uid, ckpt_name)
+
+        with self._lock:
+            upload = self._uploads.get(key)
+            # The first chunk of a retried save starts over
+            if upload is None or (seq == 0 and upload.next_seq > 0):
+                if upload is not None:
+                    self._discard(key)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                upload = self._uploads[key] = _Upload(path.with_name(f'{path.name}{_PARTIAL_SUFFIX}'))
+
+            # Retransmitted chunks are not written again, so they are not counted again
+            if seq not in upload.received:
+                try:
+                    self._check_limits(upload.size + len(chunk), len(chunk))
+                except StoreLimitExceeded:
+                    self._discard(key)
+                    raise
+                upload.received.add(seq)
+                upload.size += len(chunk)
+                self._total_bytes += len(chunk)
+
+        # Chunks may be handled by different workers out of order, so they are written in order of their sequence
+        # numbers, and the ones received ahead are buffered
+        buffered = 0
+        with upload.lock:
+            if seq == upload.next_seq:
+                upload.file.write(chunk)
+                upload.next_seq += 1
+                while upload.next_seq in upload.pending:
+                    data = upload.pending.pop(upload.next_seq)
+                    upload.file.write(data)
+                    upload.next_seq += 1
+                    buffered -= len(data)
+            elif seq > upload.next_seq and seq not in upload.pending:
+                upload.pending[seq] = chunk
+                buffered += len(chunk)
+
+        with self._lock:
+            self._buffered_bytes += buffered
+            available = STREAM_BUFFER_BYTES_THRESHHOLD - self._buffered_bytes
+            return max(1, min(STREAM_CREDIT, available // max(1, len(chunk))))
+
+    def _discard(self, key: Tuple[str, str, str]) -> None:
+        # Called with the lock held
+        upload = self._uploads.pop(key)
+        with upload.lock:
+            self._buffered_bytes -= upload.discard()
+        self._total_bytes -= upload.size
+
+    def commit(self, job_id: str, uid: str, ckpt_name: str, chunks: int) -> None:
+        r""" Commit a checkpoint streamed in chunks.
+
+        :raises ValueError: Not all the chunks of the checkpoint were received
+        """
+
+        key = (job_id, uid, ckpt_name)
+        with self._lock:
+            upload = self._uploads.get(key)
+            if upload is None or upload.next_seq != chunks or upload.pending:
+                if upload is not None:
+                    self._discard(key)
+                raise ValueError('Incomplete checkpoint')
+
+            del self._uploads[key]
+            upload.file.close()
+            path = self._path(job_id, uid, ckpt_name)
+            os.replace(upload.path, path)
+            # The bytes of the upload were counted as they were received
+            self._total_bytes -= upload.size
+            self._add(job_id, uid, ckpt_name, _Entry(path, upload.size))
+
+    def abort(self, job_id: str, uid: str, ckpt_name: str) -> None:
+        r""" Discard the chunks of a checkpoint streamed in chunks. """
+
+        with self._lock:
+            if (job_id, uid, ckpt_name) in self._uploads:
+                self._discard((job_id, uid, ckpt_name))
+
+    def read(self, job_id: str, uid: str, ckpt_name: str, offset: int = 0, size: Optional[int] = None) -> Any:
+        r""" Read a checkpoint, or a range of it, without copying it if it is held in memory.
+
+        :raises KeyError: The checkpoint does not exist
+        """
+
+        with self._lock:
+            entry = self._lookup(job_id, uid, ckpt_name)
+            data = entry.data
+            # Spilled checkpoints are opened with the lock held, since they may be deleted, evicted or replaced as soon
+            # as it is released. The open file keeps reading the checkpoint even if its path is unlinked or replaced.
+            f = open(entry.path, 'rb') if data is None else None
+
+        end = entry.size if size is None else min(offset + size, entry.size)
+        if f is None:
+            return data[offset:end]
+
+        with f:
+            f.seek(offset)
+            return f.read(max(0, end - offset))
+
+    def delete(self, job_id: str, uid: str, ckpt_name: str) -> None:
+        r""" Delete a checkpoint.
+
+        :raises KeyError: The checkpoint does not exist
+        """
+
+        with self._lock:
+            if (job_id, uid, ckpt_name) in self._uploads:
+                self._discard((job_id, uid, ckpt_name))
+
+            generation = self._generations.get((job_id, uid), {})
+            entry = generation.pop(ckpt_name)
+            if not generation:
+                del self._generations[(job_id, uid)]
+                del self._created[(job_id, uid)]
+            self._release(entry)
+
+        self._unlink([entry])
+
+    def _release(self, entry: _Entry) -> None:
+        # Called with the lock held, once the checkpoint is removed from the index
+        self._total_bytes -= entry.size
+        if entry.data is not None:
+            self._memory_bytes -= entry.size
+            entry.data = None
+
+    def _unlink(self, entries: List[_Entry]) -> None:
+        for entry in entries:
+            entry.path.unlink(missing_ok=True)
+        # The directories of the UIDs, and then of the jobs, left empty
+        for parents in ({entry.path.parent for entry in entries}, {entry.path.parent.parent for entry in entries}):
+            for parent in parents:
+                try:
+                    parent.rmdir()
+                except OSError:
+                    # Other checkpoints remain
+                    pass
+
+    def touch(self, job_id: str) -> None:
+        r""" Record that a job is alive, e.g. on every request, which is not locked. """
+
+        self._last_seen[job_id] = time.monotonic()
+
+    def evict(self, keep_last: int = 0, job_quota_bytes: int = 0, job_ttl: float = 0,
+              policies: Optional[Dict[str, Tuple[int, int, float]]] = None) -> List[Tuple[str, str]]:
+        r""" Delete the generations which the eviction policies expire, and return their job IDs and UIDs.
+
+        Generations are grouped into series by their UIDs without the counters, e.g. the generations saved by a
+        checkpoint manager, and generations being uploaded are not deleted. The lock is only held while the
+        generations are picked and removed from the index, and the files are deleted without it.
+
+        :param keep_last: The number of the most recent generations kept in every series, or 0 to keep all of them
+        :param job_quota_bytes: The bytes of checkpoints of a job, beyond which its oldest generations are deleted,
+            except the most recent one of every series, or 0 for no quota
+        :param job_ttl: The seconds after which a job without requests is deemed finished, and all its generations are
+            deleted, or 0 to keep them
+        :param policies: The ``(keep_last, job_quota_bytes, job_ttl)`` of the jobs with policies of their own, which
+            override the ones above
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            # job ID -> (creation order, UID, bytes) of its generations
+            jobs: Dict[str, List[Tuple[int, str, int]]] = {}
+            for (job_id, uid), generation in self._generations.items():
+                size = sum(entry.size for entry in generation.values())
+                jobs.setdefault(job_id, []).append((self._created[(job_id, uid)], uid, size))
+            uploading = {(job_id, uid) for job_id, uid, _ in self._uploads}
+
+        policies = policies or {}
+        victims: List[Tuple[str, str]] = []
+        for job_id, generations in jobs.items():
+            job_keep_last, job_quota, ttl = policies.get(job_id, (keep_last, job_quota_bytes, job_ttl))
+            # Jobs are deemed alive from when the store starts, so that they can come back after a restart
+            last_seen = self._last_seen.setdefault(job_id, now)
+            if ttl > 0 and now - last_seen > ttl:
+                expired = {uid for _, uid, _ in generations}
+            else:
+                generations.sort()
+                series: Dict[str, List[str]] = {}
+                for _, uid, _ in generations:
+                    series.setdefault(_series(uid), []).append(uid)
+
+                expired = set()
+                if job_keep_last > 0:
+                    for uids in series.values():
+                        expired.update(uids[:-job_keep_last])
+                if job_quota > 0:
+                    latest = {uids[-1] for uids in series.values()}
+                    total = sum(size for _, uid, size in generations if uid not in expired)
+                    for _, uid, size in generations:
+                        if total <= job_quota:
+                            break
+                        if uid not in expired and uid not in latest:
+                            expired.add(uid)
+                            total -= size
+
+            victims.extend((job_id, uid) for _, uid, _ in generations
+                           if uid in expired and (job_id, uid) not in uploading)
+
+        evicted: List[Tuple[str, str]] = []
+        entries: List[_Entry] = []
+        with self._lock:
+            uploading = {(job_id, uid) for job_id, uid, _ in self._uploads}
+            for key in victims:
+                # The generation may have been deleted, or started being uploaded to, meanwhile
+                if key not in self._generations or key in uploading:
+                    continue
+                generation = self._generations.pop(key)
+                del self._created[key]
+                for entry in generation.values():
+                    self._release(entry)
+                    entries.append(entry)
+                evicted.append(key)
+            for job_id in {job_id for job_id, _ in evicted} - {job_id for job_id, _ in self._generations}:
+                self._last_seen.pop(job_id, None)
+
+        self._unlink(entries)
+        return evicted
+
+    def close(self) -> None:
+        r""" Spill every checkpoint held in memory, so that it survives a restart. """
+
+        budget = self._memory_budget
+        self._memory_budget = 0
+        try:
+            self._spill()
+        finally:
+            self._memory_budget = budget
@@ -0,0 +1,52 @@
+import socket
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+import zmq
+
+# The service runs from src, where its packages are imported as top-level packages
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from ckpt_server.main import CheckpointService  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def metrics_port() -> int:
+    r""" The port the service serves metrics on, which tests parametrize to serve them. """
+
+    return 0
+
+
+@pytest.fixture
+def service(tmp_path, metrics_port):
+    r""" A checkpoint service running in threads of the test process, which evicts only when the test asks it to. """
+
+    port = free_port()
+    service = CheckpointService(str(tmp_path), 2, context=zmq.Context(), port=port, metrics_port=metrics_port,
+                                eviction_interval=3600)
+    service.endpoint = f'tcp://localhost:{port}'
+    thread = threading.Thread(target=service.launch)
+    thread.daemon = True
+    thread.start()
+    yield service
+    service.store.close()
+
+
+@pytest.fixture
+def client(service):
+    r""" A socket sending requests to the service one at a time. """
+
+    with zmq.Context() as context, context.socket(zmq.REQ) as socket:
+        # Requests the service does not answer fail the test instead of hanging it
+        socket.setsockopt(zmq.RCVTIMEO, 10000)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(service.endpoint)
+        yield socket
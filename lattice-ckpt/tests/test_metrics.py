@@ -0,0 +1,74 @@
+import threading
+import time
+from urllib.request import urlopen
+
+import pytest
+import zmq
+from prometheus_client.parser import text_string_to_metric_families
+
+from conftest import free_port
+from utils.utils import CheckpointMessage, RequestType
+
+METRICS_PORT = free_port()
+
+
+def _scrape(port: int):
+    with urlopen(f'http://localhost:{port}/metrics', timeout=10) as response:
+        text = response.read().decode()
+    return {(s.name, tuple(sorted(s.labels.items()))): s.value
+            for family in text_string_to_metric_families(text) for s in family.samples}
+
+
+def _wait_for(condition, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize('metrics_port', [METRICS_PORT])
+def test_metrics(service, client):
+    for i in range(3):
+        CheckpointMessage(RequestType.SAVE, 'job', f'A:m_{i:06d}', 'o', b'x').send(client)
+        CheckpointMessage.recv(client)
+
+    # Requests are counted once answered, and every type is exposed before it is requested
+    samples = _scrape(METRICS_PORT)
+    assert samples[('lattice_ckpt_requests_total', (('outcome', 'ok'), ('type', 'SAVE')))] == 3
+    assert samples[('lattice_ckpt_requests_total', (('outcome', 'ok'), ('type', 'LOAD')))] == 0
+    assert samples[('lattice_ckpt_request_duration_seconds_count', (('type', 'SAVE'),))] == 3
+    assert samples[('lattice_ckpt_job_generations', (('job', 'job'),))] == 3
+    assert samples[('lattice_ckpt_job_bytes', (('job', 'job'),))] == 3
+    assert samples[('lattice_ckpt_workers', ())] == 2
+
+    # Both workers are blocked, so the third of three concurrent requests is queued until one of them is done
+    unblocked = threading.Event()
+    handle_request = service._handle_request
+
+    def blocked(socket, parsed_msg):
+        unblocked.wait()
+        handle_request(socket, parsed_msg)
+
+    service._handle_request = blocked
+    with zmq.Context() as context:
+        sockets = [context.socket(zmq.REQ) for _ in range(3)]
+        try:
+            for s in sockets:
+                s.setsockopt(zmq.RCVTIMEO, 10000)
+                s.connect(service.endpoint)
+                CheckpointMessage(RequestType.EXISTS, 'job', 'A:m_000000', 'o', b'').send(s)
+
+            _wait_for(lambda: _scrape(METRICS_PORT)[('lattice_ckpt_queued_requests', ())] == 1)
+            assert _scrape(METRICS_PORT)[('lattice_ckpt_workers_busy', ())] == 2
+
+            unblocked.set()
+            for s in sockets:
+                assert CheckpointMessage.recv(s).req_type == RequestType.EXISTS
+        finally:
+            for s in sockets:
+                s.close(linger=0)
+
+    _wait_for(lambda: _scrape(METRICS_PORT)[('lattice_ckpt_queued_requests', ())] == 0)
+    samples = _scrape(METRICS_PORT)
+    assert samples[('lattice_ckpt_requests_total', (('outcome', 'ok'), ('type', 'EXISTS')))] == 3
+    assert samples[('lattice_ckpt_workers_busy', ())] == 0
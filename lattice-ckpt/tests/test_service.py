@@ -0,0 +1,99 @@
+import time
+
+from utils.utils import CheckpointMessage, RequestType
+
+
+def _request(client, req_type: RequestType, uid: str = '', ckpt_name: str = '', body=b'', job_id: str = 'job',
+             attachments=()):
+    CheckpointMessage(req_type, job_id, uid, ckpt_name, body, attachments=attachments).send(client)
+    return CheckpointMessage.recv(client)
+
+
+def test_save_many_and_load_many(service, client):
+    response = _request(client, RequestType.SAVE_MANY, 'A:m_000000', body={'names': ['a', 'b', 'c']},
+                        attachments=[b'aa', b'bbbb', b'c' * 10])
+    assert response.req_type == RequestType.SAVE_MANY and bytes(response.body) == b'ACK'
+    assert service.store.list('job') == {'A:m_000000': ['a', 'b', 'c']}
+
+    # The first chunks are answered until they add up to the maximum bytes, and the missing names are told apart
+    # from the ones which did not fit
+    response = _request(client, RequestType.LOAD_MANY, 'A:m_000000',
+                        body={'names': ['a', 'missing', 'b', 'c'], 'chunk_size': 3, 'max_bytes': 5})
+    assert response.req_type == RequestType.LOAD_MANY
+    assert response.body == {'names': ['a', 'b'], 'missing': ['missing']}
+    assert [bytes(chunk) for chunk in response.attachments] == [b'aa', b'bbb']
+
+    # At least one chunk is answered however large it is
+    response = _request(client, RequestType.LOAD_MANY, 'A:m_000000',
+                        body={'names': ['c', 'a'], 'chunk_size': 100, 'max_bytes': 1})
+    assert response.body == {'names': ['c'], 'missing': []}
+    assert [bytes(chunk) for chunk in response.attachments] == [b'c' * 10]
+
+
+def test_save_many_is_all_or_nothing(service, client, monkeypatch):
+    monkeypatch.setattr(service.store, '_max_checkpoint_bytes', 4)
+
+    # A checkpoint exceeding a limit fails the request, and none of the checkpoints is stored
+    response = _request(client, RequestType.SAVE_MANY, 'A:m_000000', body={'names': ['a', 'b']},
+                        attachments=[b'aa', b'b' * 5])
+    assert response.req_type == RequestType.ERROR
+    assert service.store.list('job') == {} and service.store.total_bytes == 0
+
+    # So does a request whose names do not match its checkpoints
+    response = _request(client, RequestType.SAVE_MANY, 'A:m_000000', body={'names': ['a', 'b']},
+                        attachments=[b'aa'])
+    assert response.req_type == RequestType.ERROR
+    assert service.store.list('job') == {}
+
+    # And one with a stale fencing token
+    holder = {'holder': 'rank0'}
+    stale = _request(client, RequestType.ACQUIRE, 'A:m_000000', 'lease', holder).body['token']
+    _request(client, RequestType.RELEASE, 'A:m_000000', 'lease', {'token': stale})
+    token = _request(client, RequestType.ACQUIRE, 'A:m_000000', 'lease', holder).body['token']
+    response = _request(client, RequestType.SAVE_MANY, 'A:m_000000', body={'names': ['a'], 'token': token},
+                        attachments=[b'aa'])
+    assert bytes(response.body) == b'ACK'
+    response = _request(client, RequestType.SAVE_MANY, 'A:m_000000', body={'names': ['b'], 'token': stale},
+                        attachments=[b'bb'])
+    assert response.req_type == RequestType.ERROR
+    assert service.store.list('job') == {'A:m_000000': ['a']}
+
+
+def test_requests_scoped_to_uid(service, client):
+    for uid in ('A:m_000000', 'A:m_000001', 'B:m_000000'):
+        _request(client, RequestType.SAVE, uid, 'o', b'x')
+    _request(client, RequestType.SAVE, 'A:m_000000', 'o', b'x', job_id='other')
+
+    # Requests with a UID only list its checkpoints, and requests without one list the whole job
+    assert _request(client, RequestType.LIST, 'A:m_000001').body == {'A:m_000001': ['o']}
+    assert _request(client, RequestType.LIST, 'A:m_000002').body == {}
+    assert sorted(_request(client, RequestType.LIST).body) == ['A:m_000000', 'A:m_000001', 'B:m_000000']
+    assert list(_request(client, RequestType.LIST, job_id='other').body) == ['A:m_000000']
+
+    assert _request(client, RequestType.EXISTS, 'A:m_000001', 'o').body is True
+    assert _request(client, RequestType.EXISTS, 'A:m_000001', 'p').body is False
+    assert _request(client, RequestType.EXISTS, 'A:m_000002', 'o').body is False
+    assert _request(client, RequestType.EXISTS, 'A:m_000001', 'o', job_id='missing').body is False
+
+
+def test_policy_of_job(service, client):
+    service.keep_last = 2
+    for job_id in ('job', 'other'):
+        for i in range(3):
+            _request(client, RequestType.SAVE, f'A:m_{i:06d}', 'o', b'x', job_id=job_id)
+
+    # The policies a job leaves out are the ones of the service
+    response = _request(client, RequestType.POLICY, body={'keep_last': 1})
+    assert response.req_type == RequestType.POLICY and bytes(response.body) == b'ACK'
+    assert service.policies == {'job': (1, 0, 0.0)}
+
+    service.evict()
+    assert list(service.store.list('job')) == ['A:m_000002']
+    assert sorted(service.store.list('other')) == ['A:m_000001', 'A:m_000002']
+
+    # The policy of a job is forgotten with its last generation
+    _request(client, RequestType.POLICY, body={'job_ttl': 0.001})
+    time.sleep(0.01)
+    service.evict()
+    assert service.store.list('job') == {}
+    assert 'job' not in service.policies
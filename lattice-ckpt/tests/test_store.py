@@ -0,0 +1,186 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from ckpt_server.store import CheckpointStore, StoreLimitExceeded
+
+
+def _store(root, memory_budget=1 << 20, max_total_bytes=1 << 20, max_checkpoint_bytes=1 << 20) -> CheckpointStore:
+    return CheckpointStore(str(root), memory_budget, max_total_bytes, max_checkpoint_bytes)
+
+
+def _save(store: CheckpointStore, job_id: str, series: str, count: int, size: int = 4) -> None:
+    for i in range(count):
+        store.put(job_id, f'{series}_{i:06d}', 'o', memoryview(b'x' * size))
+
+
+def test_spill_beyond_memory_budget(tmp_path):
+    store = _store(tmp_path, memory_budget=10)
+    for i in range(3):
+        store.put('job', f'A:m_{i:06d}', 'o', memoryview(bytes([i]) * 4))
+
+    # The generations used least recently are spilled, and read from their files
+    assert store.memory_bytes == 8 and store.total_bytes == 12
+    assert (tmp_path / 'job' / 'A:m_000000' / 'o').read_bytes() == b'\x00' * 4
+    assert not (tmp_path / 'job' / 'A:m_000002' / 'o').exists()
+    for i in range(3):
+        assert bytes(store.read('job', f'A:m_{i:06d}', 'o', 1, 2)) == bytes([i]) * 2
+
+    # Reading a generation makes it the most recently used one
+    store.read('job', 'A:m_000001', 'o')
+    store.put('job', 'A:m_000003', 'o', memoryview(b'x' * 4))
+    assert (tmp_path / 'job' / 'A:m_000002' / 'o').exists()
+    assert not (tmp_path / 'job' / 'A:m_000001' / 'o').exists()
+    assert store.memory_bytes == 8
+
+
+def test_rebuild_index_after_restart(tmp_path):
+    store = _store(tmp_path)
+    store.put('job', 'A:m_000000', 'o1', memoryview(b'x' * 4))
+    store.put('job', 'A:m_000000', 'o2', memoryview(b'y' * 2))
+    store.put('other', 'A:m_000000', 'o1', memoryview(b'z' * 3))
+    store.write_chunk('job', 'A:m_000001', 'large', 0, memoryview(b'w' * 4))
+    store.close()
+    # A spill interrupted by the restart
+    (tmp_path / 'job' / 'A:m_000000' / 'o3.tmp').write_bytes(b'x')
+
+    store = _store(tmp_path)
+    assert store.list('job') == {'A:m_000000': ['o1', 'o2']}
+    assert bytes(store.read('other', 'A:m_000000', 'o1')) == b'zzz'
+    assert store.total_bytes == 9 and store.memory_bytes == 0
+    assert not list(tmp_path.glob('*/*/*.partial')) and not list(tmp_path.glob('*/*/*.tmp'))
+
+
+def test_limits(tmp_path):
+    store = _store(tmp_path, max_total_bytes=10, max_checkpoint_bytes=6)
+    with pytest.raises(StoreLimitExceeded):
+        store.put('job', 'A:m_000000', 'o', memoryview(b'x' * 7))
+    store.put('job', 'A:m_000000', 'o', memoryview(b'x' * 6))
+    with pytest.raises(StoreLimitExceeded):
+        store.put('job', 'A:m_000001', 'o', memoryview(b'x' * 5))
+
+    # Checkpoints replaced only count the bytes they add
+    store.put('job', 'A:m_000000', 'o', memoryview(b'x' * 5))
+    assert store.total_bytes == 5
+
+    # Checkpoints saved at once are saved all or none
+    with pytest.raises(StoreLimitExceeded):
+        store.put_many('job', 'A:m_000001', [('o1', memoryview(b'x' * 4)), ('o2', memoryview(b'x' * 4))])
+    assert store.list('job') == {'A:m_000000': ['o']}
+
+    # Checkpoints streamed in chunks are discarded once they exceed a limit
+    store.write_chunk('job', 'A:m_000001', 'large', 0, memoryview(b'x' * 4))
+    with pytest.raises(StoreLimitExceeded):
+        store.write_chunk('job', 'A:m_000001', 'large', 1, memoryview(b'x' * 4))
+    assert store.total_bytes == 5
+    with pytest.raises(ValueError):
+        store.commit('job', 'A:m_000001', 'large', 2)
+
+
+def test_chunks_out_of_order(tmp_path):
+    store = _store(tmp_path)
+    chunks = [memoryview(bytes([i]) * 4) for i in range(4)]
+    for seq in (2, 1, 3, 0):
+        store.write_chunk('job', 'A:m_000000', 'large', seq, chunks[seq])
+
+    store.commit('job', 'A:m_000000', 'large', 4)
+    assert bytes(store.read('job', 'A:m_000000', 'large')) == b''.join(chunks)
+    assert store.total_bytes == 16 and store._buffered_bytes == 0
+
+
+def test_retransmitted_chunks_are_counted_once(tmp_path):
+    store = _store(tmp_path, max_total_bytes=16)
+    # Chunks already written, and chunks buffered ahead
+    for seq in (0, 1, 1, 3, 3, 2, 1):
+        store.write_chunk('job', 'A:m_000000', 'large', seq, memoryview(bytes([seq]) * 4))
+    assert store.total_bytes == 16
+
+    store.commit('job', 'A:m_000000', 'large', 4)
+    assert bytes(store.read('job', 'A:m_000000', 'large')) == b''.join(bytes([i]) * 4 for i in range(4))
+    assert store.total_bytes == 16 and store._buffered_bytes == 0
+
+
+def test_commit_and_abort(tmp_path):
+    store = _store(tmp_path)
+
+    # Checkpoints missing chunks are not committed
+    store.write_chunk('job', 'A:m_000000', 'large', 0, memoryview(b'x' * 4))
+    store.write_chunk('job', 'A:m_000000', 'large', 2, memoryview(b'x' * 4))
+    with pytest.raises(ValueError):
+        store.commit('job', 'A:m_000000', 'large', 3)
+    assert not store.exists('job', 'A:m_000000', 'large')
+    assert store.total_bytes == 0 and store._buffered_bytes == 0
+
+    store.write_chunk('job', 'A:m_000000', 'large', 0, memoryview(b'x' * 4))
+    store.abort('job', 'A:m_000000', 'large')
+    assert store.total_bytes == 0 and not list(tmp_path.glob('*/*/*'))
+    with pytest.raises(ValueError):
+        store.commit('job', 'A:m_000000', 'large', 1)
+
+    # A retried save starts over
+    store.write_chunk('job', 'A:m_000000', 'large', 0, memoryview(b'x' * 4))
+    store.write_chunk('job', 'A:m_000000', 'large', 1, memoryview(b'x' * 4))
+    store.write_chunk('job', 'A:m_000000', 'large', 0, memoryview(b'y' * 4))
+    store.commit('job', 'A:m_000000', 'large', 1)
+    assert bytes(store.read('job', 'A:m_000000', 'large')) == b'yyyy'
+    assert store.total_bytes == 4
+
+
+def test_evict_keeps_last_of_every_series(tmp_path):
+    store = _store(tmp_path)
+    _save(store, 'job', 'A:m', 4)
+    _save(store, 'job', 'B:m', 2)
+
+    evicted = store.evict(keep_last=2)
+    assert sorted(evicted) == [('job', 'A:m_000000'), ('job', 'A:m_000001')]
+    assert sorted(store.list('job')) == ['A:m_000002', 'A:m_000003', 'B:m_000000', 'B:m_000001']
+
+
+def test_evict_spares_latest_of_every_series_beyond_quota(tmp_path):
+    store = _store(tmp_path)
+    _save(store, 'job', 'A:m', 3, size=10)
+    _save(store, 'job', 'B:m', 2, size=10)
+
+    # The oldest generations are evicted until the job fits in its quota, except the latest one of every series
+    assert sorted(store.evict(job_quota_bytes=35)) == [('job', 'A:m_000000'), ('job', 'A:m_000001')]
+    assert store.evict(job_quota_bytes=5) == [('job', 'B:m_000000')]
+    assert sorted(store.list('job')) == ['A:m_000002', 'B:m_000001']
+
+
+def test_evict_expires_jobs_without_requests(tmp_path):
+    store = _store(tmp_path)
+    _save(store, 'job', 'A:m', 2)
+    _save(store, 'alive', 'A:m', 2)
+    store.touch('job')
+    store.touch('alive')
+    assert store.evict(job_ttl=60) == []
+
+    now = time.monotonic()
+    store.touch('alive')
+    with patch('time.monotonic', return_value=now + 120):
+        store.touch('alive')
+        assert sorted(store.evict(job_ttl=60)) == [('job', 'A:m_000000'), ('job', 'A:m_000001')]
+    assert store.list('job') == {}
+    assert len(store.list('alive')) == 2
+
+
+def test_evict_applies_policies_of_jobs(tmp_path):
+    store = _store(tmp_path)
+    _save(store, 'job', 'A:m', 3)
+    _save(store, 'other', 'A:m', 3)
+
+    evicted = store.evict(keep_last=2, policies={'job': (1, 0, 0)})
+    assert sorted(evicted) == [('job', 'A:m_000000'), ('job', 'A:m_000001'), ('other', 'A:m_000000')]
+
+
+def test_evict_skips_generations_being_uploaded(tmp_path):
+    store = _store(tmp_path)
+    _save(store, 'job', 'A:m', 3)
+    store.write_chunk('job', 'A:m_000000', 'large', 0, memoryview(b'x' * 4))
+
+    assert store.evict(keep_last=1) == [('job', 'A:m_000001')]
+    store.commit('job', 'A:m_000000', 'large', 1)
+    assert store.evict(keep_last=1) == [('job', 'A:m_000000')]
+    with pytest.raises(KeyError):
+        store.read('job', 'A:m_000000', 'large')